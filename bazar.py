@@ -1,576 +1,3047 @@
-# ==============================================================================
-# 1. IMPORTS DE LIBRERÍAS
-# ==============================================================================
-import tkinter
-from tkinter import messagebox, ttk
-import customtkinter as ctk
-import mysql.connector
-from datetime import datetime
-import locale
-from PIL import Image
-import os
-import bcrypt
-import random
-
-# ==============================================================================
-# 2. CONFIGURACIÓN GLOBAL Y VARIABLES
-# ==============================================================================
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
-
-try:
-    locale.setlocale(locale.LC_ALL, 'es_CL.UTF-8') 
-except locale.Error:
-    print("ADVERTENCIA: Locale 'es_CL.UTF-8' no disponible.")
-    try: locale.setlocale(locale.LC_ALL, '')
-    except locale.Error: print("No se pudo establecer ningún locale.")
-
-current_user = {"usuario": None, "rol": None}
-TIEMPO_INACTIVIDAD = 600000 
-temporizador_id = None
-TASA_IVA = 0.19 # Tasa del 19% para el IVA
-
-# ==============================================================================
-# 3. FUNCIONES DE UTILIDAD Y BASE DE DATOS
-# ==============================================================================
-def formatear_a_clp(valor):
-    if valor is None: return "CLP$ 0"
-    try:
-        valor_entero = int(round(float(valor)))
-        return f"CLP$ {locale.format_string('%d', valor_entero, grouping=True)}"
-    except (ValueError, TypeError): return "CLP$ 0"
-
-def conectar_bd():
-    try:
-        return mysql.connector.connect(host="localhost", user="bazar_user", password="123456", database="bazar")
-    except mysql.connector.Error as err:
-        messagebox.showerror("Error de Conexión", f"No se pudo conectar: {err}"); root.quit(); return None
-
-def generar_codigo_producto(nombre):
-    prefijo = ''.join(filter(str.isalnum, nombre[:3].upper()))
-    sufijo = ''.join(random.choices('0123456789', k=4))
-    return f"{prefijo}-{sufijo}"
-
-def iniciar_bd():
-    conn = conectar_bd()
-    if not conn: return
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS usuarios (id INT AUTO_INCREMENT PRIMARY KEY, usuario VARCHAR(50) UNIQUE NOT NULL, clave VARCHAR(255) NOT NULL, rol ENUM('vendedor', 'admin') NOT NULL)")
-    cursor.execute("CREATE TABLE IF NOT EXISTS productos (id INT AUTO_INCREMENT PRIMARY KEY, codigo VARCHAR(20) UNIQUE, nombre VARCHAR(100) UNIQUE NOT NULL, precio DECIMAL(10,2) NOT NULL, stock INT NOT NULL, estado ENUM('activo', 'inactivo') NOT NULL DEFAULT 'activo')")
-    
-    # ESTRUCTURA DE BOLETAS MODIFICADA PARA INCLUIR IVA
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS boletas (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            vendedor_usuario VARCHAR(50),
-            neto DECIMAL(10,2) NOT NULL,
-            iva DECIMAL(10,2) NOT NULL,
-            total_boleta DECIMAL(10,2) NOT NULL,
-            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            tipo_documento ENUM('Boleta', 'Factura') NOT NULL DEFAULT 'Boleta',
-            cliente_rut VARCHAR(12),
-            cliente_nombre VARCHAR(100)
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS detalle_ventas (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            boleta_id INT NOT NULL,
-            producto_id INT NOT NULL,
-            cantidad INT NOT NULL,
-            precio_unitario DECIMAL(10,2) NOT NULL,
-            subtotal DECIMAL(10,2) NOT NULL,
-            FOREIGN KEY (boleta_id) REFERENCES boletas(id) ON DELETE CASCADE,
-            FOREIGN KEY (producto_id) REFERENCES productos(id)
-        )
-    """)
-    
-    cursor.execute("SHOW COLUMNS FROM productos LIKE 'estado'");
-    if not cursor.fetchone(): cursor.execute("ALTER TABLE productos ADD COLUMN estado ENUM('activo', 'inactivo') NOT NULL DEFAULT 'activo'")
-    
-    cursor.execute("SHOW COLUMNS FROM productos LIKE 'codigo'");
-    if not cursor.fetchone(): cursor.execute("ALTER TABLE productos ADD COLUMN codigo VARCHAR(20) UNIQUE AFTER id")
-
-    cursor.execute("SELECT id, nombre FROM productos WHERE codigo IS NULL OR codigo = ''")
-    productos_sin_codigo = cursor.fetchall()
-    if productos_sin_codigo:
-        print(f"Asignando códigos a {len(productos_sin_codigo)} productos existentes...")
-        for prod_id, prod_nombre in productos_sin_codigo:
-            codigo_unico_encontrado = False
-            while not codigo_unico_encontrado:
-                nuevo_codigo = generar_codigo_producto(prod_nombre)
-                cursor.execute("SELECT id FROM productos WHERE codigo = %s", (nuevo_codigo,))
-                if cursor.fetchone() is None:
-                    cursor.execute("UPDATE productos SET codigo = %s WHERE id = %s", (nuevo_codigo, prod_id))
-                    codigo_unico_encontrado = True
-    
-    cursor.execute("SELECT * FROM usuarios WHERE usuario = 'admin'")
-    if cursor.fetchone() is None:
-        clave_admin_texto = 'admin'; hashed_password = bcrypt.hashpw(clave_admin_texto.encode('utf-8'), bcrypt.gensalt())
-        cursor.execute("INSERT INTO usuarios (usuario, clave, rol) VALUES (%s, %s, %s)", ('admin', hashed_password.decode('utf-8'), 'admin'))
-        
-    conn.commit(); conn.close()
-
-
-# ==============================================================================
-# 4. ARQUITECTURA DE LA INTERFAZ Y SEGURIDAD
-# ==============================================================================
-def limpiar_frame(frame):
-    for widget in frame.winfo_children(): widget.destroy()
-
-def configurar_estilo_treeview():
-    style = ttk.Style(); style.theme_use("default")
-    style.configure("Treeview", background="#2a2d2e", foreground="white", rowheight=25, fieldbackground="#343638", bordercolor="#343638", borderwidth=0)
-    style.map('Treeview', background=[('selected', '#22559b')]); style.configure("Treeview.Heading", background="#565b5e", foreground="white", relief="flat", font=('Roboto', 10, 'bold')); style.map("Treeview.Heading", background=[('active', '#3484F0')])
-
-def cargar_icono(nombre_archivo, size=(24, 24)):
-    try:
-        script_dir = os.path.dirname(__file__)
-        ruta_completa = os.path.join(script_dir, "icons", nombre_archivo)
-        return ctk.CTkImage(Image.open(ruta_completa), size=size)
-    except Exception as e:
-        print(f"ADVERTENCIA: No se pudo cargar el ícono {nombre_archivo}. Error: {e}"); return None
-
-def cerrar_sesion_por_inactividad():
-    global temporizador_id
-    if current_user["usuario"] is not None:
-        messagebox.showwarning("Sesión Expirada", "Tu sesión ha expirado por inactividad.")
-        temporizador_id = None
-        mostrar_vista("login")
-
-def reiniciar_temporizador(event=None):
-    global temporizador_id
-    if temporizador_id is not None: root.after_cancel(temporizador_id)
-    temporizador_id = root.after(TIEMPO_INACTIVIDAD, cerrar_sesion_por_inactividad)
-
-def iniciar_temporizador_inactividad():
-    reiniciar_temporizador()
-    root.bind_all("<Key>", reiniciar_temporizador)
-    root.bind_all("<Button-1>", reiniciar_temporizador)
-
-def detener_temporizador_inactividad():
-    global temporizador_id
-    if temporizador_id is not None:
-        root.after_cancel(temporizador_id)
-        temporizador_id = None
-    root.unbind_all("<Key>")
-    root.unbind_all("<Button-1>")
-
-def mostrar_vista(nombre_vista, **kwargs):
-    limpiar_frame(content_frame)
-    vistas = {"login": mostrar_vista_login, "dashboard": mostrar_vista_dashboard, "productos": mostrar_vista_productos, "formulario_producto": mostrar_vista_formulario_producto, "usuarios": mostrar_vista_usuarios, "venta": mostrar_vista_venta, "historial": mostrar_vista_historial, "detalle_boleta": mostrar_vista_detalle_boleta}
-    funcion_vista = vistas.get(nombre_vista)
-    if funcion_vista: funcion_vista(content_frame, **kwargs)
-
-def _crear_header(parent_frame, titulo, vista_volver):
-    header_frame = ctk.CTkFrame(master=parent_frame, fg_color="transparent"); header_frame.pack(fill="x", pady=(0, 20))
-    ctk.CTkLabel(master=header_frame, text=titulo, font=("Roboto", 24, "bold")).pack(side="left")
-    ctk.CTkButton(master=header_frame, text="← Volver", width=120, command=lambda: mostrar_vista(vista_volver)).pack(side="right")
-
-# ==============================================================================
-# 5. CONSTRUCTORES DE VISTAS PRINCIPALES
-# ==============================================================================
-
-def mostrar_vista_login(frame, **kwargs):
-    detener_temporizador_inactividad(); root.geometry("400x500")
-    login_frame = ctk.CTkFrame(master=frame, corner_radius=15, fg_color=("#dbdbdb", "#2b2b2b")); login_frame.place(relx=0.5, rely=0.5, anchor="center")
-    ctk.CTkLabel(master=login_frame, text="Sistema Bazar", font=("Roboto", 28, "bold")).pack(pady=(40, 20))
-    user_icon = cargar_icono("login-user.png", size=(20, 20)); pass_icon = cargar_icono("login-pass.png", size=(20, 20))
-    user_frame = ctk.CTkFrame(master=login_frame, fg_color="transparent"); user_frame.pack(pady=10, padx=30, fill="x")
-    if user_icon: ctk.CTkLabel(master=user_frame, text="", image=user_icon).pack(side="left", padx=(0, 10))
-    entry_usuario = ctk.CTkEntry(master=user_frame, placeholder_text="Usuario", width=220, height=40); entry_usuario.pack(side="left", fill="x", expand=True)
-    pass_frame = ctk.CTkFrame(master=login_frame, fg_color="transparent"); pass_frame.pack(pady=10, padx=30, fill="x")
-    if pass_icon: ctk.CTkLabel(master=pass_frame, text="", image=pass_icon).pack(side="left", padx=(0, 10))
-    entry_clave = ctk.CTkEntry(master=pass_frame, placeholder_text="Contraseña", show="*", width=220, height=40); entry_clave.pack(side="left", fill="x", expand=True)
-    def validar_login(usuario, clave):
-        if not usuario or not clave: messagebox.showwarning("Campos Vacíos", "Por favor, ingrese usuario y contraseña."); return
-        conn = conectar_bd();
-        if not conn: return
-        cursor = conn.cursor(); cursor.execute("SELECT clave, rol FROM usuarios WHERE usuario=%s", (usuario,)); resultado = cursor.fetchone(); conn.close()
-        if resultado:
-            hashed_password_db = resultado[0].encode('utf-8')
-            if bcrypt.checkpw(clave.encode('utf-8'), hashed_password_db):
-                current_user["usuario"], current_user["rol"] = usuario, resultado[1]
-                iniciar_temporizador_inactividad(); root.geometry("800x600"); mostrar_vista("dashboard")
-            else: messagebox.showerror("Error de Acceso", "Usuario o contraseña incorrectos.")
-        else: messagebox.showerror("Error de Acceso", "Usuario o contraseña incorrectos.")
-    btn_ingresar = ctk.CTkButton(master=login_frame, text="Ingresar", width=220, height=40, command=lambda: validar_login(entry_usuario.get(), entry_clave.get())); btn_ingresar.pack(pady=(20, 40))
-
-def mostrar_vista_dashboard(frame, **kwargs):
-    root.geometry("800x600"); frame.pack(pady=20, padx=60, fill="both", expand=True)
-    header_frame = ctk.CTkFrame(master=frame, fg_color="transparent"); header_frame.pack(fill="x", pady=(0, 20))
-    ctk.CTkLabel(master=header_frame, text=f"Bienvenido, {current_user['rol'].capitalize()}", font=("Roboto", 24, "bold")).pack(side="left")
-    logout_icon = cargar_icono("salir.png", size=(20, 20))
-    ctk.CTkButton(master=header_frame, text="Cerrar Sesión", width=140, image=logout_icon, compound="left", command=lambda: (detener_temporizador_inactividad(), mostrar_vista("login")), fg_color="#D32F2F", hover_color="#B71C1C").pack(side="right")
-    
-    productos_icon = cargar_icono("products.png", size=(48, 48)); usuarios_icon = cargar_icono("users.png", size=(48, 48)); historial_icon = cargar_icono("history.png", size=(48, 48)); venta_icon = cargar_icono("sales.png", size=(48, 48))
-    actions_grid = ctk.CTkFrame(master=frame, fg_color="transparent"); actions_grid.pack(fill="both", expand=True); actions_grid.grid_columnconfigure((0, 1), weight=1); actions_grid.grid_rowconfigure((0, 1), weight=1)
-    button_font = ("Roboto", 18, "bold")
-    
-    if current_user['rol'] == 'admin':
-        ctk.CTkButton(master=actions_grid, text="Gestionar Productos", height=120, font=button_font, image=productos_icon, compound="top", command=lambda: mostrar_vista("productos")).grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
-        ctk.CTkButton(master=actions_grid, text="Gestionar Usuarios", height=120, font=button_font, image=usuarios_icon, compound="top", command=lambda: mostrar_vista("usuarios")).grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
-        ctk.CTkButton(master=actions_grid, text="Historial de Ventas", height=120, font=button_font, image=historial_icon, compound="top", command=lambda: mostrar_vista("historial")).grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
-        ctk.CTkButton(master=actions_grid, text="Realizar Venta", height=120, font=button_font, image=venta_icon, compound="top", command=lambda: mostrar_vista("venta")).grid(row=1, column=1, padx=10, pady=10, sticky="nsew")
-    else:
-        ctk.CTkButton(master=actions_grid, text="Ver Productos", height=120, font=button_font, image=productos_icon, compound="top", command=lambda: mostrar_vista("productos")).grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
-        ctk.CTkButton(master=actions_grid, text="Realizar Venta", height=120, font=button_font, image=venta_icon, compound="top", command=lambda: mostrar_vista("venta")).grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
-        ctk.CTkButton(master=actions_grid, text="Mi Historial de Ventas", height=120, font=button_font, image=historial_icon, compound="top", command=lambda: mostrar_vista("historial")).grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
-
-def mostrar_vista_productos(frame, **kwargs):
-    root.geometry("1000x600"); frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Gestión de Productos", "dashboard")
-    producto_seleccionado_actual = {"id": None}
-    if current_user['rol'] == 'admin':
-        actions_frame = ctk.CTkFrame(master=frame); actions_frame.pack(fill="x", pady=10)
-        ctk.CTkButton(master=actions_frame, text="Agregar Nuevo Producto", command=lambda: mostrar_vista("formulario_producto", modo="agregar")).pack(side="left", padx=10)
-        btn_editar = ctk.CTkButton(master=actions_frame, text="Editar Producto", state="disabled"); btn_editar.pack(side="left", padx=10)
-        btn_archivar = ctk.CTkButton(master=actions_frame, text="Archivar Producto", state="disabled", fg_color="#E67E22", hover_color="#D35400"); btn_archivar.pack(side="left", padx=10)
-    tree_frame = ctk.CTkFrame(master=frame); tree_frame.pack(fill="both", expand=True, pady=10)
-    cols = ("Código", "Nombre", "Precio Neto", "Stock"); tree = ttk.Treeview(tree_frame, columns=cols, show='headings', style="Treeview")
-    for col in cols: tree.heading(col, text=col)
-    tree.column("Código", width=100, anchor='center'); tree.column("Nombre", width=300); tree.column("Precio Neto", width=120, anchor='e'); tree.column("Stock", width=100, anchor='center')
-    def cargar_productos():
-        for i in tree.get_children(): tree.delete(i)
-        conn = conectar_bd();
-        if not conn: return
-        cursor = conn.cursor(); cursor.execute("SELECT id, codigo, nombre, precio, stock FROM productos WHERE estado = 'activo' ORDER BY nombre ASC")
-        for producto in cursor.fetchall():
-            valores_formateados = (producto[1], producto[2], formatear_a_clp(producto[3]), producto[4]); tree.insert("", "end", values=valores_formateados, iid=producto[0])
-        conn.close()
-    cargar_productos(); tree.pack(fill='both', expand=True)
-    if current_user['rol'] == 'admin':
-        def on_select(event):
-            if tree.selection():
-                producto_seleccionado_actual["id"] = tree.selection()[0]
-                btn_editar.configure(state="normal"); btn_archivar.configure(state="normal")
-            else:
-                producto_seleccionado_actual["id"] = None; btn_editar.configure(state="disabled"); btn_archivar.configure(state="disabled")
-        def editar_seleccionado():
-            if producto_seleccionado_actual["id"] is not None: mostrar_vista("formulario_producto", modo="editar", producto_id=producto_seleccionado_actual["id"])
-        def archivar_seleccionado():
-            if producto_seleccionado_actual["id"] is not None:
-                conn=conectar_bd(); cursor=conn.cursor(); cursor.execute("SELECT nombre FROM productos WHERE id = %s", (producto_seleccionado_actual["id"],)); nombre_prod = cursor.fetchone()[0]; conn.close()
-                if messagebox.askyesno("Archivar Producto", f"¿Seguro que desea archivar '{nombre_prod}'?"):
-                    conn = conectar_bd(); cursor = conn.cursor(); cursor.execute("UPDATE productos SET estado = 'inactivo' WHERE id=%s", (producto_seleccionado_actual["id"],)); conn.commit(); conn.close()
-                    cargar_productos(); messagebox.showinfo("Éxito", "Producto archivado.")
-        tree.bind("<<TreeviewSelect>>", on_select); btn_editar.configure(command=editar_seleccionado); btn_archivar.configure(command=archivar_seleccionado)
-
-def mostrar_vista_formulario_producto(frame, modo, producto_id=None):
-    root.geometry("1100x600"); frame.pack(pady=20, padx=20, fill="both", expand=True); frame.grid_columnconfigure(0, weight=1); frame.grid_columnconfigure(1, weight=2); frame.grid_rowconfigure(0, weight=1)
-    form_frame = ctk.CTkFrame(master=frame); form_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10)); titulo = "Agregar Nuevo Producto" if modo == "agregar" else "Editar Producto"; ctk.CTkLabel(master=form_frame, text=titulo, font=("Roboto", 20, "bold")).pack(pady=20)
-    ctk.CTkLabel(master=form_frame, text="Código:", font=("Roboto", 14)).pack(anchor="w", padx=20); entry_codigo = ctk.CTkEntry(master=form_frame, height=35, state="disabled", placeholder_text="Se genera automáticamente"); entry_codigo.pack(fill="x", padx=20)
-    ctk.CTkLabel(master=form_frame, text="Nombre:").pack(anchor="w", padx=20); entry_nombre = ctk.CTkEntry(master=form_frame, height=35); entry_nombre.pack(fill="x", padx=20)
-    ctk.CTkLabel(master=form_frame, text="Precio Neto (sin IVA):").pack(anchor="w", padx=20); entry_precio = ctk.CTkEntry(master=form_frame, height=35); entry_precio.pack(fill="x", padx=20)
-    ctk.CTkLabel(master=form_frame, text="Stock:").pack(anchor="w", padx=20); entry_stock = ctk.CTkEntry(master=form_frame, height=35); entry_stock.pack(fill="x", padx=20)
-    list_frame = ctk.CTkFrame(master=frame); list_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0)); ctk.CTkLabel(master=list_frame, text="Productos Existentes", font=("Roboto", 16, "bold")).pack(pady=10)
-    cols = ("Código", "Nombre"); tree = ttk.Treeview(list_frame, columns=cols, show='headings', style="Treeview", height=15); tree.heading("Código", text="Código"); tree.heading("Nombre", text="Nombre"); tree.column("Código", width=80, anchor="center"); tree.pack(fill="both", expand=True, padx=10, pady=10)
-    def cargar_lista_productos():
-        for i in tree.get_children(): tree.delete(i)
-        conn = conectar_bd(); cursor = conn.cursor(); cursor.execute("SELECT codigo, nombre, id FROM productos WHERE estado = 'activo' ORDER BY nombre ASC");
-        for p in cursor.fetchall(): tree.insert("", "end", values=(p[0], p[1]), iid=p[2])
-        conn.close()
-    cargar_lista_productos()
-    def autocompletar_formulario_por_doble_clic(event):
-        if not tree.selection(): return
-        item_id = tree.selection()[0]
-        mostrar_vista("formulario_producto", modo="editar", producto_id=item_id)
-    tree.bind("<Double-1>", autocompletar_formulario_por_doble_clic)
-    def guardar_cambios(modo_guardar, p_id=None):
-        nombre, precio_str, stock_str = entry_nombre.get(), entry_precio.get(), entry_stock.get()
-        if not all([nombre, precio_str, stock_str]): messagebox.showerror("Error", "Todos los campos son obligatorios."); return
-        try: precio, stock = int(precio_str), int(stock_str)
-        except ValueError: messagebox.showerror("Error", "Precio y Stock deben ser números enteros."); return
-        conn = conectar_bd(); cursor = conn.cursor()
-        try:
-            if modo_guardar == "agregar":
-                codigo = generar_codigo_producto(nombre)
-                cursor.execute("INSERT INTO productos (codigo, nombre, precio, stock) VALUES (%s, %s, %s, %s)", (codigo, nombre, precio, stock)); messagebox.showinfo("Éxito", "Producto agregado.")
-            elif modo_guardar == "editar":
-                cursor.execute("UPDATE productos SET nombre=%s, precio=%s, stock=%s WHERE id=%s", (nombre, precio, stock, p_id)); messagebox.showinfo("Éxito", f"Producto actualizado.")
-            conn.commit(); cargar_lista_productos(); entry_nombre.delete(0, "end"); entry_precio.delete(0, "end"); entry_stock.delete(0, "end"); entry_codigo.configure(state="normal"); entry_codigo.delete(0, "end"); entry_codigo.configure(state="disabled", placeholder_text="Se genera automáticamente")
-            if modo_guardar == "editar": mostrar_vista("productos")
-        except mysql.connector.Error as err: messagebox.showerror("Error de DB", f"No se pudo guardar: {err}")
-        finally: conn.close()
-    action_form_frame = ctk.CTkFrame(master=form_frame, fg_color="transparent"); action_form_frame.pack(pady=20, fill="x", padx=20)
-    btn_guardar = ctk.CTkButton(master=action_form_frame, text="Guardar Cambios", height=40); btn_guardar.pack(side="left", expand=True, padx=(0,5)); ctk.CTkButton(master=action_form_frame, text="Volver", height=40, fg_color="gray", command=lambda: mostrar_vista("productos")).pack(side="left", expand=True, padx=(5,0))
-    if modo == "agregar": btn_guardar.configure(command=lambda: guardar_cambios("agregar"))
-    elif modo == "editar" and producto_id:
-        conn = conectar_bd(); cursor = conn.cursor(); cursor.execute("SELECT codigo, nombre, precio, stock FROM productos WHERE id=%s", (producto_id,)); data = cursor.fetchone(); conn.close()
-        if data:
-            entry_codigo.configure(state="normal"); entry_codigo.delete(0, "end"); entry_codigo.insert(0, data[0]); entry_codigo.configure(state="disabled")
-            entry_nombre.insert(0, data[1]); entry_precio.insert(0, str(int(round(float(data[2]))))); entry_stock.insert(0, str(data[3]))
-            btn_guardar.configure(command=lambda: guardar_cambios("editar", producto_id))
-
-def mostrar_vista_usuarios(frame, **kwargs):
-    root.geometry("1100x600"); frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Gestión de Usuarios", "dashboard")
-    main_content = ctk.CTkFrame(frame, fg_color="transparent"); main_content.pack(fill="both", expand=True); main_content.grid_columnconfigure(0, weight=2); main_content.grid_columnconfigure(1, weight=1); main_content.grid_rowconfigure(0, weight=1)
-    list_frame = ctk.CTkFrame(main_content); list_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10)); ctk.CTkLabel(list_frame, text="Usuarios Registrados", font=("Roboto", 16, "bold")).pack(pady=10)
-    cols = ("ID", "Usuario", "Rol"); tree = ttk.Treeview(list_frame, columns=cols, show='headings', style="Treeview"); tree.heading("ID", text="ID"); tree.heading("Usuario", text="Usuario"); tree.heading("Rol", text="Rol"); tree.column("ID", width=50); tree.pack(fill="both", expand=True, padx=10, pady=10)
-    form_frame = ctk.CTkFrame(main_content); form_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0)); form_title = ctk.CTkLabel(form_frame, text="Agregar/Editar Usuario", font=("Roboto", 16, "bold")); form_title.pack(pady=10)
-    id_value = ctk.CTkLabel(form_frame, text=""); ctk.CTkLabel(form_frame, text="Usuario:").pack(anchor="w", padx=20); entry_usuario = ctk.CTkEntry(form_frame, height=35); entry_usuario.pack(fill="x", padx=20); ctk.CTkLabel(form_frame, text="Clave (dejar en blanco para no cambiar):").pack(anchor="w", padx=20); entry_clave = ctk.CTkEntry(form_frame, height=35); entry_clave.pack(fill="x", padx=20); ctk.CTkLabel(form_frame, text="Rol:").pack(anchor="w", padx=20); combo_rol = ctk.CTkComboBox(form_frame, height=35, values=["vendedor", "admin"], state="readonly"); combo_rol.pack(fill="x", padx=20)
-    def limpiar_formulario():
-        id_value.configure(text=""); entry_usuario.delete(0, "end"); entry_clave.delete(0, "end"); combo_rol.set(""); form_title.configure(text="Agregar Usuario"); btn_guardar.configure(command=lambda: guardar_usuario("agregar")); btn_eliminar.configure(state="disabled")
-    def cargar_usuarios():
-        for i in tree.get_children(): tree.delete(i)
-        conn = conectar_bd(); cursor = conn.cursor(); cursor.execute("SELECT id, usuario, rol FROM usuarios");
-        for u in cursor.fetchall(): tree.insert("", "end", values=u)
-        conn.close(); limpiar_formulario()
-    def seleccionar_usuario(event):
-        if not tree.selection(): return
-        item = tree.item(tree.selection()[0])['values']; id_value.configure(text=str(item[0])); entry_usuario.delete(0,"end"); entry_usuario.insert(0, item[1]); combo_rol.set(item[2]); form_title.configure(text=f"Editando a: {item[1]}"); btn_guardar.configure(command=lambda: guardar_usuario("editar", item[0]))
-        if item[1] != 'admin': btn_eliminar.configure(state="normal")
-    def guardar_usuario(modo, user_id=None):
-        usuario, clave, rol = entry_usuario.get(), entry_clave.get(), combo_rol.get()
-        if not all([usuario, rol]): messagebox.showerror("Error", "Usuario y Rol son obligatorios."); return
-        if modo == "agregar" and not clave: messagebox.showerror("Error", "La clave es obligatoria para nuevos usuarios."); return
-        hashed_password_str = None
-        if clave:
-            hashed_password = bcrypt.hashpw(clave.encode('utf-8'), bcrypt.gensalt())
-            hashed_password_str = hashed_password.decode('utf-8')
-        conn = conectar_bd(); cursor = conn.cursor()
-        try:
-            if modo == "agregar":
-                cursor.execute("INSERT INTO usuarios (usuario, clave, rol) VALUES (%s, %s, %s)", (usuario, hashed_password_str, rol)); messagebox.showinfo("Éxito", "Usuario agregado.")
-            elif modo == "editar":
-                if hashed_password_str:
-                    cursor.execute("UPDATE usuarios SET usuario=%s, clave=%s, rol=%s WHERE id=%s", (usuario, hashed_password_str, rol, user_id))
-                else:
-                    cursor.execute("UPDATE usuarios SET usuario=%s, rol=%s WHERE id=%s", (usuario, rol, user_id))
-                messagebox.showinfo("Éxito", "Usuario actualizado.")
-            conn.commit()
-        except mysql.connector.Error as err: messagebox.showerror("Error de DB", f"No se pudo guardar: {err}")
-        finally: conn.close(); cargar_usuarios()
-    def eliminar_usuario():
-        user_id, user_name = id_value.cget("text"), entry_usuario.get()
-        if user_name == 'admin': messagebox.showerror("Error", "No se puede eliminar al usuario 'admin'."); return
-        if messagebox.askyesno("Confirmar", f"¿Seguro que desea eliminar al usuario '{user_name}'?"):
-            conn=conectar_bd(); cursor=conn.cursor(); cursor.execute("DELETE FROM usuarios WHERE id=%s", (user_id,)); conn.commit(); conn.close(); cargar_usuarios(); messagebox.showinfo("Éxito", "Usuario eliminado.")
-    btn_guardar = ctk.CTkButton(form_frame, text="Guardar", command=lambda: guardar_usuario("agregar")); btn_guardar.pack(pady=10, fill="x", padx=20); btn_eliminar = ctk.CTkButton(form_frame, text="Eliminar Seleccionado", state="disabled", fg_color="#D32F2F", command=eliminar_usuario); btn_eliminar.pack(pady=5, fill="x", padx=20); ctk.CTkButton(form_frame, text="Limpiar / Nuevo", fg_color="gray", command=limpiar_formulario).pack(pady=5, fill="x", padx=20)
-    tree.bind("<<TreeviewSelect>>", seleccionar_usuario); cargar_usuarios()
-
-def mostrar_vista_venta(frame, **kwargs):
-    root.geometry("1200x700"); frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Punto de Venta", "dashboard")
-    main_content = ctk.CTkFrame(frame, fg_color="transparent"); main_content.pack(fill="both", expand=True); main_content.grid_columnconfigure(0, weight=1); main_content.grid_columnconfigure(1, weight=1); main_content.grid_rowconfigure(0, weight=1)
-    carrito = []; conn = conectar_bd(); cursor = conn.cursor(); cursor.execute("SELECT id, nombre, precio, stock FROM productos WHERE stock > 0 AND estado = 'activo'"); productos_disponibles = {f"{p[1]} (Stock: {p[3]})": p for p in cursor.fetchall()}; conn.close()
-    
-    select_frame = ctk.CTkFrame(main_content); select_frame.grid(row=0, column=0, sticky="nsew", padx=(0,10))
-    ctk.CTkLabel(select_frame, text="Añadir Producto", font=("Roboto", 16, "bold")).pack(pady=10)
-    ctk.CTkLabel(select_frame, text="Producto:").pack(anchor="w", padx=20); combo_productos = ctk.CTkComboBox(select_frame, height=35, values=list(productos_disponibles.keys()), state="readonly"); combo_productos.pack(fill="x", padx=20)
-    ctk.CTkLabel(select_frame, text="Cantidad:").pack(anchor="w", padx=20); entry_cantidad = ctk.CTkEntry(select_frame, height=35); entry_cantidad.pack(fill="x", padx=20)
-    cart_add_icon = cargar_icono("cart-add.png", size=(20, 20))
-    ctk.CTkButton(select_frame, text="Añadir al Carrito", height=40, image=cart_add_icon, compound="left", command=lambda: anadir_al_carrito()).pack(pady=20, fill="x", padx=20)
-    
-    ctk.CTkLabel(select_frame, text="Tipo de Documento:", font=("Roboto", 16, "bold")).pack(pady=(20, 5), anchor="w", padx=20)
-    tipo_documento_var = tkinter.StringVar(value="Boleta")
-    factura_frame = ctk.CTkFrame(select_frame, fg_color="transparent")
-    def toggle_factura_fields():
-        if tipo_documento_var.get() == "Factura": factura_frame.pack(fill="x", padx=20, pady=5, after=radio_factura)
-        else: factura_frame.pack_forget()
-    radio_boleta = ctk.CTkRadioButton(select_frame, text="Boleta", variable=tipo_documento_var, value="Boleta", command=toggle_factura_fields); radio_boleta.pack(anchor="w", padx=20, pady=5)
-    radio_factura = ctk.CTkRadioButton(select_frame, text="Factura", variable=tipo_documento_var, value="Factura", command=toggle_factura_fields); radio_factura.pack(anchor="w", padx=20, pady=5)
-    entry_rut_cliente = ctk.CTkEntry(factura_frame, placeholder_text="RUT Cliente"); entry_rut_cliente.pack(fill="x", pady=5)
-    entry_nombre_cliente = ctk.CTkEntry(factura_frame, placeholder_text="Nombre o Razón Social"); entry_nombre_cliente.pack(fill="x", pady=5)
-
-    cart_frame = ctk.CTkFrame(main_content); cart_frame.grid(row=0, column=1, sticky="nsew", padx=(10,0)); ctk.CTkLabel(cart_frame, text="Carrito de Compras", font=("Roboto", 16, "bold")).pack(pady=10); cols = ("Producto", "Cant.", "Precio Neto", "Subtotal"); tree_carrito = ttk.Treeview(cart_frame, columns=cols, show='headings', style="Treeview");
-    for col in cols: tree_carrito.heading(col, text=col)
-    tree_carrito.column("Cant.", width=60, anchor="center"); tree_carrito.column("Precio Neto", width=120, anchor="e"); tree_carrito.column("Subtotal", width=120, anchor="e"); tree_carrito.pack(fill="both", expand=True, padx=10, pady=10)
-    
-    # Desglose de totales
-    label_neto = ctk.CTkLabel(cart_frame, text="Neto: CLP$ 0", font=("Roboto", 14)); label_neto.pack(anchor="e", padx=10)
-    label_iva = ctk.CTkLabel(cart_frame, text="IVA (19%): CLP$ 0", font=("Roboto", 14)); label_iva.pack(anchor="e", padx=10)
-    total_label = ctk.CTkLabel(cart_frame, text="TOTAL: CLP$ 0", font=("Roboto", 22, "bold")); total_label.pack(anchor="e", padx=10, pady=(5,10))
-    
-    def actualizar_vista_carrito():
-        for i in tree_carrito.get_children(): tree_carrito.delete(i)
-        neto = 0
-        for item in carrito:
-            valores_formateados = (item['nombre'], item['cantidad'], formatear_a_clp(item['precio']), formatear_a_clp(item['subtotal'])); tree_carrito.insert("", "end", values=valores_formateados); neto += item['subtotal']
-        iva = neto * TASA_IVA
-        total = neto + iva
-        label_neto.configure(text=f"Neto: {formatear_a_clp(neto)}")
-        label_iva.configure(text=f"IVA ({int(TASA_IVA*100)}%): {formatear_a_clp(iva)}")
-        total_label.configure(text=f"TOTAL: {formatear_a_clp(total)}")
-        
-    def anadir_al_carrito():
-        prod_str, cant_str = combo_productos.get(), entry_cantidad.get()
-        if not all([prod_str, cant_str]): return
-        try: cantidad = int(cant_str)
-        except ValueError: messagebox.showerror("Error", "Cantidad debe ser un número."); return
-        if cantidad <= 0: messagebox.showerror("Error", "Cantidad debe ser positiva."); return
-        prod_id, nombre, precio, stock = productos_disponibles[prod_str]; stock_en_carrito = sum(item['cantidad'] for item in carrito if item['id'] == prod_id)
-        if cantidad > stock - stock_en_carrito: messagebox.showerror("Stock insuficiente", f"No hay suficiente stock."); return
-        item_existente = next((item for item in carrito if item['id'] == prod_id), None); precio_float = float(precio)
-        if item_existente: item_existente['cantidad'] += cantidad; item_existente['subtotal'] = item_existente['cantidad'] * precio_float
-        else: carrito.append({'id': prod_id, 'nombre': nombre, 'precio': precio_float, 'cantidad': cantidad, 'subtotal': cantidad * precio_float})
-        actualizar_vista_carrito(); entry_cantidad.delete(0, 'end')
-    
-    def confirmar_venta():
-        if not carrito: messagebox.showwarning("Carrito Vacío", "Debe añadir productos al carrito."); return
-        
-        tipo_doc = tipo_documento_var.get()
-        cliente_rut, cliente_nombre = None, None
-        if tipo_doc == "Factura":
-            cliente_rut, cliente_nombre = entry_rut_cliente.get(), entry_nombre_cliente.get()
-            if not cliente_rut or not cliente_nombre:
-                messagebox.showerror("Datos Faltantes", "Para una factura, debe ingresar el RUT y Nombre del cliente."); return
-
-        neto = sum(item['subtotal'] for item in carrito); iva = neto * TASA_IVA; total_boleta = neto + iva
-        if not messagebox.askyesno("Confirmar", f"Total a pagar: {formatear_a_clp(total_boleta)}. ¿Continuar?"): return
-        
-        conn = conectar_bd(); cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO boletas (vendedor_usuario, neto, iva, total_boleta, tipo_documento, cliente_rut, cliente_nombre) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                           (current_user['usuario'], neto, iva, total_boleta, tipo_doc, cliente_rut, cliente_nombre))
-            boleta_id = cursor.lastrowid
-            for item in carrito:
-                cursor.execute("INSERT INTO detalle_ventas (boleta_id, producto_id, cantidad, precio_unitario, subtotal) VALUES (%s, %s, %s, %s, %s)",
-                               (boleta_id, item['id'], item['cantidad'], item['precio'], item['subtotal']))
-                cursor.execute("UPDATE productos SET stock = stock - %s WHERE id = %s", (item['cantidad'], item['id']))
-            conn.commit(); messagebox.showinfo("Éxito", "Venta registrada."); mostrar_vista("dashboard")
-        except mysql.connector.Error as err: conn.rollback(); messagebox.showerror("Error de DB", f"No se pudo completar la venta: {err}")
-        finally: conn.close()
-        
-    ctk.CTkButton(cart_frame, text="Confirmar Venta", height=40, fg_color="green", command=confirmar_venta).pack(pady=10, fill="x", padx=10)
-
-def mostrar_vista_historial(frame, **kwargs):
-    root.geometry("1200x700"); frame.pack(pady=20, padx=20, fill="both", expand=True)
-    titulo_vista = "Historial General de Boletas" if current_user['rol'] == 'admin' else "Mi Historial de Boletas"
-    _crear_header(frame, titulo_vista, "dashboard")
-    main_content = ctk.CTkFrame(frame, fg_color="transparent"); main_content.pack(fill="both", expand=True); main_content.grid_columnconfigure(0, weight=2); main_content.grid_columnconfigure(1, weight=1); main_content.grid_rowconfigure(0, weight=1)
-    
-    left_frame = ctk.CTkFrame(main_content, fg_color="transparent"); left_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10)); filtros_frame = ctk.CTkFrame(master=left_frame); filtros_frame.pack(fill="x", pady=5)
-    ctk.CTkLabel(master=filtros_frame, text="Filtros:", font=("Roboto", 16, "bold")).pack(anchor="w", padx=10, pady=(5,0)); ctk.CTkLabel(master=filtros_frame, text="Buscar por Nombre de Producto:").pack(anchor="w", padx=10)
-    entry_producto = ctk.CTkEntry(master=filtros_frame, placeholder_text="Ej: bebida, pan..."); entry_producto.pack(fill="x", padx=10, pady=(0,10))
-    def buscar(event=None): aplicar_filtros()
-    entry_producto.bind("<Return>", buscar); ctk.CTkButton(master=filtros_frame, text="Buscar", command=buscar).pack(padx=10, pady=(0, 10))
-    
-    tree_frame = ctk.CTkFrame(left_frame); tree_frame.pack(fill="both", expand=True, pady=5)
-    cols = ("ID Boleta", "Fecha", "Tipo", "Total"); tree = ttk.Treeview(tree_frame, columns=cols, show='headings', style="Treeview")
-    if current_user['rol'] == 'admin':
-        tree.heading("#0", text="Vendedor"); tree.column("#0", width=180)
-    else: tree.column("#0", width=0, stretch=tkinter.NO)
-    tree.heading("ID Boleta", text="ID Boleta"); tree.heading("Fecha", text="Fecha"); tree.heading("Tipo", text="Tipo"); tree.heading("Total", text="Total Boleta")
-    tree.column("ID Boleta", width=100, anchor="center"); tree.column("Fecha", width=150); tree.column("Tipo", width=80, anchor="center"); tree.column("Total", anchor="e")
-    
-    right_frame = ctk.CTkFrame(main_content); right_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0)); ctk.CTkLabel(master=right_frame, text="Acciones", font=("Roboto", 16, "bold")).pack(pady=10)
-    ctk.CTkLabel(master=right_frame, text="Seleccione una boleta\n(fila con ID) para ver\nsus detalles completos.", justify="center", wraplength=250).pack(pady=20, padx=10)
-    btn_ver_detalle = ctk.CTkButton(master=right_frame, text="Ver Detalle de Boleta", state="disabled"); btn_ver_detalle.pack(pady=10, padx=20, fill="x")
-    
-    def on_tree_select(event):
-        if tree.selection():
-            selected_item = tree.selection()[0]
-            if tree.parent(selected_item) or current_user['rol'] == 'vendedor': btn_ver_detalle.configure(state="normal")
-            else: btn_ver_detalle.configure(state="disabled")
-        else: btn_ver_detalle.configure(state="disabled")
-        
-    def ver_detalle_seleccionado():
-        if tree.selection():
-            selected_item = tree.selection()[0]
-            if tree.parent(selected_item) or current_user['rol'] == 'vendedor':
-                boleta_id = tree.item(selected_item, "values")[0]; mostrar_vista("detalle_boleta", boleta_id=boleta_id)
-
-    tree.bind("<<TreeviewSelect>>", on_tree_select); btn_ver_detalle.configure(command=ver_detalle_seleccionado); tree.pack(fill='both', expand=True)
-
-    def aplicar_filtros():
-        for i in tree.get_children(): tree.delete(i)
-        btn_ver_detalle.configure(state="disabled")
-        query = "SELECT DISTINCT b.id, b.fecha, b.vendedor_usuario, b.total_boleta, b.tipo_documento FROM boletas b"
-        params = []
-        if entry_producto.get():
-            query = "SELECT DISTINCT b.id, b.fecha, b.vendedor_usuario, b.total_boleta, b.tipo_documento FROM boletas b JOIN detalle_ventas dv ON b.id = dv.boleta_id JOIN productos p ON dv.producto_id = p.id WHERE p.nombre LIKE %s"
-            params.append(f"%{entry_producto.get()}%")
-        if current_user['rol'] == 'vendedor':
-            if 'WHERE' in query: query += " AND b.vendedor_usuario = %s"
-            else: query += " WHERE b.vendedor_usuario = %s"
-            params.append(current_user['usuario'])
-        query += " ORDER BY b.fecha DESC"
-        
-        conn = conectar_bd();
-        if not conn: return
-        cursor = conn.cursor(); cursor.execute(query, tuple(params))
-        boletas = cursor.fetchall(); conn.close()
-        
-        boletas_agrupadas = {}
-        for boleta in boletas:
-            vendedor = boleta[2] if boleta[2] else "Desconocido"
-            if vendedor not in boletas_agrupadas: boletas_agrupadas[vendedor] = []
-            boletas_agrupadas[vendedor].append(boleta)
-            
-        for vendedor, boletas_lista in boletas_agrupadas.items():
-            parent_id = ""
-            if current_user['rol'] == 'admin':
-                parent_id = tree.insert("", "end", text=f" {vendedor} ({len(boletas_lista)} boletas)", open=True)
-            for boleta in boletas_lista:
-                valores_formateados = (boleta[0], boleta[1].strftime('%d/%m/%Y %H:%M'), boleta[4], formatear_a_clp(boleta[3]))
-                tree.insert(parent_id, "end", values=valores_formateados)
-    
-    aplicar_filtros()
-
-def mostrar_vista_detalle_boleta(frame, boleta_id):
-    root.geometry("800x600"); frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, f"Detalle de Boleta #{boleta_id}", "historial")
-    main_detalle_frame = ctk.CTkScrollableFrame(master=frame, label_text="", fg_color="transparent"); main_detalle_frame.pack(fill="both", expand=True)
-    detalle_frame = ctk.CTkFrame(master=main_detalle_frame, corner_radius=10); detalle_frame.pack(fill="x", padx=20, pady=10)
-    
-    conn = conectar_bd();
-    if not conn: return
-    cursor = conn.cursor()
-    cursor.execute("SELECT fecha, vendedor_usuario, neto, iva, total_boleta, tipo_documento, cliente_rut, cliente_nombre FROM boletas WHERE id = %s", (boleta_id,))
-    boleta_data = cursor.fetchone()
-    
-    if not boleta_data:
-        ctk.CTkLabel(detalle_frame, text="No se encontraron datos para esta boleta.", font=("Roboto", 16)).pack(pady=20)
-        conn.close(); return
-        
-    info_grid = ctk.CTkFrame(detalle_frame, fg_color="transparent"); info_grid.pack(pady=20, padx=40, fill="x")
-    info_grid.grid_columnconfigure(0, weight=1); info_grid.grid_columnconfigure(1, weight=2)
-    def crear_fila_detalle(parent, label_text, value_text, row, font_size=14, is_bold=False, value_color=None):
-        label_font = ("Roboto", font_size); value_font = ("Roboto", font_size, "bold") if is_bold else ("Roboto", font_size)
-        ctk.CTkLabel(parent, text=label_text, font=label_font, anchor="e").grid(row=row, column=0, sticky="e", padx=(0, 10), pady=4)
-        ctk.CTkLabel(parent, text=value_text, font=value_font, anchor="w", text_color=value_color).grid(row=row, column=1, sticky="w", padx=(10, 0), pady=4)
-
-    row_idx = 0
-    crear_fila_detalle(info_grid, "Tipo Documento:", boleta_data[5], row_idx); row_idx += 1
-    crear_fila_detalle(info_grid, "ID de Boleta:", boleta_id, row_idx); row_idx += 1
-    crear_fila_detalle(info_grid, "Fecha y Hora:", boleta_data[0].strftime('%d de %B de %Y, %H:%M:%S'), row_idx); row_idx += 1
-    crear_fila_detalle(info_grid, "Vendido por:", boleta_data[1], row_idx); row_idx += 1
-    if boleta_data[5] == 'Factura':
-        crear_fila_detalle(info_grid, "RUT Cliente:", boleta_data[6], row_idx); row_idx += 1
-        crear_fila_detalle(info_grid, "Nombre Cliente:", boleta_data[7], row_idx); row_idx += 1
-
-    ctk.CTkFrame(info_grid, height=2, fg_color="gray50").grid(row=row_idx, columnspan=2, sticky="ew", pady=15); row_idx += 1
-    ctk.CTkLabel(info_grid, text="Productos:", font=("Roboto", 14, "bold")).grid(row=row_idx, columnspan=2, pady=(0,10)); row_idx += 1
-    
-    items_container_frame = ctk.CTkFrame(info_grid, fg_color="transparent"); items_container_frame.grid(row=row_idx, columnspan=2, sticky="ew"); row_idx += 1
-    cursor.execute("SELECT p.codigo, p.nombre, dv.cantidad, dv.precio_unitario, dv.subtotal FROM detalle_ventas dv JOIN productos p ON dv.producto_id = p.id WHERE dv.boleta_id = %s", (boleta_id,))
-    items_vendidos = cursor.fetchall(); conn.close()
-    
-    for item in items_vendidos:
-        item_frame = ctk.CTkFrame(items_container_frame, fg_color=("gray85", "gray22"), corner_radius=6); item_frame.pack(fill="x", pady=5, padx=5, ipady=5)
-        item_grid = ctk.CTkFrame(item_frame, fg_color="transparent"); item_grid.pack(fill="x", padx=10); item_grid.grid_columnconfigure(0, weight=1); item_grid.grid_columnconfigure(1, weight=1)
-        crear_fila_detalle(item_grid, "Código:", item[0], 0, font_size=12); crear_fila_detalle(item_grid, "Producto:", item[1], 1, font_size=12); crear_fila_detalle(item_grid, "Cantidad:", item[2], 2, font_size=12); crear_fila_detalle(item_grid, "P. Unitario (Neto):", formatear_a_clp(item[3]), 3, font_size=12); crear_fila_detalle(item_grid, "Subtotal (Neto):", formatear_a_clp(item[4]), 4, font_size=12, is_bold=True, value_color=("#333", "#ccc"))
-
-    ctk.CTkFrame(info_grid, height=2, fg_color="gray50").grid(row=row_idx, columnspan=2, sticky="ew", pady=15); row_idx += 1
-    crear_fila_detalle(info_grid, "Neto:", formatear_a_clp(boleta_data[2]), row_idx); row_idx += 1
-    crear_fila_detalle(info_grid, f"IVA ({int(TASA_IVA*100)}%):", formatear_a_clp(boleta_data[3]), row_idx); row_idx += 1
-    crear_fila_detalle(info_grid, "TOTAL:", formatear_a_clp(boleta_data[4]), row_idx, font_size=18, is_bold=True, value_color="#2ECC71")
-
-
-# ==============================================================================
-# 6. PUNTO DE ENTRADA PRINCIPAL
-# ==============================================================================
-if __name__ == "__main__":
-    root = ctk.CTk()
-    root.title("Sistema Bazar Integrado 2025")
-    root.geometry("800x600")
-
-    root.update_idletasks(); x = (root.winfo_screenwidth() // 2) - (root.winfo_width() // 2); y = (root.winfo_screenheight() // 2) - (root.winfo_height() // 2); root.geometry(f'+{x}+{y}')
-
-    content_frame = ctk.CTkFrame(master=root, fg_color="transparent")
-    content_frame.pack(fill="both", expand=True)
-
-    configurar_estilo_treeview()
-    iniciar_bd()
-    
-    mostrar_vista("login")
-    
-    root.mainloop()
\ No newline at end of file
+# ==============================================================================
+# 1. IMPORTS DE LIBRERÍAS
+# ==============================================================================
+import time
+_INICIO_PROCESO = time.perf_counter()
+import tkinter
+from tkinter import messagebox, ttk, filedialog
+from datetime import datetime, timedelta, date
+from types import SimpleNamespace
+import importlib
+import bisect
+import heapq
+import unicodedata
+import locale
+import os
+import threading
+import queue
+import sys
+import itertools
+import csv
+import re
+import json
+import functools
+import contextlib
+import sqlite3
+import socket
+import uuid
+import decimal
+from urllib.parse import urlsplit
+from collections import deque, OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+TIEMPOS_ARRANQUE = [] # (etapa, segundos) para el reporte de arranque
+
+class ModuloPerezoso:
+    """Importa un módulo pesado recién cuando se usa por primera vez alguno de sus atributos."""
+    def __init__(self, nombre):
+        self._nombre, self._modulo = nombre, None
+
+    def __getattr__(self, atributo):
+        if self._modulo is None:
+            inicio = time.perf_counter(); self._modulo = importlib.import_module(self._nombre)
+            TIEMPOS_ARRANQUE.append((f"import {self._nombre}", time.perf_counter() - inicio))
+        return getattr(self._modulo, atributo)
+
+# Librerías de terceros: ninguna se carga al importar este archivo
+ctk = ModuloPerezoso("customtkinter")
+mysql = SimpleNamespace(connector=ModuloPerezoso("mysql.connector"))
+Image = ModuloPerezoso("PIL.Image")
+bcrypt = ModuloPerezoso("bcrypt")
+http_client = ModuloPerezoso("http.client") # Solo lo usa una caja conectada al servicio (BAZAR_BACKEND=remoto)
+
+# ==============================================================================
+# 2. CONFIGURACIÓN GLOBAL Y VARIABLES
+# ==============================================================================
+
+try:
+    locale.setlocale(locale.LC_ALL, 'es_CL.UTF-8') 
+except locale.Error:
+    print("ADVERTENCIA: Locale 'es_CL.UTF-8' no disponible.")
+    try: locale.setlocale(locale.LC_ALL, '')
+    except locale.Error: print("No se pudo establecer ningún locale.")
+
+current_user = {"usuario": None, "rol": None}
+TIEMPO_INACTIVIDAD = 600000 
+temporizador_id = None
+TASA_IVA = 0.19 # Tasa del 19% para el IVA
+
+BACKEND_BD = os.environ.get("BAZAR_BACKEND", "mysql").lower() # "mysql": servidor compartido por varias cajas; "sqlite": una sola caja, sin servidor; "remoto": a través de servicio.py
+SQLITE_RUTA = os.environ.get("BAZAR_SQLITE_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bazar.db"))
+# WAL deja leer mientras otra conexión escribe; con WAL, synchronous=NORMAL sigue siendo consistente ante un corte de luz
+SQLITE_PRAGMAS = ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA foreign_keys=ON", "PRAGMA busy_timeout=5000", "PRAGMA temp_store=MEMORY", "PRAGMA cache_size=-32000", "PRAGMA mmap_size=268435456")
+DB_CONFIG = {"host": os.environ.get("BAZAR_DB_HOST", "localhost"), "user": os.environ.get("BAZAR_DB_USER", "bazar_user"), "password": os.environ.get("BAZAR_DB_PASSWORD", "123456"), "database": os.environ.get("BAZAR_DB_NAME", "bazar")}
+# Ajustes de la concurrencia agrupados por componente: pool de conexiones, carga en segundo plano, reservas de stock y diario de ventas
+CONFIG = SimpleNamespace(
+    pool=SimpleNamespace(
+        tamano=int(os.environ.get("BAZAR_POOL_TAMANO", "5")), # Conexiones simultáneas máximas
+        timeout=float(os.environ.get("BAZAR_POOL_TIMEOUT", "10")), # Segundos de espera por una conexión libre
+        intervalo_ping=30.0, # Segundos de inactividad tras los cuales se verifica la conexión antes de prestarla
+        timeout_conexion=5, # Segundos para abrir una conexión nueva; sin servidor se falla rápido en vez de colgar el hilo
+    ),
+    carga=SimpleNamespace(
+        hilos=4, # Hilos de trabajo para consultas fuera del hilo de la interfaz
+        intervalo_sondeo_ms=25, # Cada cuánto el hilo de Tk revisa si hay resultados listos
+    ),
+    reservas=SimpleNamespace(
+        duracion=int(os.environ.get("BAZAR_RESERVA_DURACION", "300")), # Segundos que dura una reserva de stock si la caja deja de renovarla; también es el máximo que acepta el servidor
+        reintentos=5, # Intentos de una reserva cuando otra caja cambia el mismo producto entre la lectura y la escritura
+        terminal=os.environ.get("BAZAR_TERMINAL") or f"{socket.gethostname()[:40]}-{uuid.uuid4().hex[:8]}", # Identifica las reservas de esta caja
+    ),
+    sincronizacion=SimpleNamespace(
+        diario_ruta=os.environ.get("BAZAR_DIARIO_VENTAS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ventas_pendientes.db")), # Diario local de ventas por enviar
+        lote=50, # Ventas enviadas con una misma conexión en cada pasada del sincronizador
+        espera_max=60.0, # Segundos máximos entre reintentos cuando el servidor no responde
+        dias_retencion=30, # Días que se conservan en el diario las ventas ya enviadas
+        aviso_rechazadas_ms=5000, # Cada cuánto el dashboard revisa si el servidor rechazó ventas de esta caja
+    ),
+)
+TAMANO_PAGINA = 200 # Filas por consulta paginada
+MAX_PAGINAS_EN_VISTA = 5 # Páginas que se mantienen en un Treeview paginado; las demás se descartan y se vuelven a pedir al regresar
+MARGEN_PRECARGA = 60 # Filas restantes fuera de la vista que disparan la carga de la página siguiente o anterior
+CATALOGO_INTERVALO_REVALIDACION = 5.0 # Segundos mínimos entre dos revalidaciones del catálogo contra el servidor
+CATALOGO_SOLAPE_REVALIDACION = timedelta(seconds=2) # Margen hacia atrás al pedir cambios, por transacciones que confirman tarde
+MAX_RESULTADOS_BUSQUEDA = 50 # Resultados mostrados por la búsqueda del Punto de Venta
+PRESUPUESTO_BUSQUEDA_MS = 8.0 # Tiempo máximo por pulsación; si se excede se muestran resultados parciales
+MAX_VISTAS_EN_CACHE = int(os.environ.get("BAZAR_VISTAS_EN_CACHE", "6")) # Vistas construidas que se conservan ocultas; al exceder se destruye la menos usada
+DETALLES_EN_CACHE = 200 # Detalles de boleta ya formateados que se conservan en memoria (una boleta registrada no cambia)
+BCRYPT_COSTO = int(os.environ.get("BAZAR_BCRYPT_COSTO", "12")) # log2 de las rondas de bcrypt; `python bazar.py --calibrar-bcrypt` sugiere uno para este equipo
+BCRYPT_OBJETIVO_MS = float(os.environ.get("BAZAR_BCRYPT_OBJETIVO_MS", "250")) # Tiempo por hash que busca la calibración
+IMPORTACION_LOTE = 500 # Filas por sentencia INSERT multi-fila al importar productos desde CSV
+EXPORTACION_LOTE = 2000 # Filas que se piden al servidor en cada viaje al exportar ventas
+CODIGOS_BLOQUE = 20 # Números de código que cada caja reserva de una vez por prefijo; los que no alcanza a usar quedan como huecos
+INSTRUMENTACION_VENTANA = 1000 # Mediciones recientes que se guardan por consulta o vista para calcular percentiles
+CAMBIOS_RETENCION = 86400 # Segundos que se conserva el registro de cambios de productos; una caja que pasa más tiempo sin revisarlo recarga el catálogo entero
+CAMBIOS_INTERVALO_PURGA = 3600.0 # Segundos mínimos entre dos purgas del registro de cambios
+ARCHIVO_MESES_ACTIVOS = int(os.environ.get("BAZAR_ARCHIVO_MESES", "3")) # Meses cerrados que quedan en boletas y detalle_ventas junto al mes en curso; los anteriores pasan al archivo
+ARCHIVO_LOTE = 500 # Boletas que mueve cada transacción del archivado; un lote corto no hace esperar a las ventas
+ARCHIVO_PAUSA = 0.2 # Segundos entre dos lotes del archivado
+ARCHIVO_INTERVALO = 3600.0 # Segundos entre dos pasadas del archivado
+HISTORIAL_DIAS = 30 # Días que muestra el historial al abrirlo; un rango más antiguo consulta también el archivo
+RUTA_TRAZA = os.environ.get("BAZAR_TRAZA") # Si se define, se escribe ahí una traza en formato Chrome desde el arranque
+SERVICIO_URL = os.environ.get("BAZAR_SERVICIO_URL", "http://127.0.0.1:8765") # Servicio (servicio.py) al que se conectan las cajas con BAZAR_BACKEND=remoto
+SERVICIO_TOKEN = os.environ.get("BAZAR_SERVICIO_TOKEN", "") # Secreto compartido entre el servicio y sus cajas; vacío: sin verificación
+SERVICIO_TIMEOUT = float(os.environ.get("BAZAR_SERVICIO_TIMEOUT", "15")) # Segundos de espera por una respuesta del servicio
+CSV_DELIMITADOR = ";" # Excel en español separa con punto y coma; al importar se detecta el separador
+
+# ==============================================================================
+# 3. FUNCIONES DE UTILIDAD Y BASE DE DATOS
+# ==============================================================================
+def formatear_a_clp(valor):
+    if valor is None: return "CLP$ 0"
+    try:
+        valor_entero = int(round(float(valor)))
+        return f"CLP$ {locale.format_string('%d', valor_entero, grouping=True)}"
+    except (ValueError, TypeError): return "CLP$ 0"
+
+class CursorMedido:
+    """Cursor que informa cada consulta a la instrumentación: forma del SQL, filas y tiempo de execute más las lecturas."""
+    __slots__ = ("_cursor", "_origen", "_pendiente")
+    def __init__(self, cursor, origen): self._cursor, self._origen, self._pendiente = cursor, origen, None
+
+    def execute(self, query, params=()):
+        self._registrar(); inicio = time.perf_counter()
+        try: self._cursor.execute(query, params)
+        finally: self._pendiente = [query, inicio, time.perf_counter() - inicio, None]
+        return self
+
+    def executemany(self, query, filas):
+        self._registrar(); inicio = time.perf_counter()
+        try: self._cursor.executemany(query, filas)
+        finally: self._pendiente = [query, inicio, time.perf_counter() - inicio, None]; self._registrar()
+        return self
+
+    def fetchone(self): fila = self._leer(self._cursor.fetchone); self._sumar_filas(fila is not None); return fila
+    def fetchmany(self, cantidad): filas = self._leer(self._cursor.fetchmany, cantidad); self._sumar_filas(len(filas)); return filas
+    def fetchall(self): filas = self._leer(self._cursor.fetchall); self._sumar_filas(len(filas)); self._registrar(); return filas
+
+    def _leer(self, metodo, *args):
+        inicio = time.perf_counter(); resultado = metodo(*args)
+        if self._pendiente is not None: self._pendiente[2] += time.perf_counter() - inicio
+        return resultado
+
+    def _sumar_filas(self, cantidad):
+        if self._pendiente is not None: self._pendiente[3] = (self._pendiente[3] or 0) + cantidad
+
+    def _registrar(self):
+        if self._pendiente is None: return
+        query, inicio, duracion, filas = self._pendiente; self._pendiente = None
+        if filas is None: filas = max(self._cursor.rowcount, 0) # Escrituras: filas afectadas
+        instrumentacion.registrar("sql", forma_sql(query), duracion, inicio, filas, origen=self._origen)
+
+    def __getattr__(self, nombre): return getattr(self._cursor, nombre)
+
+class ConexionPrestada:
+    """Conexión tomada del pool. Se usa igual que una conexión normal, pero close() la devuelve al pool."""
+    def __init__(self, pool, conn, origen):
+        self._pool, self._conn, self._origen, self._inicio = pool, conn, origen, time.perf_counter()
+        self._cursores = []
+
+    def __getattr__(self, nombre):
+        if self._conn is None: raise mysql.connector.errors.InterfaceError("La conexión ya fue devuelta al pool.")
+        return getattr(self._conn, nombre)
+
+    def cursor(self, *args, **kwargs):
+        if self._conn is None: raise mysql.connector.errors.InterfaceError("La conexión ya fue devuelta al pool.")
+        cursor = CursorMedido(self._conn.cursor(*args, **kwargs), self._origen); self._cursores.append(cursor)
+        return cursor
+
+    def close(self):
+        if self._conn is None: return
+        for cursor in self._cursores: cursor._registrar() # Consultas leídas con fetchone/fetchmany que no llegaron a otro execute
+        conn, self._conn, self._cursores = self._conn, None, []
+        self._pool.devolver(conn, self._origen, time.perf_counter() - self._inicio)
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+class PoolConexiones:
+    """Pool de conexiones MySQL seguro entre hilos, con verificación de salud, reconexión y contadores de tiempo por origen."""
+    def __init__(self, config, tamano=CONFIG.pool.tamano, timeout=CONFIG.pool.timeout, intervalo_ping=CONFIG.pool.intervalo_ping):
+        self.config = config
+        self.tamano, self.timeout, self.intervalo_ping = tamano, timeout, intervalo_ping
+        self._libres = queue.LifoQueue() # LIFO: se reutiliza primero la conexión usada más recientemente
+        self._lock = threading.Lock(); self._creadas = 0; self._cerrado = False
+        self.contadores = {"prestamos": 0, "creadas": 0, "reconexiones": 0, "descartadas": 0, "espera_total": 0.0, "espera_max": 0.0}
+        self.por_origen = {} # origen -> [llamadas, tiempo_uso_total, tiempo_uso_max]
+
+    def obtener(self, origen="?"):
+        inicio = time.perf_counter()
+        try: conn, ultimo_uso = self._libres.get_nowait()
+        except queue.Empty:
+            conn = self._crear_si_hay_cupo()
+            if conn is None:
+                try: conn, ultimo_uso = self._libres.get(timeout=self.timeout)
+                except queue.Empty: raise self._error_agotado(f"No hay conexiones libres tras {self.timeout:.0f}s (tamaño del pool: {self.tamano}).")
+            else: ultimo_uso = time.monotonic()
+        conn = self._verificar(conn, ultimo_uso)
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self.contadores["prestamos"] += 1; self.contadores["espera_total"] += espera
+            self.contadores["espera_max"] = max(self.contadores["espera_max"], espera)
+        return ConexionPrestada(self, conn, origen)
+
+    def _crear_si_hay_cupo(self):
+        with self._lock:
+            if self._creadas >= self.tamano: return None
+            self._creadas += 1
+        try: conn = self._conectar()
+        except Exception:
+            with self._lock: self._creadas -= 1
+            raise
+        with self._lock: self.contadores["creadas"] += 1
+        return conn
+
+    def _conectar(self):
+        return mysql.connector.connect(**{"connection_timeout": CONFIG.pool.timeout_conexion, **self.config, "buffered": True, "consume_results": True})
+
+    def _error_agotado(self, mensaje): return mysql.connector.errors.PoolError(mensaje)
+
+    def _verificar(self, conn, ultimo_uso):
+        if time.monotonic() - ultimo_uso < self.intervalo_ping: return conn
+        try:
+            if not conn.is_connected():
+                conn.reconnect(attempts=2, delay=0.5)
+                with self._lock: self.contadores["reconexiones"] += 1
+            return conn
+        except mysql.connector.Error:
+            self._descartar(conn)
+            nueva = self._crear_si_hay_cupo()
+            if nueva is None: raise
+            return nueva
+
+    def _descartar(self, conn):
+        try: conn.close()
+        except Exception: pass
+        with self._lock: self._creadas -= 1; self.contadores["descartadas"] += 1
+
+    def devolver(self, conn, origen, tiempo_uso):
+        with self._lock:
+            datos = self.por_origen.setdefault(origen, [0, 0.0, 0.0])
+            datos[0] += 1; datos[1] += tiempo_uso; datos[2] = max(datos[2], tiempo_uso)
+        if self._cerrado: self._descartar(conn); return
+        try:
+            # Una transacción abierta (incluso de solo lectura) dejaría al siguiente usuario con una vista antigua de los datos
+            if conn.in_transaction: conn.rollback()
+        except Exception: self._descartar(conn); return
+        self._libres.put((conn, time.monotonic()))
+
+    def cerrar(self):
+        self._cerrado = True
+        while True:
+            try: conn, _ = self._libres.get_nowait()
+            except queue.Empty: break
+            self._descartar(conn)
+
+    def resumen(self):
+        with self._lock:
+            c = dict(self.contadores); origenes = sorted(self.por_origen.items(), key=lambda kv: kv[1][1], reverse=True)
+        espera_media = (c["espera_total"] / c["prestamos"] * 1000) if c["prestamos"] else 0.0
+        lineas = [f"Pool: {c['prestamos']} préstamos, {c['creadas']} conexiones creadas, {c['reconexiones']} reconexiones, {c['descartadas']} descartadas, espera media {espera_media:.2f} ms, máx {c['espera_max']*1000:.2f} ms"]
+        for origen, (llamadas, total, maximo) in origenes:
+            lineas.append(f"  {origen:<32} {llamadas:>6} llamadas  media {total/llamadas*1000:8.2f} ms  máx {maximo*1000:8.2f} ms")
+        return "\n".join(lineas)
+
+class CursorSQLite:
+    """Cursor sqlite3 que acepta los marcadores %s del resto del código (se traducen a ?)."""
+    __slots__ = ("_cursor",)
+    def __init__(self, cursor): self._cursor = cursor
+    def execute(self, query, params=()): self._cursor.execute(query.replace("%s", "?"), params); return self
+    def executemany(self, query, filas): self._cursor.executemany(query.replace("%s", "?"), filas); return self
+    def __getattr__(self, nombre): return getattr(self._cursor, nombre)
+
+class ConexionSQLite:
+    """Conexión a un archivo SQLite con la interfaz de conexión MySQL que usa el pool (cursor, commit, is_connected...)."""
+    def __init__(self, ruta):
+        # PARSE_DECLTYPES devuelve TIMESTAMP y DATE como datetime/date; PARSE_COLNAMES lo permite en expresiones ("alias [DATE]")
+        self._conn = sqlite3.connect(ruta, timeout=CONFIG.pool.timeout, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        for pragma in SQLITE_PRAGMAS: self._conn.execute(pragma)
+    def cursor(self): return CursorSQLite(self._conn.cursor())
+    def is_connected(self): return True
+    def __getattr__(self, nombre): return getattr(self._conn, nombre)
+
+class PoolSQLite(PoolConexiones):
+    """El mismo pool sobre un archivo SQLite: cada conexión la usa un hilo a la vez y WAL permite leer mientras otro escribe."""
+    def __init__(self, ruta, tamano=CONFIG.pool.tamano, timeout=CONFIG.pool.timeout):
+        super().__init__({"database": ruta}, tamano, timeout, intervalo_ping=float("inf")) # Un archivo local no se "desconecta"
+
+    def _conectar(self): return ConexionSQLite(self.config["database"])
+    def _error_agotado(self, mensaje): return sqlite3.OperationalError(mensaje)
+
+def _registrar_tipos_sqlite():
+    sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" ")); sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+    sqlite3.register_converter("TIMESTAMP", lambda valor: datetime.fromisoformat(valor.decode()))
+    sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+
+_repositorio = None
+_repositorio_lock = threading.Lock()
+
+def obtener_repositorio():
+    """Repositorio del backend elegido al arrancar con BAZAR_BACKEND: MySQL (por defecto), SQLite embebido o el servicio remoto."""
+    global _repositorio
+    with _repositorio_lock:
+        if _repositorio is None:
+            if BACKEND_BD == "sqlite": _repositorio = RepositorioSQLite(SQLITE_RUTA)
+            elif BACKEND_BD == "remoto": _repositorio = RepositorioRemoto(SERVICIO_URL, SERVICIO_TOKEN)
+            else: _repositorio = RepositorioMySQL(DB_CONFIG)
+        return _repositorio
+
+def obtener_pool(): return obtener_repositorio().pool
+
+def errores_bd():
+    """Clase base de los errores del backend activo, para usar en `except errores_bd() as err`."""
+    return obtener_repositorio().Error
+
+def consultar_bd(query, params=(), uno=False, *, origen):
+    """Consulta de lectura con una conexión del pool; los errores se propagan. `origen` la nombra en el diagnóstico."""
+    return obtener_repositorio().consultar(query, params, uno, origen=origen)
+
+OPERACIONES_SERVICIO = {} # nombre -> (función, es_lectura): lo que servicio.py expone además de los métodos del repositorio
+
+def operacion_servicio(nombre, lectura=True):
+    """Registra una función como operación del servicio: en una caja remota la llamada viaja con sus argumentos, nunca como SQL."""
+    def decorar(funcion):
+        OPERACIONES_SERVICIO[nombre] = (funcion, lectura)
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            repositorio = obtener_repositorio()
+            if repositorio.remoto: return repositorio.llamar(nombre, *args, **kwargs)
+            return funcion(*args, **kwargs)
+        return envoltura
+    return decorar
+
+PATRON_CODIGO = re.compile(r"^(.+)-(\d+)$")
+
+def prefijo_codigo(nombre): return ''.join(filter(str.isalnum, nombre[:3].upper())) or "PRD"
+
+def formatear_codigo(prefijo, numero): return f"{prefijo}-{numero:04d}" # Pasado el 9999 crece a 5 dígitos en vez de repetir
+
+class AsignadorCodigos:
+    """Códigos PREFIJO-NNNN únicos entre cajas, reservados por bloques de la secuencia de cada prefijo (secuencias_codigo)."""
+    def __init__(self, bloque=CODIGOS_BLOQUE):
+        self.bloque = bloque; self._lock = threading.Lock()
+        self._rangos = {} # prefijo -> deque de [siguiente, límite) ya reservados
+
+    def siguiente(self, nombre): return self.varios([nombre])[0]
+
+    def varios(self, nombres):
+        """Un código por nombre, en el mismo orden. Lo que falte se reserva con una sola transacción para todos los prefijos."""
+        prefijos = [prefijo_codigo(nombre) for nombre in nombres]
+        with self._lock:
+            faltan = {}
+            for prefijo, necesarios in Counter(prefijos).items():
+                falta = necesarios - sum(limite - siguiente for siguiente, limite in self._rangos.get(prefijo, ()))
+                if falta > 0: faltan[prefijo] = -(-falta // self.bloque) * self.bloque # Redondeado a bloques completos
+            if faltan:
+                for prefijo, inicio in obtener_repositorio().reservar_codigos(faltan).items(): self._rangos.setdefault(prefijo, deque()).append([inicio, inicio + faltan[prefijo]])
+            return [formatear_codigo(prefijo, self._tomar(prefijo)) for prefijo in prefijos]
+
+    def _tomar(self, prefijo):
+        rangos = self._rangos[prefijo]; rango = rangos[0]; numero = rango[0]; rango[0] += 1
+        if rango[0] == rango[1]: rangos.popleft()
+        return numero
+
+    def descartar(self, prefijos):
+        """Olvida los bloques reservados de esos prefijos (p. ej. tras importar códigos explícitos que podrían pisarlos)."""
+        with self._lock:
+            for prefijo in prefijos: self._rangos.pop(prefijo, None)
+
+asignador_codigos = AsignadorCodigos()
+
+def generar_codigo_producto(nombre): return asignador_codigos.siguiente(nombre)
+
+def hashear_clave(clave, costo=None):
+    """Hash bcrypt de una clave en texto plano; tarda cientos de ms a propósito."""
+    return bcrypt.hashpw(clave.encode('utf-8'), bcrypt.gensalt(rounds=costo or BCRYPT_COSTO)).decode('utf-8')
+
+def costo_hash(clave_hash):
+    # Formato $2b$12$<sal><hash>: el tercer campo es el costo
+    try: return int(clave_hash.split("$")[2])
+    except (IndexError, ValueError): return None
+
+@operacion_servicio("usuarios.verificar_credenciales", lectura=False)
+def verificar_credenciales(usuario, clave):
+    """Devuelve el rol si la clave es correcta, o None. En una caja remota corre en el servicio: el hash nunca sale de la base."""
+    repositorio = obtener_repositorio(); resultado = repositorio.buscar_usuario(usuario)
+    if not resultado or not bcrypt.checkpw(clave.encode('utf-8'), resultado[0].encode('utf-8')): return None
+    if costo_hash(resultado[0]) != BCRYPT_COSTO: # Hash de otro costo: se guarda con el actual aquí, donde la clave ya está verificada
+        try: repositorio.actualizar_clave(usuario, hashear_clave(clave))
+        except Exception as err: print(f"ADVERTENCIA: No se pudo actualizar el hash de '{usuario}'; se reintentará en su próximo ingreso. Error: {err}")
+    return resultado[1]
+
+def calibrar_costo_bcrypt(objetivo_ms=BCRYPT_OBJETIVO_MS, costo_min=10, costo_max=16):
+    """Mide bcrypt en este equipo. Devuelve (costo, medidas): el mayor costo cuyo hash no pasa de objetivo_ms (nunca menos que costo_min)."""
+    costo_elegido, medidas = costo_min, []
+    for costo in range(costo_min, costo_max + 1):
+        inicio = time.perf_counter(); bcrypt.hashpw(b"calibracion", bcrypt.gensalt(rounds=costo)); ms = (time.perf_counter() - inicio) * 1000
+        medidas.append((costo, ms))
+        if ms > objetivo_ms: break # Cada punto de costo duplica el tiempo: los siguientes también se pasan
+        costo_elegido = costo
+    return costo_elegido, medidas
+
+# MIGRACIONES DEL ESQUEMA: cada una es idempotente (revisa antes de crear) y se aplica una sola vez, en orden.
+def _existe_columna(cursor, tabla, columna):
+    cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s", (tabla, columna)); return cursor.fetchone() is not None
+
+def _existe_indice(cursor, tabla, indice):
+    cursor.execute("SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1", (tabla, indice)); return cursor.fetchone() is not None
+
+def _crear_indice(cursor, tabla, indice, definicion):
+    if not _existe_indice(cursor, tabla, indice): cursor.execute(f"ALTER TABLE {tabla} ADD {definicion}")
+
+def _migracion_tablas_base(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS usuarios (id INT AUTO_INCREMENT PRIMARY KEY, usuario VARCHAR(50) UNIQUE NOT NULL, clave VARCHAR(255) NOT NULL, rol ENUM('vendedor', 'admin') NOT NULL)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS productos (id INT AUTO_INCREMENT PRIMARY KEY, codigo VARCHAR(20) UNIQUE, nombre VARCHAR(100) UNIQUE NOT NULL, precio DECIMAL(10,2) NOT NULL, stock INT NOT NULL, estado ENUM('activo', 'inactivo') NOT NULL DEFAULT 'activo')")
+    
+    # ESTRUCTURA DE BOLETAS MODIFICADA PARA INCLUIR IVA
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS boletas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            vendedor_usuario VARCHAR(50),
+            neto DECIMAL(10,2) NOT NULL,
+            iva DECIMAL(10,2) NOT NULL,
+            total_boleta DECIMAL(10,2) NOT NULL,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            tipo_documento ENUM('Boleta', 'Factura') NOT NULL DEFAULT 'Boleta',
+            cliente_rut VARCHAR(12),
+            cliente_nombre VARCHAR(100)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detalle_ventas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            boleta_id INT NOT NULL,
+            producto_id INT NOT NULL,
+            cantidad INT NOT NULL,
+            precio_unitario DECIMAL(10,2) NOT NULL,
+            subtotal DECIMAL(10,2) NOT NULL,
+            FOREIGN KEY (boleta_id) REFERENCES boletas(id) ON DELETE CASCADE,
+            FOREIGN KEY (producto_id) REFERENCES productos(id)
+        )
+    """)
+
+def _migracion_estado_y_codigo(cursor):
+    if not _existe_columna(cursor, "productos", "estado"): cursor.execute("ALTER TABLE productos ADD COLUMN estado ENUM('activo', 'inactivo') NOT NULL DEFAULT 'activo'")
+    if not _existe_columna(cursor, "productos", "codigo"): cursor.execute("ALTER TABLE productos ADD COLUMN codigo VARCHAR(20) UNIQUE AFTER id")
+    _asignar_codigos_faltantes(cursor)
+
+def _sufijos_maximos(cursor):
+    """{prefijo: mayor número} de los códigos PREFIJO-NNNN existentes, con una sola consulta."""
+    cursor.execute("SELECT codigo FROM productos WHERE codigo IS NOT NULL"); maximos = {}
+    for (codigo,) in cursor.fetchall():
+        coincidencia = PATRON_CODIGO.match(codigo)
+        if coincidencia: prefijo, numero = coincidencia.group(1), int(coincidencia.group(2)); maximos[prefijo] = max(maximos.get(prefijo, 0), numero)
+    return maximos
+
+def _asignar_codigos_faltantes(cursor):
+    cursor.execute("SELECT id, nombre FROM productos WHERE codigo IS NULL OR codigo = ''")
+    productos_sin_codigo = cursor.fetchall()
+    if productos_sin_codigo:
+        print(f"Asignando códigos a {len(productos_sin_codigo)} productos existentes...")
+        # Se numera en memoria a continuación del mayor código de cada prefijo: ningún SELECT por código
+        siguientes = {prefijo: maximo + 1 for prefijo, maximo in _sufijos_maximos(cursor).items()}; nuevos = []
+        for prod_id, prod_nombre in productos_sin_codigo:
+            prefijo = prefijo_codigo(prod_nombre); numero = siguientes.get(prefijo, 1); siguientes[prefijo] = numero + 1
+            nuevos.append((formatear_codigo(prefijo, numero), prod_id))
+        cursor.executemany("UPDATE productos SET codigo = %s WHERE id = %s", nuevos)
+
+def _migracion_actualizado_en(cursor):
+    if not _existe_columna(cursor, "productos", "actualizado_en"): cursor.execute("ALTER TABLE productos ADD COLUMN actualizado_en TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)")
+    _crear_indice(cursor, "productos", "idx_productos_actualizado_en", "INDEX idx_productos_actualizado_en (actualizado_en)")
+
+def _migracion_resumen_diario(cursor):
+    # TABLAS DE RESUMEN DIARIO PARA REPORTES (se mantienen en cada venta desde registrar_venta)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_boletas_diario (
+            fecha DATE NOT NULL,
+            vendedor_usuario VARCHAR(50) NOT NULL DEFAULT '',
+            boletas INT NOT NULL DEFAULT 0,
+            neto DECIMAL(14,2) NOT NULL DEFAULT 0,
+            iva DECIMAL(14,2) NOT NULL DEFAULT 0,
+            total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, vendedor_usuario)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_ventas_diario (
+            fecha DATE NOT NULL,
+            vendedor_usuario VARCHAR(50) NOT NULL DEFAULT '',
+            producto_id INT NOT NULL,
+            cantidad INT NOT NULL DEFAULT 0,
+            neto DECIMAL(14,2) NOT NULL DEFAULT 0,
+            iva DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, vendedor_usuario, producto_id),
+            INDEX idx_resumen_ventas_producto (producto_id, fecha)
+        )
+    """)
+    # Se reconstruyen desde cero para que volver a correr la migración tras una interrupción dé el mismo resultado
+    cursor.execute("DELETE FROM resumen_boletas_diario"); cursor.execute("DELETE FROM resumen_ventas_diario")
+    cursor.execute("INSERT INTO resumen_boletas_diario (fecha, vendedor_usuario, boletas, neto, iva, total) SELECT DATE(fecha), COALESCE(vendedor_usuario, ''), COUNT(*), SUM(neto), SUM(iva), SUM(total_boleta) FROM boletas GROUP BY DATE(fecha), COALESCE(vendedor_usuario, '')")
+    cursor.execute("INSERT INTO resumen_ventas_diario (fecha, vendedor_usuario, producto_id, cantidad, neto, iva) SELECT DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id, SUM(dv.cantidad), SUM(dv.subtotal), SUM(dv.subtotal) * %s FROM detalle_ventas dv JOIN boletas b ON b.id = dv.boleta_id GROUP BY DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id", (TASA_IVA,))
+
+def _migracion_indices_historial(cursor):
+    # Historial de un vendedor (WHERE vendedor ORDER BY fecha DESC, id DESC) y agrupado de admin (ORDER BY vendedor, fecha DESC, id DESC)
+    _crear_indice(cursor, "boletas", "idx_boletas_vendedor_fecha", "INDEX idx_boletas_vendedor_fecha (vendedor_usuario ASC, fecha DESC, id DESC)")
+    _crear_indice(cursor, "boletas", "idx_boletas_fecha", "INDEX idx_boletas_fecha (fecha)") # Historial general por fecha
+    _crear_indice(cursor, "detalle_ventas", "idx_detalle_producto_boleta", "INDEX idx_detalle_producto_boleta (producto_id, boleta_id)") # Filtro por producto
+
+def _migracion_usuario_admin(cursor):
+    cursor.execute("SELECT * FROM usuarios WHERE usuario = 'admin'")
+    if cursor.fetchone() is None:
+        cursor.execute("INSERT INTO usuarios (usuario, clave, rol) VALUES (%s, %s, %s)", ('admin', hashear_clave('admin'), 'admin'))
+
+def _migracion_busqueda_nombre(cursor):
+    if _existe_indice(cursor, "productos", "ft_productos_nombre"): return
+    try: cursor.execute("ALTER TABLE productos ADD FULLTEXT INDEX ft_productos_nombre (nombre) WITH PARSER ngram")
+    except mysql.connector.Error as err:
+        # Servidores sin el parser ngram (p. ej. MariaDB): índice FULLTEXT por palabras completas
+        print(f"ADVERTENCIA: Parser ngram no disponible ({err}); se usa FULLTEXT estándar.")
+        cursor.execute("ALTER TABLE productos ADD FULLTEXT INDEX ft_productos_nombre (nombre)")
+
+def _migracion_clave_idempotencia(cursor):
+    # Clave que la caja asigna al anotar la venta en su diario local: reenviarla tras un corte no duplica la boleta
+    if not _existe_columna(cursor, "boletas", "clave_idempotencia"): cursor.execute("ALTER TABLE boletas ADD COLUMN clave_idempotencia CHAR(32) NULL")
+    _crear_indice(cursor, "boletas", "uq_boletas_clave_idempotencia", "UNIQUE INDEX uq_boletas_clave_idempotencia (clave_idempotencia)")
+
+def _migracion_secuencias_codigo(cursor):
+    """Secuencia por prefijo para los códigos de producto, sembrada con el mayor número ya usado. Sirve para ambos backends."""
+    cursor.execute("CREATE TABLE IF NOT EXISTS secuencias_codigo (prefijo VARCHAR(20) NOT NULL PRIMARY KEY, siguiente INT NOT NULL)")
+    cursor.execute("SELECT prefijo FROM secuencias_codigo"); existentes = {fila[0] for fila in cursor.fetchall()}
+    cursor.executemany("INSERT INTO secuencias_codigo (prefijo, siguiente) VALUES (%s, %s)", [(prefijo, maximo + 1) for prefijo, maximo in _sufijos_maximos(cursor).items() if prefijo not in existentes])
+
+def _migracion_reservas_stock(cursor):
+    # version cambia con cada escritura de stock o reservas: las cajas detectan conflictos sin bloquear filas mientras leen
+    if not _existe_columna(cursor, "productos", "version"): cursor.execute("ALTER TABLE productos ADD COLUMN version INT NOT NULL DEFAULT 0")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reservas_stock (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            producto_id INT NOT NULL,
+            terminal VARCHAR(64) NOT NULL,
+            cantidad INT NOT NULL,
+            expira_en TIMESTAMP NOT NULL,
+            INDEX idx_reservas_producto (producto_id, expira_en),
+            INDEX idx_reservas_expira (expira_en)
+        )
+    """)
+
+def _migracion_cambios_productos(cursor):
+    # Cada escritura de productos anota aquí los ids que tocó; las cajas piden solo los cambios con id mayor al último visto
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cambios_productos (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            producto_id INT NOT NULL,
+            cambiado_en TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            INDEX idx_cambios_fecha (cambiado_en)
+        )
+    """)
+
+def _migracion_archivo_ventas(cursor):
+    # Boletas de meses cerrados que el archivado saca de las tablas activas: mismas columnas e índices (LIKE no copia las claves foráneas)
+    cursor.execute("CREATE TABLE IF NOT EXISTS boletas_archivo LIKE boletas")
+    cursor.execute("CREATE TABLE IF NOT EXISTS detalle_ventas_archivo LIKE detalle_ventas")
+
+def _migracion_vendedor_no_nulo(cursor):
+    # La paginación por clave del historial compara vendedor_usuario (> %s, = %s): una boleta con NULL no entra en ninguna página
+    for tabla in ("boletas", "boletas_archivo"):
+        cursor.execute("SELECT is_nullable FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = 'vendedor_usuario'", (tabla,)); fila = cursor.fetchone()
+        if fila is None or fila[0] != "YES": continue
+        cursor.execute(f"UPDATE {tabla} SET vendedor_usuario = '' WHERE vendedor_usuario IS NULL")
+        cursor.execute(f"ALTER TABLE {tabla} MODIFY vendedor_usuario VARCHAR(50) NOT NULL DEFAULT ''")
+
+MIGRACIONES = [
+    (1, "Tablas base", _migracion_tablas_base),
+    (2, "Columnas estado y código de productos", _migracion_estado_y_codigo),
+    (3, "Marca de actualización de productos", _migracion_actualizado_en),
+    (4, "Tablas de resumen diario para reportes", _migracion_resumen_diario),
+    (5, "Índices del historial de ventas", _migracion_indices_historial),
+    (6, "Índice de texto sobre el nombre de producto", _migracion_busqueda_nombre),
+    (7, "Usuario administrador inicial", _migracion_usuario_admin),
+    (8, "Clave de idempotencia de boletas", _migracion_clave_idempotencia),
+    (9, "Secuencias de códigos de producto", _migracion_secuencias_codigo),
+    (10, "Reservas de stock entre cajas", _migracion_reservas_stock),
+    (11, "Registro de cambios de productos", _migracion_cambios_productos),
+    (12, "Archivo de boletas de meses cerrados", _migracion_archivo_ventas),
+    (13, "Vendedor vacío en lugar de NULL en boletas", _migracion_vendedor_no_nulo),
+]
+
+def _migracion_sqlite_esquema(cursor):
+    """Esquema SQLite equivalente a las migraciones 1 a 8 de MySQL. Adopta el bazar.db heredado (productos sin código ni estado)."""
+    columnas_productos = {fila[1] for fila in cursor.execute("PRAGMA table_info(productos)").fetchall()}
+    heredada = bool(columnas_productos) and "codigo" not in columnas_productos
+    if heredada: cursor.execute("ALTER TABLE productos RENAME TO productos_heredada")
+    cursor.execute("CREATE TABLE IF NOT EXISTS usuarios (id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT UNIQUE NOT NULL, clave TEXT NOT NULL, rol TEXT NOT NULL CHECK (rol IN ('vendedor', 'admin')))")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS productos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT UNIQUE,
+            nombre TEXT UNIQUE NOT NULL,
+            precio DECIMAL(10,2) NOT NULL,
+            stock INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'activo' CHECK (estado IN ('activo', 'inactivo')),
+            actualizado_en TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+        )
+    """)
+    if heredada:
+        cursor.execute("INSERT INTO productos (id, nombre, precio, stock) SELECT id, nombre, precio, stock FROM productos_heredada"); cursor.execute("DROP TABLE productos_heredada")
+        _asignar_codigos_faltantes(cursor)
+    # Equivalente a ON UPDATE CURRENT_TIMESTAMP(6): la revalidación del catálogo depende de esta marca
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_productos_actualizado_en AFTER UPDATE ON productos FOR EACH ROW WHEN NEW.actualizado_en = OLD.actualizado_en
+        BEGIN UPDATE productos SET actualizado_en = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime') WHERE id = NEW.id; END
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS boletas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vendedor_usuario TEXT NOT NULL DEFAULT '',
+            neto DECIMAL(10,2) NOT NULL,
+            iva DECIMAL(10,2) NOT NULL,
+            total_boleta DECIMAL(10,2) NOT NULL,
+            fecha TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+            tipo_documento TEXT NOT NULL DEFAULT 'Boleta' CHECK (tipo_documento IN ('Boleta', 'Factura')),
+            cliente_rut TEXT,
+            cliente_nombre TEXT,
+            clave_idempotencia TEXT UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detalle_ventas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            boleta_id INTEGER NOT NULL REFERENCES boletas(id) ON DELETE CASCADE,
+            producto_id INTEGER NOT NULL REFERENCES productos(id),
+            cantidad INTEGER NOT NULL,
+            precio_unitario DECIMAL(10,2) NOT NULL,
+            subtotal DECIMAL(10,2) NOT NULL
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS resumen_boletas_diario (fecha DATE NOT NULL, vendedor_usuario TEXT NOT NULL DEFAULT '', boletas INTEGER NOT NULL DEFAULT 0, neto DECIMAL(14,2) NOT NULL DEFAULT 0, iva DECIMAL(14,2) NOT NULL DEFAULT 0, total DECIMAL(14,2) NOT NULL DEFAULT 0, PRIMARY KEY (fecha, vendedor_usuario))")
+    cursor.execute("CREATE TABLE IF NOT EXISTS resumen_ventas_diario (fecha DATE NOT NULL, vendedor_usuario TEXT NOT NULL DEFAULT '', producto_id INTEGER NOT NULL, cantidad INTEGER NOT NULL DEFAULT 0, neto DECIMAL(14,2) NOT NULL DEFAULT 0, iva DECIMAL(14,2) NOT NULL DEFAULT 0, PRIMARY KEY (fecha, vendedor_usuario, producto_id))")
+    for indice in ("idx_productos_actualizado_en ON productos (actualizado_en)", "idx_boletas_vendedor_fecha ON boletas (vendedor_usuario ASC, fecha DESC, id DESC)", "idx_boletas_fecha ON boletas (fecha)",
+                   "idx_detalle_boleta ON detalle_ventas (boleta_id)", "idx_detalle_producto_boleta ON detalle_ventas (producto_id, boleta_id)", "idx_resumen_ventas_producto ON resumen_ventas_diario (producto_id, fecha)"):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {indice}")
+    _migracion_usuario_admin(cursor)
+
+def _migracion_sqlite_reservas_stock(cursor):
+    if "version" not in {fila[1] for fila in cursor.execute("PRAGMA table_info(productos)").fetchall()}: cursor.execute("ALTER TABLE productos ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("CREATE TABLE IF NOT EXISTS reservas_stock (id INTEGER PRIMARY KEY AUTOINCREMENT, producto_id INTEGER NOT NULL, terminal TEXT NOT NULL, cantidad INTEGER NOT NULL, expira_en TIMESTAMP NOT NULL)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservas_producto ON reservas_stock (producto_id, expira_en)"); cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservas_expira ON reservas_stock (expira_en)")
+
+def _migracion_sqlite_cambios_productos(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS cambios_productos (id INTEGER PRIMARY KEY AUTOINCREMENT, producto_id INTEGER NOT NULL, cambiado_en TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')))")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cambios_fecha ON cambios_productos (cambiado_en)")
+
+def _migracion_sqlite_archivo_ventas(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS boletas_archivo (
+            id INTEGER PRIMARY KEY,
+            vendedor_usuario TEXT NOT NULL DEFAULT '',
+            neto DECIMAL(10,2) NOT NULL,
+            iva DECIMAL(10,2) NOT NULL,
+            total_boleta DECIMAL(10,2) NOT NULL,
+            fecha TIMESTAMP NOT NULL,
+            tipo_documento TEXT NOT NULL DEFAULT 'Boleta',
+            cliente_rut TEXT,
+            cliente_nombre TEXT,
+            clave_idempotencia TEXT UNIQUE
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS detalle_ventas_archivo (id INTEGER PRIMARY KEY, boleta_id INTEGER NOT NULL, producto_id INTEGER NOT NULL, cantidad INTEGER NOT NULL, precio_unitario DECIMAL(10,2) NOT NULL, subtotal DECIMAL(10,2) NOT NULL)")
+    for indice in ("idx_boletas_archivo_vendedor_fecha ON boletas_archivo (vendedor_usuario ASC, fecha DESC, id DESC)", "idx_boletas_archivo_fecha ON boletas_archivo (fecha)",
+                   "idx_detalle_archivo_boleta ON detalle_ventas_archivo (boleta_id)", "idx_detalle_archivo_producto_boleta ON detalle_ventas_archivo (producto_id, boleta_id)"):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {indice}")
+
+# Las versiones coinciden con MIGRACIONES: una migración nueva se agrega a ambas listas con el mismo número
+MIGRACIONES_SQLITE = [
+    (8, "Esquema completo en SQLite", _migracion_sqlite_esquema),
+    (9, "Secuencias de códigos de producto", _migracion_secuencias_codigo),
+    (10, "Reservas de stock entre cajas", _migracion_sqlite_reservas_stock),
+    (11, "Registro de cambios de productos", _migracion_sqlite_cambios_productos),
+    (12, "Archivo de boletas de meses cerrados", _migracion_sqlite_archivo_ventas),
+    (13, "Vendedor vacío en lugar de NULL en boletas", lambda cursor: None), # El esquema SQLite ya nace con vendedor_usuario NOT NULL DEFAULT ''
+]
+
+def aplicar_migraciones(conn):
+    """Aplica en orden las migraciones pendientes según la tabla schema_version. Devuelve la versión final."""
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INT PRIMARY KEY, descripcion VARCHAR(200) NOT NULL, aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    cursor.execute("SELECT GET_LOCK('bazar_migraciones', 60)") # Dos cajas que arrancan a la vez no migran en paralelo
+    cursor.fetchone()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version"); version_actual = cursor.fetchone()[0]
+        for version, descripcion, migracion in MIGRACIONES:
+            if version <= version_actual: continue
+            print(f"Aplicando migración {version}: {descripcion}...")
+            migracion(cursor)
+            cursor.execute("INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)", (version, descripcion)); conn.commit()
+            version_actual = version
+        return version_actual
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('bazar_migraciones')"); cursor.fetchone()
+
+def iniciar_bd():
+    """Verifica el esquema con una sola consulta y migra solo si está desactualizado. Devuelve la versión del esquema."""
+    return obtener_repositorio().iniciar()
+
+class StockInsuficienteError(Exception):
+    """La venta pide más unidades de las que hay. faltantes: lista de (producto_id, stock_actual, cantidad_pedida)."""
+    def __init__(self, faltantes):
+        super().__init__(f"Stock insuficiente para {len(faltantes)} producto(s).")
+        self.faltantes = faltantes
+
+class ReservaEnConflictoError(Exception):
+    """Otras cajas cambiaron el producto en cada intento de reservarlo (CONFIG.reservas.reintentos)."""
+
+def _anotar_cambios(cursor, ids):
+    """Anota en cambios_productos, dentro de la transacción en curso, los productos que esta modifica."""
+    if ids: cursor.execute(f"INSERT INTO cambios_productos (producto_id) VALUES {', '.join(['(%s)'] * len(ids))}", tuple(ids))
+
+def registrar_venta(conn, vendedor, lineas, tipo_doc="Boleta", cliente_rut=None, cliente_nombre=None, clave=None, fecha=None, reservas=None):
+    """Registra una venta en una transacción con un número fijo de viajes al servidor. Devuelve el id de la boleta."""
+    # Un solo UPDATE condicional descuenta el stock y bloquea las filas en orden de id: si alguna línea quedaría negativa no se aplica
+    # nada (StockInsuficienteError). Con `clave` es idempotente; `reservas` se borran y los resúmenes se suman en la misma transacción.
+    cantidades = {}
+    for prod_id, cantidad, _, _ in lineas: cantidades[prod_id] = cantidades.get(prod_id, 0) + cantidad
+    ids = sorted(cantidades); marcadores = ", ".join(["%s"] * len(ids))
+    caso = "CASE id " + " ".join(["WHEN %s THEN %s"] * len(ids)) + " END"; params_caso = [v for prod_id in ids for v in (prod_id, cantidades[prod_id])]
+    neto = sum(linea[3] for linea in lineas); iva = neto * TASA_IVA; total_boleta = neto + iva
+    repositorio = obtener_repositorio(); cursor = conn.cursor()
+    try:
+        if clave is not None:
+            # Un reenvío tardío puede llegar cuando su boleta ya pasó al archivo
+            cursor.execute("SELECT id FROM boletas WHERE clave_idempotencia = %s UNION ALL SELECT id FROM boletas_archivo WHERE clave_idempotencia = %s", (clave, clave)); existente = cursor.fetchone()
+            if existente: conn.rollback(); return existente[0]
+        cursor.execute(f"UPDATE productos SET stock = stock - {caso}, version = version + 1 WHERE id IN ({marcadores}) AND stock >= {caso}", (*params_caso, *ids, *params_caso))
+        if cursor.rowcount != len(ids):
+            conn.rollback()
+            cursor.execute(f"SELECT id, stock FROM productos WHERE id IN ({marcadores})", tuple(ids))
+            stock_actual = dict(cursor.fetchall())
+            raise StockInsuficienteError([(prod_id, stock_actual.get(prod_id, 0), cantidades[prod_id]) for prod_id in ids if stock_actual.get(prod_id, 0) < cantidades[prod_id]])
+        cursor.execute(f"INSERT INTO boletas (vendedor_usuario, neto, iva, total_boleta, tipo_documento, cliente_rut, cliente_nombre, fecha, clave_idempotencia) VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, {repositorio.AHORA}), %s)",
+                       (vendedor, neto, iva, total_boleta, tipo_doc, cliente_rut, cliente_nombre, fecha, clave))
+        boleta_id = cursor.lastrowid
+        cursor.executemany("INSERT INTO detalle_ventas (boleta_id, producto_id, cantidad, precio_unitario, subtotal) VALUES (%s, %s, %s, %s, %s)",
+                           [(boleta_id, prod_id, cantidad, precio, subtotal) for prod_id, cantidad, precio, subtotal in lineas])
+        cursor.execute(repositorio.SQL_RESUMEN_BOLETAS, (boleta_id,)); cursor.execute(repositorio.SQL_RESUMEN_VENTAS, (TASA_IVA, boleta_id))
+        if reservas: cursor.execute(f"DELETE FROM reservas_stock WHERE id IN ({', '.join(['%s'] * len(reservas))})", tuple(reservas))
+        _anotar_cambios(cursor, ids); conn.commit()
+        return boleta_id
+    except repositorio.Error:
+        conn.rollback(); raise
+
+class RepositorioMySQL:
+    """Acceso a datos sobre MySQL; RepositorioSQLite hereda las consultas portables y redefine solo el dialecto."""
+    nombre = "mysql"
+    remoto = False # True solo en RepositorioRemoto: las operaciones registradas con operacion_servicio viajan al servicio
+    AHORA = "CURRENT_TIMESTAMP"
+    GRANULARIDADES = {
+        "dia": "fecha",
+        "semana": "DATE_SUB(fecha, INTERVAL WEEKDAY(fecha) DAY)", # Lunes de la semana
+        "mes": "DATE_SUB(fecha, INTERVAL DAYOFMONTH(fecha) - 1 DAY)", # Primer día del mes
+    }
+    SQL_UPSERT_PRODUCTOS = "ON DUPLICATE KEY UPDATE precio = VALUES(precio), stock = VALUES(stock), estado = 'activo', version = version + 1"
+    SQL_IGNORAR_DUPLICADO = "ON DUPLICATE KEY UPDATE prefijo = prefijo"
+    SQL_EXPIRA_EN = "CURRENT_TIMESTAMP + INTERVAL %s SECOND" # Hora del servidor: los relojes de las cajas no tienen que coincidir
+    SQL_HACE = "CURRENT_TIMESTAMP - INTERVAL %s SECOND"
+    _SQL_COLUMNAS_CATALOGO = ("productos.id, codigo, nombre, precio, stock, estado, (SELECT COALESCE(SUM(r.cantidad), 0) FROM reservas_stock r WHERE r.producto_id = productos.id AND r.expira_en > {ahora}), "
+                              "actualizado_en")
+    _SQL_COLUMNAS_LINEAS = "b.id, b.fecha, b.vendedor_usuario, b.tipo_documento, b.cliente_rut, b.cliente_nombre, b.neto, b.iva, b.total_boleta, p.codigo, p.nombre, dv.cantidad, dv.precio_unitario, dv.subtotal"
+    _SQL_LINEAS_VENTA = "FROM {boletas} b JOIN {detalle} dv ON dv.boleta_id = b.id JOIN productos p ON p.id = dv.producto_id WHERE b.fecha >= %s AND b.fecha < %s"
+    # Tablas de boletas y detalle según estén en el archivo (True) o sean las activas (False)
+    TABLAS_VENTAS = {False: {"boletas": "boletas", "detalle": "detalle_ventas"}, True: {"boletas": "boletas_archivo", "detalle": "detalle_ventas_archivo"}}
+    _SQL_COLUMNAS_BOLETA = "id, vendedor_usuario, neto, iva, total_boleta, fecha, tipo_documento, cliente_rut, cliente_nombre, clave_idempotencia"
+    _SQL_COLUMNAS_DETALLE = "id, boleta_id, producto_id, cantidad, precio_unitario, subtotal"
+    SQL_RESUMEN_BOLETAS = ("INSERT INTO resumen_boletas_diario (fecha, vendedor_usuario, boletas, neto, iva, total) SELECT DATE(fecha), COALESCE(vendedor_usuario, ''), 1, neto, iva, total_boleta FROM boletas WHERE id = %s "
+                           "ON DUPLICATE KEY UPDATE boletas = boletas + 1, neto = neto + VALUES(neto), iva = iva + VALUES(iva), total = total + VALUES(total)")
+    SQL_RESUMEN_VENTAS = ("INSERT INTO resumen_ventas_diario (fecha, vendedor_usuario, producto_id, cantidad, neto, iva) SELECT DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id, SUM(dv.cantidad), SUM(dv.subtotal), SUM(dv.subtotal) * %s "
+                          "FROM detalle_ventas dv JOIN boletas b ON b.id = dv.boleta_id WHERE dv.boleta_id = %s GROUP BY DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id "
+                          "ON DUPLICATE KEY UPDATE cantidad = cantidad + VALUES(cantidad), neto = neto + VALUES(neto), iva = iva + VALUES(iva)")
+
+    def __init__(self, config=DB_CONFIG): self.pool = PoolConexiones(config)
+
+    @property
+    def Error(self): return mysql.connector.Error
+
+    def iniciar(self):
+        with self.pool.obtener(origen="iniciar_bd") as conn:
+            cursor = conn.cursor()
+            try: cursor.execute("SELECT MAX(version) FROM schema_version"); version = cursor.fetchone()[0] or 0
+            except mysql.connector.errors.ProgrammingError: version = 0 # Base de datos nueva: aún no existe schema_version
+            if version >= MIGRACIONES[-1][0]: return version
+            return aplicar_migraciones(conn)
+
+    def cerrar(self): self.pool.cerrar()
+
+    def columna_fecha(self, expresion, alias):
+        """Columna de tipo fecha calculada; el conector de MySQL ya la devuelve como date."""
+        return f"{expresion} AS {alias}"
+
+    def filtro_nombre_producto(self, texto):
+        """Subconsulta de ids de productos cuyo nombre contiene `texto`, con su parámetro."""
+        # Índice FULLTEXT ngram; una sola letra no alcanza un ngram y usa LIKE
+        if len(texto) >= 2: return "SELECT p.id FROM productos p WHERE MATCH(p.nombre) AGAINST (%s IN BOOLEAN MODE)", f'"{texto}"'
+        return "SELECT p.id FROM productos p WHERE p.nombre LIKE %s", f"%{texto}%"
+
+    def consultar(self, query, params=(), uno=False, origen="?"):
+        with self.pool.obtener(origen=origen) as conn:
+            cursor = conn.cursor(); cursor.execute(query, params)
+            return cursor.fetchone() if uno else cursor.fetchall()
+
+    def escribir(self, query, params=(), origen="?"):
+        """Ejecuta una escritura y la confirma. Devuelve el id generado (si lo hay)."""
+        with self.pool.obtener(origen=origen) as conn:
+            cursor = conn.cursor(); cursor.execute(query, params); conn.commit()
+            return cursor.lastrowid
+
+    # --- Productos ---
+    def _escribir_producto(self, query, params, prod_id=None, origen="?"):
+        """Como escribir, anotando en cambios_productos el producto `prod_id` (o el recién insertado) en la misma transacción."""
+        with self.pool.obtener(origen=origen) as conn:
+            cursor = conn.cursor(); cursor.execute(query, params); nuevo_id = cursor.lastrowid
+            _anotar_cambios(cursor, [prod_id if prod_id is not None else nuevo_id]); conn.commit()
+            return nuevo_id
+
+    def crear_producto(self, codigo, nombre, precio, stock):
+        return self._escribir_producto("INSERT INTO productos (codigo, nombre, precio, stock) VALUES (%s, %s, %s, %s)", (codigo, nombre, precio, stock), origen="crear_producto")
+
+    def actualizar_producto(self, prod_id, nombre, precio, stock):
+        self._escribir_producto("UPDATE productos SET nombre=%s, precio=%s, stock=%s, version = version + 1 WHERE id=%s", (nombre, precio, stock, prod_id), prod_id, origen="actualizar_producto")
+
+    def archivar_producto(self, prod_id):
+        self._escribir_producto("UPDATE productos SET estado = 'inactivo' WHERE id=%s", (prod_id,), prod_id, origen="archivar_producto")
+
+    def upsert_productos(self, filas):
+        """Inserta filas (codigo, nombre, precio, stock) en una sentencia; un nombre o código existente actualiza precio y stock."""
+        valores = ", ".join(["(%s, %s, %s, %s)"] * len(filas)); marcadores = ", ".join(["%s"] * len(filas))
+        with self.pool.obtener(origen="upsert_productos") as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"INSERT INTO productos (codigo, nombre, precio, stock) VALUES {valores} {self.SQL_UPSERT_PRODUCTOS}", [valor for fila in filas for valor in fila])
+            # Un producto que coincidió por nombre conserva su código anterior: se buscan por ambos
+            cursor.execute(f"INSERT INTO cambios_productos (producto_id) SELECT id FROM productos WHERE nombre IN ({marcadores}) OR codigo IN ({marcadores})", [fila[1] for fila in filas] + [fila[0] for fila in filas])
+            conn.commit()
+        return len(filas)
+
+    def revisar_cambios(self, marca=None):
+        """(marca nueva, filas, completas) de los productos cambiados desde `marca`; sin marca o tras una purga, el catálogo entero."""
+        # Se repiten los cambios de los últimos segundos: un id menor puede confirmarse después que uno mayor
+        columnas = self._SQL_COLUMNAS_CATALOGO.format(ahora=self.AHORA)
+        with self.pool.obtener(origen="catalogo.revalidar") as conn:
+            cursor = conn.cursor()
+            if marca is not None:
+                cursor.execute("SELECT MIN(id) FROM cambios_productos"); primero = cursor.fetchone()[0]
+                if primero is not None and primero > marca + 1: marca = None # La purga se llevó cambios que esta caja no vio
+            if marca is None:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM cambios_productos"); marca = cursor.fetchone()[0]
+                cursor.execute(f"SELECT {columnas} FROM productos"); return marca, cursor.fetchall(), True
+            cursor.execute(f"SELECT {columnas}, c.ultimo FROM productos JOIN (SELECT producto_id, MAX(id) AS ultimo FROM cambios_productos WHERE id > %s OR cambiado_en >= {self.SQL_HACE} GROUP BY producto_id) c "
+                           "ON c.producto_id = productos.id", (marca, int(CATALOGO_SOLAPE_REVALIDACION.total_seconds())))
+            filas = cursor.fetchall()
+            return max([marca] + [fila[-1] for fila in filas]), filas, False
+
+    def purgar_cambios(self, retencion=CAMBIOS_RETENCION):
+        """Borra del registro los cambios con más de `retencion` segundos."""
+        self.escribir(f"DELETE FROM cambios_productos WHERE cambiado_en < {self.SQL_HACE}", (retencion,), origen="purgar_cambios")
+
+    def reservar_codigos(self, cantidades):
+        """Reserva en una transacción `cantidad` números consecutivos por prefijo. Devuelve {prefijo: primer número}."""
+        prefijos = sorted(cantidades) # Todas las cajas bloquean en el mismo orden: sin interbloqueos
+        with self.pool.obtener(origen="reservar_codigos") as conn:
+            cursor = conn.cursor()
+            cursor.executemany(f"INSERT INTO secuencias_codigo (prefijo, siguiente) VALUES (%s, %s) {self.SQL_IGNORAR_DUPLICADO}", [(prefijo, 1) for prefijo in prefijos])
+            cursor.executemany("UPDATE secuencias_codigo SET siguiente = siguiente + %s WHERE prefijo = %s", [(cantidades[prefijo], prefijo) for prefijo in prefijos])
+            cursor.execute(f"SELECT prefijo, siguiente FROM secuencias_codigo WHERE prefijo IN ({', '.join(['%s'] * len(prefijos))})", prefijos); limites = dict(cursor.fetchall())
+            conn.commit()
+        return {prefijo: limites[prefijo] - cantidades[prefijo] for prefijo in prefijos}
+
+    def avanzar_secuencias(self, maximos):
+        """Deja cada secuencia por encima de {prefijo: número} ya usado por códigos escritos a mano o importados."""
+        with self.pool.obtener(origen="avanzar_secuencias") as conn:
+            cursor = conn.cursor()
+            cursor.executemany(f"INSERT INTO secuencias_codigo (prefijo, siguiente) VALUES (%s, %s) {self.SQL_IGNORAR_DUPLICADO}", [(prefijo, maximo + 1) for prefijo, maximo in maximos.items()])
+            cursor.executemany("UPDATE secuencias_codigo SET siguiente = CASE WHEN siguiente > %s THEN siguiente ELSE %s END WHERE prefijo = %s", [(maximo, maximo + 1, prefijo) for prefijo, maximo in maximos.items()])
+            conn.commit()
+
+    # --- Reservas de stock ---
+    def reservar_stock(self, producto_id, cantidad, terminal, duracion=CONFIG.reservas.duracion, reemplaza=None):
+        """Aparta `cantidad` unidades para `terminal` en lugar de la reserva `reemplaza`. Devuelve (id de la reserva, stock, reservado)."""
+        # Control optimista: la escritura solo se aplica si productos.version sigue igual; si otra caja escribió entre medio se reintenta.
+        # Bajar una reserva propia nunca falla por stock.
+        duracion = max(1, min(int(duracion), CONFIG.reservas.duracion)) # Tope del servidor: una caja no puede apartar stock por horas
+        with self.pool.obtener(origen="reservar_stock") as conn:
+            cursor = conn.cursor()
+            for _ in range(CONFIG.reservas.reintentos):
+                cursor.execute(f"SELECT p.stock, p.version, (SELECT COALESCE(SUM(r.cantidad), 0) FROM reservas_stock r WHERE r.producto_id = p.id AND r.expira_en > {self.AHORA} AND r.id <> %s), "
+                               "(SELECT COALESCE(SUM(r.cantidad), 0) FROM reservas_stock r WHERE r.id = %s) FROM productos p WHERE p.id = %s", (reemplaza or 0, reemplaza or 0, producto_id))
+                fila = cursor.fetchone()
+                if fila is None: conn.rollback(); raise StockInsuficienteError([(producto_id, 0, cantidad)])
+                stock, version, reservado, anterior = fila[0], fila[1], int(fila[2]), int(fila[3])
+                if cantidad > max(stock - reservado, anterior): conn.rollback(); raise StockInsuficienteError([(producto_id, stock - reservado, cantidad)])
+                cursor.execute("UPDATE productos SET version = version + 1 WHERE id = %s AND version = %s", (producto_id, version))
+                if cursor.rowcount == 0: conn.rollback(); continue # Otra caja escribió el producto después de la lectura
+                if reemplaza is not None: cursor.execute("DELETE FROM reservas_stock WHERE id = %s", (reemplaza,))
+                reserva_id = None
+                if cantidad > 0:
+                    cursor.execute(f"INSERT INTO reservas_stock (producto_id, terminal, cantidad, expira_en) VALUES (%s, %s, %s, {self.SQL_EXPIRA_EN})", (producto_id, terminal, cantidad, duracion)); reserva_id = cursor.lastrowid
+                _anotar_cambios(cursor, [producto_id]); conn.commit()
+                return reserva_id, stock, reservado + cantidad
+        raise ReservaEnConflictoError(f"El producto {producto_id} cambió en cada intento de reservarlo; intente de nuevo.")
+
+    def renovar_reservas(self, ids, duracion=CONFIG.reservas.duracion):
+        """Extiende las reservas aún vigentes; las ya vencidas no se reviven (sus unidades pueden estar en otro carrito)."""
+        if not ids: return
+        duracion = max(1, min(int(duracion), CONFIG.reservas.duracion)) # Mismo tope que reservar_stock
+        self.escribir(f"UPDATE reservas_stock SET expira_en = {self.SQL_EXPIRA_EN} WHERE id IN ({', '.join(['%s'] * len(ids))}) AND expira_en > {self.AHORA}", (duracion, *ids), origen="renovar_reservas")
+
+    def liberar_reservas(self, ids):
+        if not ids: return
+        with self.pool.obtener(origen="liberar_reservas") as conn:
+            cursor = conn.cursor(); cursor.execute(f"SELECT id, producto_id FROM reservas_stock WHERE id IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+            self._borrar_reservas(cursor, cursor.fetchall()); conn.commit()
+
+    def purgar_reservas_vencidas(self):
+        """Borra las reservas vencidas. Devuelve cuántas había."""
+        with self.pool.obtener(origen="purgar_reservas") as conn:
+            cursor = conn.cursor(); cursor.execute(f"SELECT id, producto_id FROM reservas_stock WHERE expira_en <= {self.AHORA}"); vencidas = cursor.fetchall()
+            if vencidas: self._borrar_reservas(cursor, vencidas); conn.commit()
+            return len(vencidas)
+
+    def _borrar_reservas(self, cursor, reservas):
+        """Borra reservas (id, producto_id) y anota sus productos para que las demás cajas vean el stock liberado."""
+        if not reservas: return
+        productos = sorted({producto_id for _, producto_id in reservas})
+        cursor.execute(f"DELETE FROM reservas_stock WHERE id IN ({', '.join(['%s'] * len(reservas))})", tuple(reserva_id for reserva_id, _ in reservas))
+        cursor.execute(f"UPDATE productos SET version = version + 1 WHERE id IN ({', '.join(['%s'] * len(productos))})", tuple(productos)); _anotar_cambios(cursor, productos)
+
+    # --- Usuarios ---
+    def buscar_usuario(self, usuario):
+        """(clave_hash, rol) del usuario, o None si no existe."""
+        return self.consultar("SELECT clave, rol FROM usuarios WHERE usuario=%s", (usuario,), uno=True, origen="buscar_usuario")
+
+    def listar_usuarios(self):
+        return self.consultar("SELECT id, usuario, rol FROM usuarios", origen="listar_usuarios")
+
+    def guardar_usuario(self, usuario, rol, clave_hash=None, user_id=None):
+        """Crea el usuario si user_id es None; si no, lo actualiza (la clave solo si viene una nueva)."""
+        if user_id is None: return self.escribir("INSERT INTO usuarios (usuario, clave, rol) VALUES (%s, %s, %s)", (usuario, clave_hash, rol), origen="guardar_usuario")
+        if clave_hash: self.escribir("UPDATE usuarios SET usuario=%s, clave=%s, rol=%s WHERE id=%s", (usuario, clave_hash, rol, user_id), origen="guardar_usuario")
+        else: self.escribir("UPDATE usuarios SET usuario=%s, rol=%s WHERE id=%s", (usuario, rol, user_id), origen="guardar_usuario")
+        return user_id
+
+    def actualizar_clave(self, usuario, clave_hash):
+        self.escribir("UPDATE usuarios SET clave=%s WHERE usuario=%s", (clave_hash, usuario), origen="actualizar_clave")
+
+    def eliminar_usuario(self, user_id):
+        self.escribir("DELETE FROM usuarios WHERE id=%s", (user_id,), origen="eliminar_usuario")
+
+    # --- Boletas y detalle ---
+    def obtener_boleta(self, boleta_id):
+        """(datos de la boleta, líneas vendidas), o (None, []); el archivo se consulta solo si no está en las tablas activas."""
+        for archivo in (False, True):
+            filas = self.consultar("SELECT b.fecha, b.vendedor_usuario, b.neto, b.iva, b.total_boleta, b.tipo_documento, b.cliente_rut, b.cliente_nombre, p.codigo, p.nombre, dv.cantidad, dv.precio_unitario, dv.subtotal "
+                                   "FROM {boletas} b LEFT JOIN {detalle} dv ON dv.boleta_id = b.id LEFT JOIN productos p ON p.id = dv.producto_id WHERE b.id = %s ORDER BY dv.id".format(**self.TABLAS_VENTAS[archivo]),
+                                   (boleta_id,), origen="obtener_boleta")
+            if filas: return filas[0][:8], [fila[8:] for fila in filas if fila[10] is not None]
+        return None, []
+
+    def registrar_ventas(self, ventas):
+        """Registra con una conexión ventas del diario de una caja. Devuelve (clave, boleta_id, None) o (clave, None, motivo) por venta."""
+        # El stock se verifica igual que en una venta en línea; los errores de conexión se propagan (las claves hacen seguro reenviar)
+        resultados = []
+        with self.pool.obtener(origen="sincronizador_ventas") as conn:
+            for clave, creada_en, vendedor, tipo_doc, cliente_rut, cliente_nombre, lineas, reservas in ventas:
+                try: resultados.append((clave, registrar_venta(conn, vendedor, lineas, tipo_doc, cliente_rut, cliente_nombre, clave=clave, fecha=creada_en, reservas=reservas), None))
+                except StockInsuficienteError as err:
+                    resultados.append((clave, None, "Stock insuficiente: " + ", ".join(f"producto {prod_id} (quedan {stock}, se vendieron {cantidad})" for prod_id, stock, cantidad in err.faltantes)))
+                except self.Error as err:
+                    if not conn.is_connected(): raise
+                    resultados.append((clave, None, str(err)))
+        return resultados
+
+    def particiones_ventas(self, desde=None, hasta=None):
+        """[True, False] si el archivo tiene boletas entre dos fechas (inclusive; None: sin límite), si no [False]."""
+        condiciones, params = [], []
+        if desde is not None: condiciones.append("fecha >= %s"); params.append(desde)
+        if hasta is not None: condiciones.append("fecha < %s"); params.append(hasta + timedelta(days=1))
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        return [True, False] if self.consultar(f"SELECT 1 FROM boletas_archivo{where} LIMIT 1", tuple(params), uno=True, origen="particiones_ventas") else [False]
+
+    def contar_lineas_venta(self, desde, hasta):
+        return sum(self.consultar(f"SELECT COUNT(*) {self._SQL_LINEAS_VENTA.format(**self.TABLAS_VENTAS[archivo])}", (desde, hasta + timedelta(days=1)), uno=True, origen="contar_lineas_venta")[0]
+                   for archivo in self.particiones_ventas(desde, hasta))
+
+    def iterar_lineas_venta(self, desde, hasta, lote=EXPORTACION_LOTE):
+        """Genera listas de hasta `lote` líneas vendidas entre dos fechas (inclusive), leídas del servidor a medida que se consumen."""
+        particiones = self.particiones_ventas(desde, hasta)
+        with self.pool.obtener(origen="iterar_lineas_venta") as conn:
+            cursor = self._cursor_sin_buffer(conn)
+            for archivo in particiones:
+                # idx_boletas_fecha entrega las boletas ya ordenadas por (fecha, id): el servidor no ordena millones de filas
+                cursor.execute(f"SELECT {self._SQL_COLUMNAS_LINEAS} {self._SQL_LINEAS_VENTA.format(**self.TABLAS_VENTAS[archivo])} ORDER BY b.fecha, b.id", (desde, hasta + timedelta(days=1)))
+                while True:
+                    filas = cursor.fetchmany(lote)
+                    if not filas: break
+                    yield filas
+
+    def pagina_lineas_venta(self, desde, hasta, despues=None, lote=EXPORTACION_LOTE // 4, archivo=False):
+        """Líneas de las `lote` boletas entre dos fechas que siguen a la clave `despues` (fecha, id); así pagina una caja remota."""
+        condicion, params = "", [desde, hasta + timedelta(days=1)]
+        if despues is not None: fecha, boleta_id = despues; condicion = " AND (fecha > %s OR (fecha = %s AND id > %s))"; params += [fecha, fecha, boleta_id]
+        return self.consultar(("SELECT {columnas} FROM (SELECT id FROM {boletas} WHERE fecha >= %s AND fecha < %s{condicion} ORDER BY fecha, id LIMIT %s) pagina "
+                               "JOIN {boletas} b ON b.id = pagina.id JOIN {detalle} dv ON dv.boleta_id = b.id JOIN productos p ON p.id = dv.producto_id ORDER BY b.fecha, b.id, dv.id").format(columnas=self._SQL_COLUMNAS_LINEAS, condicion=condicion, **self.TABLAS_VENTAS[bool(archivo)]),
+                              (*params, lote), origen="pagina_lineas_venta")
+
+    def archivar_ventas(self, antes_de, lote=ARCHIVO_LOTE):
+        """Mueve al archivo en una transacción hasta `lote` boletas anteriores a `antes_de`. Devuelve cuántas movió."""
+        # La boleta de id más alto nunca se mueve: MySQL 5.7 recalcula AUTO_INCREMENT desde MAX(id) al reiniciar y repetiría ids del archivo
+        with self.pool.obtener(origen="archivar_ventas") as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT id FROM boletas WHERE fecha < %s AND id < (SELECT MAX(id) FROM boletas) ORDER BY fecha, id LIMIT %s", (antes_de, lote))
+                ids = tuple(fila[0] for fila in cursor.fetchall())
+                if not ids: conn.rollback(); return 0
+                marcadores = ", ".join(["%s"] * len(ids))
+                cursor.execute(f"INSERT INTO boletas_archivo ({self._SQL_COLUMNAS_BOLETA}) SELECT {self._SQL_COLUMNAS_BOLETA} FROM boletas WHERE id IN ({marcadores})", ids)
+                cursor.execute(f"INSERT INTO detalle_ventas_archivo ({self._SQL_COLUMNAS_DETALLE}) SELECT {self._SQL_COLUMNAS_DETALLE} FROM detalle_ventas WHERE boleta_id IN ({marcadores})", ids)
+                cursor.execute(f"DELETE FROM detalle_ventas WHERE boleta_id IN ({marcadores})", ids); cursor.execute(f"DELETE FROM boletas WHERE id IN ({marcadores})", ids)
+                conn.commit()
+                return len(ids)
+            except self.Error:
+                conn.rollback(); raise
+
+    def _cursor_sin_buffer(self, conn):
+        return conn.cursor(buffered=False) # Las conexiones del pool usan cursores con buffer; este lee del socket por partes
+
+class RepositorioSQLite(RepositorioMySQL):
+    """El mismo repositorio sobre un archivo SQLite local: una caja sola, sin servidor y con consultas de microsegundos."""
+    nombre = "sqlite"
+    Error = sqlite3.Error
+    AHORA = "datetime('now', 'localtime')"
+    GRANULARIDADES = {
+        "dia": "fecha",
+        "semana": "date(fecha, '-' || ((CAST(strftime('%w', fecha) AS INTEGER) + 6) % 7) || ' days')", # Lunes de la semana
+        "mes": "date(fecha, 'start of month')",
+    }
+    SQL_UPSERT_PRODUCTOS = ("ON CONFLICT (nombre) DO UPDATE SET precio = excluded.precio, stock = excluded.stock, estado = 'activo', version = version + 1 "
+                            "ON CONFLICT (codigo) DO UPDATE SET precio = excluded.precio, stock = excluded.stock, estado = 'activo', version = version + 1")
+    SQL_IGNORAR_DUPLICADO = "ON CONFLICT (prefijo) DO NOTHING"
+    SQL_EXPIRA_EN = "datetime('now', 'localtime', '+' || %s || ' seconds')"
+    SQL_HACE = "datetime('now', 'localtime', '-' || %s || ' seconds')"
+    SQL_RESUMEN_BOLETAS = ("INSERT INTO resumen_boletas_diario (fecha, vendedor_usuario, boletas, neto, iva, total) SELECT DATE(fecha), COALESCE(vendedor_usuario, ''), 1, neto, iva, total_boleta FROM boletas WHERE id = %s "
+                           "ON CONFLICT (fecha, vendedor_usuario) DO UPDATE SET boletas = boletas + 1, neto = neto + excluded.neto, iva = iva + excluded.iva, total = total + excluded.total")
+    SQL_RESUMEN_VENTAS = ("INSERT INTO resumen_ventas_diario (fecha, vendedor_usuario, producto_id, cantidad, neto, iva) SELECT DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id, SUM(dv.cantidad), SUM(dv.subtotal), SUM(dv.subtotal) * %s "
+                          "FROM detalle_ventas dv JOIN boletas b ON b.id = dv.boleta_id WHERE dv.boleta_id = %s GROUP BY DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id "
+                          "ON CONFLICT (fecha, vendedor_usuario, producto_id) DO UPDATE SET cantidad = cantidad + excluded.cantidad, neto = neto + excluded.neto, iva = iva + excluded.iva")
+
+    def __init__(self, ruta=SQLITE_RUTA):
+        _registrar_tipos_sqlite(); self.pool = PoolSQLite(ruta)
+
+    def iniciar(self):
+        with self.pool.obtener(origen="iniciar_bd") as conn:
+            cursor = conn.cursor()
+            try: version = cursor.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+            except sqlite3.OperationalError: version = 0
+            if version >= MIGRACIONES_SQLITE[-1][0]: return version
+            # BEGIN IMMEDIATE toma el bloqueo de escritura: otro proceso que arranque a la vez espera en vez de migrar en paralelo
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, descripcion TEXT NOT NULL, aplicada_en TIMESTAMP DEFAULT (datetime('now', 'localtime')))")
+                version = cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+                for numero, descripcion, migracion in MIGRACIONES_SQLITE:
+                    if numero <= version: continue
+                    print(f"Aplicando migración {numero}: {descripcion}...")
+                    migracion(cursor); cursor.execute("INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)", (numero, descripcion)); version = numero
+                conn.commit(); return version # En SQLite el DDL es transaccional: o quedan todas las migraciones o ninguna
+            except BaseException:
+                conn.rollback(); raise
+
+    def columna_fecha(self, expresion, alias):
+        return f'{expresion} AS "{alias} [DATE]"' # El sufijo hace que PARSE_COLNAMES convierta el texto a date
+
+    def filtro_nombre_producto(self, texto):
+        return "SELECT p.id FROM productos p WHERE p.nombre LIKE %s", f"%{texto}%"
+
+    def _cursor_sin_buffer(self, conn): return conn.cursor() # sqlite3 ya avanza fila a fila con cada fetchmany
+
+class ErrorServicio(Exception):
+    """El servicio no respondió o no pudo completar la operación (incluidos los errores de su base de datos)."""
+
+def _a_json(valor):
+    """Valor listo para JSON sin perder tipos: fechas, Decimal de MySQL y diccionarios con claves que no son texto (vendedor None)."""
+    if isinstance(valor, datetime): return {"$fecha_hora": valor.isoformat()}
+    if isinstance(valor, date): return {"$fecha": valor.isoformat()}
+    if isinstance(valor, decimal.Decimal): return float(valor)
+    if isinstance(valor, (list, tuple)): return [_a_json(v) for v in valor]
+    if isinstance(valor, dict):
+        if all(isinstance(clave, str) for clave in valor): return {clave: _a_json(v) for clave, v in valor.items()}
+        return {"$dict": [[_a_json(clave), _a_json(v)] for clave, v in valor.items()]}
+    return valor
+
+def _desde_json(objeto):
+    if "$fecha_hora" in objeto: return datetime.fromisoformat(objeto["$fecha_hora"])
+    if "$fecha" in objeto: return date.fromisoformat(objeto["$fecha"])
+    if "$dict" in objeto: return {clave: valor for clave, valor in objeto["$dict"]}
+    return objeto
+
+def codificar_json(valor): return json.dumps(_a_json(valor), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decodificar_json(datos): return json.loads(datos, object_hook=_desde_json)
+
+class ClienteServicio:
+    """Cliente HTTP/JSON de servicio.py con una conexión keep-alive por hilo; ocupa el lugar del pool en RepositorioRemoto."""
+    def __init__(self, url=SERVICIO_URL, token=SERVICIO_TOKEN, timeout=SERVICIO_TIMEOUT):
+        partes = urlsplit(url)
+        self.url, self.host, self.puerto, self.token, self.timeout = url, partes.hostname or "127.0.0.1", partes.port or 80, token, timeout
+        self._local = threading.local(); self._lock = threading.Lock(); self._conexiones = []
+        self.contadores = Counter()
+
+    def _contar(self, contador):
+        with self._lock: self.contadores[contador] += 1
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http_client.HTTPConnection(self.host, self.puerto, timeout=self.timeout)
+            with self._lock: self._conexiones.append(conn); self.contadores["creadas"] += 1
+        return conn
+
+    def _descartar(self):
+        conn, self._local.conn = getattr(self._local, "conn", None), None
+        if conn is None: return
+        conn.close()
+        with self._lock:
+            if conn in self._conexiones: self._conexiones.remove(conn)
+
+    def llamar(self, operacion, args=(), kwargs=None):
+        """Ejecuta `operacion` en el servicio; los rechazos de stock llegan como sus excepciones y lo demás como ErrorServicio."""
+        cuerpo = codificar_json({"args": list(args), "kwargs": kwargs or {}}); cabeceras = {"Content-Type": "application/json", "X-Bazar-Token": self.token}
+        inicio = time.perf_counter()
+        for intento in range(2):
+            reutilizada = getattr(self._local, "conn", None) is not None; conn = self._conexion()
+            try:
+                conn.request("POST", f"/op/{operacion}", cuerpo, cabeceras); respuesta = conn.getresponse(); estado, datos = respuesta.status, respuesta.read()
+                break
+            except (ConnectionResetError, BrokenPipeError) as err:
+                self._descartar()
+                # Una conexión que estuvo inactiva pudo cerrarla el servicio: se reintenta una vez con una nueva
+                if intento or not reutilizada: self._contar("errores"); raise ErrorServicio(f"El servicio {self.url} cortó la conexión: {err}") from err
+                self._contar("reconexiones")
+            except (OSError, http_client.HTTPException) as err:
+                self._descartar(); self._contar("errores"); raise ErrorServicio(f"No se pudo conectar con el servicio {self.url}: {err}") from err
+        self._contar("llamadas")
+        try: respuesta = decodificar_json(datos)
+        except ValueError: self._contar("errores"); raise ErrorServicio(f"Respuesta inválida del servicio (HTTP {estado}).") from None
+        if estado == 200:
+            resultado = respuesta["resultado"]
+            instrumentacion.registrar("servicio", operacion, time.perf_counter() - inicio, inicio, len(resultado) if isinstance(resultado, list) else 1)
+            return resultado
+        self._contar("errores"); mensaje = respuesta.get("error", f"HTTP {estado}")
+        if respuesta.get("tipo") == "stock": raise StockInsuficienteError([tuple(faltante) for faltante in respuesta["faltantes"]])
+        if respuesta.get("tipo") == "conflicto": raise ReservaEnConflictoError(mensaje)
+        raise ErrorServicio(mensaje)
+
+    def cerrar(self):
+        with self._lock: conexiones, self._conexiones = self._conexiones, []
+        for conn in conexiones: conn.close()
+
+    def resumen(self):
+        with self._lock: c = dict(self.contadores); abiertas = len(self._conexiones)
+        return f"Servicio {self.url}: {c.get('llamadas', 0)} llamadas, {abiertas} conexiones abiertas ({c.get('creadas', 0)} creadas), {c.get('reconexiones', 0)} reconexiones, {c.get('errores', 0)} errores"
+
+# Métodos del repositorio que el servicio acepta de una caja remota (nombre -> es de solo lectura). consultar y
+# escribir quedan fuera: el servicio nunca ejecuta SQL armado en una caja. Los de usuarios también: buscar_usuario
+# entrega el hash de la clave (las cajas remotas usan la operación usuarios.verificar_credenciales) y los usuarios
+# se administran en el equipo del servicio, no desde una caja que solo tiene el token compartido.
+METODOS_REPOSITORIO = {
+    "iniciar": False, "revisar_cambios": True, "purgar_cambios": False, "crear_producto": False, "actualizar_producto": False, "archivar_producto": False,
+    "upsert_productos": False, "reservar_codigos": False, "avanzar_secuencias": False, "reservar_stock": False, "renovar_reservas": False,
+    "liberar_reservas": False, "purgar_reservas_vencidas": False, "obtener_boleta": True, "particiones_ventas": True, "contar_lineas_venta": True, "pagina_lineas_venta": True,
+    "registrar_ventas": False,
+}
+
+def resolver_operacion(nombre):
+    """(función, es_lectura) de una operación que el servicio acepta de una caja remota, o (None, False) si no la expone."""
+    if nombre.startswith("repositorio."):
+        metodo = nombre[len("repositorio."):]
+        if metodo not in METODOS_REPOSITORIO: return None, False
+        return getattr(obtener_repositorio(), metodo), METODOS_REPOSITORIO[metodo]
+    return OPERACIONES_SERVICIO.get(nombre, (None, False))
+
+class RepositorioRemoto:
+    """Repositorio de una caja sin acceso a la base: cada método viaja como operación a servicio.py."""
+    nombre = "remoto"
+    remoto = True
+    Error = ErrorServicio
+
+    def __init__(self, url=SERVICIO_URL, token=SERVICIO_TOKEN): self.pool = ClienteServicio(url, token)
+
+    def llamar(self, operacion, *args, **kwargs): return self.pool.llamar(operacion, args, kwargs)
+
+    def __getattr__(self, nombre):
+        if nombre not in METODOS_REPOSITORIO: raise AttributeError(f"El servicio no expone '{nombre}'.")
+        return functools.partial(self.llamar, f"repositorio.{nombre}")
+
+    def iterar_lineas_venta(self, desde, hasta, lote=EXPORTACION_LOTE // 4):
+        """Mismo contrato que en los repositorios locales, pidiendo páginas de `lote` boletas por clave (fecha, id)."""
+        for archivo in self.particiones_ventas(desde, hasta):
+            despues = None
+            while True:
+                filas = self.pagina_lineas_venta(desde, hasta, despues, lote, archivo)
+                if not filas: break
+                yield filas; despues = (filas[-1][1], filas[-1][0])
+
+    def cerrar(self): self.pool.cerrar()
+
+
+# ==============================================================================
+# 3.1 CARGA DE DATOS EN SEGUNDO PLANO
+# ==============================================================================
+class IndicadorCarga:
+    """Etiqueta "Cargando..." superpuesta sobre un widget mientras hay una consulta en curso."""
+    def __init__(self, parent, texto="Cargando..."):
+        self.label = ctk.CTkLabel(master=parent, text=texto, font=("Roboto", 14, "bold"), fg_color=("gray80", "gray25"), corner_radius=8, padx=12, pady=6)
+
+    def mostrar(self):
+        if self.label.winfo_exists(): self.label.place(relx=0.5, rely=0.5, anchor="center"); self.label.lift()
+
+    def ocultar(self):
+        if self.label.winfo_exists(): self.label.place_forget()
+
+class BarraProgreso:
+    """Barra de progreso que un hilo de trabajo alimenta con avanzar(fraccion); sirve como `indicador` de CargadorDatos."""
+    def __init__(self, parent, **opciones_pack):
+        self.barra = ctk.CTkProgressBar(master=parent); self.barra.set(0)
+        self._opciones_pack = opciones_pack; self._fraccion = 0.0; self._activa = False
+
+    def avanzar(self, fraccion): self._fraccion = fraccion # Solo guarda el valor: se puede llamar desde cualquier hilo
+
+    def mostrar(self):
+        self._fraccion, self._activa = 0.0, True
+        if self.barra.winfo_exists(): self.barra.set(0); self.barra.pack(**self._opciones_pack); self._redibujar()
+
+    def ocultar(self):
+        self._activa = False
+        if self.barra.winfo_exists(): self.barra.pack_forget()
+
+    def _redibujar(self):
+        if not self._activa or not self.barra.winfo_exists(): return
+        self.barra.set(self._fraccion); root.after(100, self._redibujar)
+
+class CargadorDatos:
+    """Ejecuta consultas en hilos de trabajo y entrega al hilo de Tk solo el resultado más reciente de cada canal."""
+    def __init__(self, hilos=CONFIG.carga.hilos):
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="bazar-datos")
+        self._resultados = queue.Queue()
+        self._contador = itertools.count(1)
+        self._vigente = {} # canal -> token de la solicitud más reciente
+        self._pendientes = {} # token -> (canal, futuro, al_terminar, al_fallar, indicador)
+        self._sondeo_id = None
+
+    def ejecutar(self, canal, funcion, al_terminar, al_fallar=None, indicador=None, persistente=False):
+        """Corre funcion() en un hilo de trabajo y al_terminar(resultado) en el de Tk; las persistentes sobreviven al cambio de vista."""
+        self.cancelar(canal)
+        token = next(self._contador); self._vigente[canal] = token
+        if indicador: indicador.mostrar()
+        futuro = self._executor.submit(self._trabajo, token, funcion)
+        self._pendientes[token] = (canal, futuro, al_terminar, al_fallar, indicador, persistente)
+        if self._sondeo_id is None: self._sondeo_id = root.after(CONFIG.carga.intervalo_sondeo_ms, self._sondear)
+        return token
+
+    def _trabajo(self, token, funcion):
+        try: self._resultados.put((token, True, funcion()))
+        except Exception as err: self._resultados.put((token, False, err))
+
+    def _sondear(self):
+        self._sondeo_id = None
+        while True:
+            try: token, exito, valor = self._resultados.get_nowait()
+            except queue.Empty: break
+            entrada = self._pendientes.pop(token, None)
+            if entrada is None: continue # Cancelada: el usuario ya salió de la vista
+            canal, _, al_terminar, al_fallar, indicador, _ = entrada
+            if self._vigente.get(canal) != token: continue # Llegó una solicitud más nueva en este canal
+            del self._vigente[canal]
+            if indicador: indicador.ocultar()
+            if exito: al_terminar(valor)
+            elif al_fallar: al_fallar(valor)
+            else: messagebox.showerror("Error de DB", f"No se pudo cargar la información: {valor}")
+        if self._pendientes: self._sondeo_id = root.after(CONFIG.carga.intervalo_sondeo_ms, self._sondear)
+
+    def cancelar(self, canal=None, incluir_persistentes=False):
+        """Cancela las solicitudes de un canal, o todas las no persistentes si canal es None."""
+        for token, (canal_pend, futuro, _, _, indicador, persistente) in list(self._pendientes.items()):
+            if canal == canal_pend or (canal is None and (incluir_persistentes or not persistente)):
+                futuro.cancel(); del self._pendientes[token]; self._vigente.pop(canal_pend, None)
+                if indicador: indicador.ocultar()
+        if canal is not None: self._vigente.pop(canal, None)
+
+    def cerrar(self):
+        self.cancelar(incluir_persistentes=True); self._executor.shutdown(wait=False, cancel_futures=True)
+
+cargador = CargadorDatos()
+
+class TreeviewPaginado:
+    """Llena un Treeview por páginas (paginación por clave) a medida que el usuario se desplaza; conserva max_paginas páginas."""
+    def __init__(self, tree, scrollbar, canal, obtener_pagina, clave_fila, insertar_fila, indicador=None, agrupado=False, tamano_pagina=TAMANO_PAGINA, max_paginas=MAX_PAGINAS_EN_VISTA, margen=MARGEN_PRECARGA):
+        self.tree, self.scrollbar, self.canal, self.indicador, self.agrupado = tree, scrollbar, canal, indicador, agrupado
+        self.obtener_pagina, self.clave_fila, self.insertar_fila = obtener_pagina, clave_fila, insertar_fila
+        self.tamano_pagina, self.max_paginas, self.margen = tamano_pagina, max_paginas, margen
+        self._paginas = deque() # [cursor_inicio, iids] de cada página presente en el Treeview
+        self._anteriores = [] # cursores de inicio de las páginas descartadas por arriba
+        self._cursor_fin = None; self._fin = False; self._cargando = False; self._generacion = 0; self._total_filas = 0
+        tree.configure(yscrollcommand=self._al_desplazar); scrollbar.configure(command=tree.yview)
+
+    def reiniciar(self, obtener_pagina=None):
+        if obtener_pagina: self.obtener_pagina = obtener_pagina
+        self._generacion += 1
+        self.tree.delete(*self.tree.get_children())
+        self._paginas.clear(); self._anteriores.clear(); self._cursor_fin = None; self._fin = False; self._total_filas = 0
+        self._cargar(None, al_final=True)
+
+    def _cargar(self, cursor, al_final):
+        self._cargando = True; generacion = self._generacion; obtener_pagina, limite = self.obtener_pagina, self.tamano_pagina
+        def al_terminar(filas):
+            if generacion != self._generacion: return
+            self._cargando = False
+            with instrumentacion.tramo("treeview", self.canal, filas=len(filas)): self._agregar_pagina(cursor, filas, al_final)
+        def al_fallar(err):
+            if generacion == self._generacion: self._cargando = False
+            messagebox.showerror("Error de DB", f"No se pudo cargar la información: {err}")
+        cargador.ejecutar(self.canal, lambda: obtener_pagina(cursor, limite), al_terminar, al_fallar, indicador=self.indicador if not self._paginas else None)
+
+    def _agregar_pagina(self, cursor, filas, al_final):
+        primero = self.tree.yview()[0]; top = primero * self._total_filas
+        if al_final:
+            if len(filas) < self.tamano_pagina: self._fin = True
+            if not filas: return
+            self._paginas.append([cursor, [self.insertar_fila(fila, "end") for fila in filas]]); self._cursor_fin = self.clave_fila(filas[-1])
+            if len(self._paginas) > self.max_paginas:
+                antes = self._contar_filas(); cursor_descartado, iids = self._paginas.popleft()
+                self._anteriores.append(cursor_descartado); self._quitar_filas(iids); top -= antes - self._contar_filas()
+        else:
+            self._anteriores.pop()
+            if not filas: return
+            antes = self._contar_filas(); iids = [self.insertar_fila(fila, 0) for fila in reversed(filas)]; iids.reverse()
+            self._paginas.appendleft([cursor, iids]); top += self._contar_filas() - antes
+            if len(self._paginas) > self.max_paginas:
+                cursor_descartado, iids = self._paginas.pop()
+                self._quitar_filas(iids); self._cursor_fin = cursor_descartado; self._fin = False
+        self._total_filas = self._contar_filas()
+        if self._total_filas: self.tree.yview_moveto(max(0.0, top / self._total_filas))
+
+    def quitar_fila(self, iid):
+        """Saca una fila que dejó de cumplir el filtro de la vista (por ejemplo, un producto que otra caja archivó)."""
+        for pagina in self._paginas:
+            if iid in pagina[1]: pagina[1].remove(iid); self._quitar_filas([iid]); self._total_filas = self._contar_filas(); return
+
+    def _quitar_filas(self, iids):
+        padres = {self.tree.parent(iid) for iid in iids} if self.agrupado else ()
+        self.tree.delete(*iids)
+        for padre in padres:
+            if padre and not self.tree.get_children(padre): self.tree.delete(padre)
+
+    def _contar_filas(self):
+        hijos = self.tree.get_children()
+        if not self.agrupado: return len(hijos)
+        return len(hijos) + sum(len(self.tree.get_children(padre)) for padre in hijos)
+
+    def _al_desplazar(self, primero, ultimo):
+        self.scrollbar.set(primero, ultimo)
+        if self._cargando or not self.tree.winfo_exists(): return
+        primero, ultimo = float(primero), float(ultimo)
+        if not self._fin and (1.0 - ultimo) * self._total_filas <= self.margen: self._cargar(self._cursor_fin, al_final=True)
+        elif self._anteriores and primero * self._total_filas <= self.margen: self._cargar(self._anteriores[-1], al_final=False)
+
+# ==============================================================================
+# 3.2 CATÁLOGO DE PRODUCTOS EN MEMORIA
+# ==============================================================================
+class ProductoCatalogo:
+    __slots__ = ("id", "codigo", "nombre", "precio", "stock", "estado", "reservado")
+    def __init__(self, id, codigo, nombre, precio, stock, estado, reservado=0):
+        self.id, self.codigo, self.nombre, self.precio, self.stock, self.estado, self.reservado = id, codigo, nombre, precio, stock, estado, reservado
+
+    @property
+    def disponible(self): return self.stock - self.reservado # Lo que aún no está en el carrito de ninguna caja
+
+    def como_fila(self): return (self.id, self.codigo, self.nombre, self.precio, self.stock)
+
+class CatalogoProductos:
+    """Caché del catálogo por id y por código; los cambios de otras cajas llegan por el registro cambios_productos."""
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.por_id = {}; self.por_codigo = {}
+        self._activos = None # Lista de activos ordenada por nombre; se reconstruye solo tras un cambio
+        self._marca = None; self._ultima_revalidacion = 0.0; self._ultima_purga = time.monotonic()
+        self._oyentes = []
+
+    def suscribir(self, oyente):
+        """oyente(ids) se llama tras cada cambio con los ids modificados, o con None si se recargó todo. Puede llamarse desde un hilo de trabajo."""
+        self._oyentes.append(oyente)
+
+    def _notificar(self, ids):
+        for oyente in self._oyentes: oyente(ids)
+
+    def revalidar(self, forzar=False):
+        """Sincroniza con el servidor. Devuelve los ids que cambiaron (todos si se recargó el catálogo)."""
+        if not forzar and self._marca is not None and time.monotonic() - self._ultima_revalidacion < CATALOGO_INTERVALO_REVALIDACION: return []
+        repositorio = obtener_repositorio()
+        marca, filas, completas = repositorio.revisar_cambios(self._marca)
+        self._ultima_revalidacion = time.monotonic()
+        with self._lock:
+            if completas: self._reemplazar(filas); cambios = list(self.por_id)
+            else: cambios = [fila[0] for fila in filas if self._guardar(fila)] # Los cambios repetidos por el solape no cuentan
+            self._marca = marca
+        if cambios: self._notificar(None if completas else cambios)
+        if time.monotonic() - self._ultima_purga >= CAMBIOS_INTERVALO_PURGA: self._ultima_purga = time.monotonic(); repositorio.purgar_cambios()
+        return cambios
+
+    def _reemplazar(self, filas):
+        self.por_id.clear(); self.por_codigo.clear()
+        for fila in filas: self._guardar(fila)
+        self._activos = None
+
+    def _guardar(self, fila):
+        """Guarda una fila del catálogo. Devuelve False si el producto ya estaba igual."""
+        prod_id, codigo, nombre, precio, stock, estado, reservado = fila[:7]; reservado = int(reservado)
+        producto = self.por_id.get(prod_id)
+        if producto is None: producto = self.por_id[prod_id] = ProductoCatalogo(prod_id, codigo, nombre, precio, stock, estado, reservado)
+        else:
+            if (producto.codigo, producto.nombre, producto.precio, producto.stock, producto.estado, producto.reservado) == (codigo, nombre, precio, stock, estado, reservado): return False
+            if producto.codigo != codigo: self.por_codigo.pop(producto.codigo, None)
+            producto.codigo, producto.nombre, producto.precio, producto.stock, producto.estado, producto.reservado = codigo, nombre, precio, stock, estado, reservado
+        if codigo: self.por_codigo[codigo] = producto
+        self._activos = None
+        return True
+
+    def todos(self):
+        """Copia de todos los productos (activos e inactivos), segura para recorrer desde un hilo de trabajo."""
+        with self._lock: return list(self.por_id.values())
+
+    def actualizar(self, prod_id, **campos):
+        """Aplica en la caché una escritura ya confirmada en la base de datos."""
+        with self._lock:
+            producto = self.por_id.get(prod_id)
+            if producto is None:
+                if "nombre" not in campos: return
+                producto = ProductoCatalogo(prod_id, campos.get("codigo"), campos["nombre"], campos.get("precio", 0), campos.get("stock", 0), campos.get("estado", "activo"))
+            fila = [producto.id, producto.codigo, producto.nombre, producto.precio, producto.stock, producto.estado, producto.reservado]
+            for i, campo in enumerate(ProductoCatalogo.__slots__):
+                if campo in campos: fila[i] = campos[campo]
+            self._guardar(fila)
+        self._notificar([prod_id])
+
+    def descontar_stock(self, cantidades, liberadas=None):
+        """Descuenta una venta propia; `liberadas` son las unidades que esa venta tenía reservadas y dejan de contarse dos veces."""
+        liberadas = liberadas or {}
+        with self._lock:
+            for prod_id, cantidad in cantidades.items():
+                producto = self.por_id.get(prod_id)
+                if producto is not None: producto.stock -= cantidad; producto.reservado = max(0, producto.reservado - liberadas.get(prod_id, 0))
+        self._notificar(list(cantidades))
+
+    def obtener(self, prod_id):
+        if self._marca is None: self.revalidar(forzar=True)
+        with self._lock: return self.por_id.get(prod_id)
+
+    def activos(self):
+        with self._lock:
+            if self._activos is None: self._activos = sorted((p for p in self.por_id.values() if p.estado == 'activo'), key=lambda p: p.nombre)
+            return self._activos
+
+    def pagina_activos(self, ultimo_nombre, limite):
+        activos = self.activos()
+        inicio = 0 if ultimo_nombre is None else bisect.bisect_right(activos, ultimo_nombre, key=lambda p: p.nombre)
+        return [p.como_fila() for p in activos[inicio:inicio + limite]]
+
+    def disponibles(self):
+        return [p.como_fila() for p in self.activos() if p.disponible > 0]
+
+catalogo = CatalogoProductos()
+
+def normalizar_texto(texto):
+    return ''.join(c for c in unicodedata.normalize('NFKD', (texto or "").lower()) if not unicodedata.combining(c))
+
+class IndiceBusqueda:
+    """Índice de búsqueda por código exacto, prefijos de palabra y trigramas, al día con los cambios del catálogo."""
+    def __init__(self, catalogo):
+        self.catalogo = catalogo; self._lock = threading.Lock(); self._construido = False
+        self._textos = {} # id -> (nombre normalizado, código normalizado)
+        self._tokens = [] # (palabra o código, id) ordenados, para búsqueda por prefijo con bisect
+        self._trigramas = {} # trigrama -> set de ids
+        self._por_codigo = {} # código normalizado -> id
+        self._ultima_consulta = None; self._ultimos_candidatos = None
+        catalogo.suscribir(self._al_cambiar_catalogo)
+
+    @staticmethod
+    def _trigramas_de(texto): return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    @staticmethod
+    def _tokens_de(nombre, codigo): return set(nombre.split()) | ({codigo} if codigo else set())
+
+    def construir(self):
+        with self._lock:
+            self._textos.clear(); self._tokens.clear(); self._trigramas.clear(); self._por_codigo.clear()
+            for producto in list(self.catalogo.por_id.values()): self._agregar(producto, ordenar=False)
+            self._tokens.sort(); self._construido = True; self._ultima_consulta = self._ultimos_candidatos = None
+
+    def asegurar_construido(self):
+        if not self._construido: self.construir()
+
+    def _agregar(self, producto, ordenar=True):
+        nombre, codigo = normalizar_texto(producto.nombre), normalizar_texto(producto.codigo)
+        self._textos[producto.id] = (nombre, codigo)
+        for token in self._tokens_de(nombre, codigo):
+            if ordenar: bisect.insort(self._tokens, (token, producto.id))
+            else: self._tokens.append((token, producto.id))
+        for trigrama in self._trigramas_de(nombre) | self._trigramas_de(codigo): self._trigramas.setdefault(trigrama, set()).add(producto.id)
+        if codigo: self._por_codigo[codigo] = producto.id
+
+    def _quitar(self, prod_id):
+        textos = self._textos.pop(prod_id, None)
+        if textos is None: return
+        nombre, codigo = textos
+        for token in self._tokens_de(nombre, codigo):
+            i = bisect.bisect_left(self._tokens, (token, prod_id))
+            if i < len(self._tokens) and self._tokens[i] == (token, prod_id): del self._tokens[i]
+        for trigrama in self._trigramas_de(nombre) | self._trigramas_de(codigo):
+            ids = self._trigramas.get(trigrama)
+            if ids is not None:
+                ids.discard(prod_id)
+                if not ids: del self._trigramas[trigrama]
+        if codigo and self._por_codigo.get(codigo) == prod_id: del self._por_codigo[codigo]
+
+    def _al_cambiar_catalogo(self, ids):
+        if not self._construido: return
+        if ids is None: self.construir(); return
+        with self._lock:
+            for prod_id in ids:
+                producto = self.catalogo.por_id.get(prod_id)
+                textos = (normalizar_texto(producto.nombre), normalizar_texto(producto.codigo)) if producto else None
+                if textos == self._textos.get(prod_id): continue # Solo cambió stock o precio
+                self._quitar(prod_id)
+                if producto: self._agregar(producto)
+                self._ultima_consulta = self._ultimos_candidatos = None # Los candidatos guardados pueden omitir el producto cambiado
+
+    def buscar_codigo(self, codigo):
+        prod_id = self._por_codigo.get(normalizar_texto(codigo.strip()))
+        return self.catalogo.por_id.get(prod_id) if prod_id is not None else None
+
+    def buscar(self, consulta, limite=MAX_RESULTADOS_BUSQUEDA, presupuesto_ms=PRESUPUESTO_BUSQUEDA_MS):
+        """Devuelve (productos activos con stock disponible ordenados por relevancia, completo). completo es False si se agotó el presupuesto de tiempo."""
+        q = normalizar_texto(consulta.strip())
+        if not q: return [], True
+        fin = time.perf_counter() + presupuesto_ms / 1000
+        with self._lock:
+            if len(q) < 3:
+                # Consultas cortas: prefijos de palabra, ya verificados por el propio índice
+                candidatos, verificar = [], False; i = j = bisect.bisect_left(self._tokens, (q,))
+                while j < len(self._tokens) and self._tokens[j][0].startswith(q) and (j - i) < 20 * limite: j += 1
+                candidatos = [token[1] for token in self._tokens[i:j]]
+            elif self._ultimos_candidatos is not None and q.startswith(self._ultima_consulta):
+                candidatos, verificar = self._ultimos_candidatos, True
+            else:
+                conjuntos = sorted((self._trigramas.get(t, set()) for t in self._trigramas_de(q)), key=len)
+                candidatos, verificar = (set.intersection(*conjuntos) if conjuntos[0] else set()), True
+            coincidencias, puntuados, completo = set(), [], True
+            for n, prod_id in enumerate(candidatos):
+                if n & 255 == 0 and n and time.perf_counter() > fin: completo = False; break
+                if prod_id in coincidencias: continue
+                nombre, codigo = self._textos.get(prod_id, ("", ""))
+                if verificar and q not in nombre and q not in codigo: continue
+                coincidencias.add(prod_id)
+                rango = 0 if codigo == q else 1 if nombre.startswith(q) else 2 if f" {q}" in f" {nombre}" else 3
+                puntuados.append((rango, nombre, prod_id))
+            self._ultima_consulta, self._ultimos_candidatos = (q, coincidencias) if completo and len(q) >= 3 else (None, None)
+        resultados = []; heapq.heapify(puntuados)
+        while puntuados:
+            prod_id = heapq.heappop(puntuados)[2]; producto = self.catalogo.por_id.get(prod_id)
+            if producto is not None and producto.estado == 'activo' and producto.disponible > 0:
+                resultados.append(producto)
+                if len(resultados) >= limite: break
+        return resultados, completo
+
+indice_busqueda = IndiceBusqueda(catalogo)
+
+# ==============================================================================
+# 3.3 CARRITO DE COMPRAS
+# ==============================================================================
+class LineaCarrito:
+    __slots__ = ("id", "nombre", "precio", "cantidad")
+    def __init__(self, id, nombre, precio, cantidad):
+        self.id, self.nombre, self.precio, self.cantidad = id, nombre, precio, cantidad
+
+    @property
+    def subtotal(self): return self.cantidad * self.precio
+
+class Carrito:
+    """Carrito indexado por id de producto, con el neto acumulado: agregar, cambiar o quitar una línea cuesta O(1)."""
+    def __init__(self):
+        self.lineas = {} # id -> LineaCarrito, en orden de inserción
+        self.neto = 0.0
+
+    def __len__(self): return len(self.lineas)
+    def __iter__(self): return iter(self.lineas.values())
+    def __contains__(self, prod_id): return prod_id in self.lineas
+
+    @property
+    def iva(self): return self.neto * TASA_IVA
+    @property
+    def total(self): return self.neto + self.iva
+
+    def cantidad_de(self, prod_id):
+        linea = self.lineas.get(prod_id)
+        return linea.cantidad if linea else 0
+
+    def agregar(self, prod_id, nombre, precio, cantidad):
+        linea = self.lineas.get(prod_id)
+        if linea is None: linea = self.lineas[prod_id] = LineaCarrito(prod_id, nombre, float(precio), 0)
+        linea.cantidad += cantidad; self.neto += cantidad * linea.precio
+        return linea
+
+    def cambiar_cantidad(self, prod_id, cantidad):
+        """Fija la cantidad de una línea; con 0 o menos la quita. Devuelve la línea o None si se quitó."""
+        if cantidad <= 0: self.quitar(prod_id); return None
+        linea = self.lineas[prod_id]
+        self.neto += (cantidad - linea.cantidad) * linea.precio; linea.cantidad = cantidad
+        return linea
+
+    def quitar(self, prod_id):
+        linea = self.lineas.pop(prod_id, None)
+        if linea is not None: self.neto -= linea.subtotal
+        if not self.lineas: self.neto = 0.0 # Evita arrastrar residuos de redondeo
+        return linea
+
+    def vaciar(self):
+        self.lineas.clear(); self.neto = 0.0
+
+    def lineas_venta(self):
+        return [(linea.id, linea.cantidad, linea.precio, linea.subtotal) for linea in self.lineas.values()]
+
+# ==============================================================================
+# 3.4 REPORTES (SOBRE LAS TABLAS DE RESUMEN DIARIO) E HISTORIAL DE VENTAS
+# ==============================================================================
+def _filtro_reporte(desde, hasta, vendedor=None, alias=""):
+    condiciones, params = [f"{alias}fecha BETWEEN %s AND %s"], [desde, hasta]
+    if vendedor is not None: condiciones.append(f"{alias}vendedor_usuario = %s"); params.append(vendedor)
+    return " AND ".join(condiciones), params
+
+@operacion_servicio("reportes.por_periodo")
+def reporte_ventas_por_periodo(desde, hasta, granularidad="dia", vendedor=None):
+    """Filas (inicio del período, boletas, neto, iva, total) entre dos fechas (date), inclusive."""
+    repositorio = obtener_repositorio(); periodo = repositorio.columna_fecha(repositorio.GRANULARIDADES[granularidad], "periodo"); where, params = _filtro_reporte(desde, hasta, vendedor)
+    return consultar_bd(f"SELECT {periodo}, SUM(boletas), SUM(neto), SUM(iva), SUM(total) FROM resumen_boletas_diario WHERE {where} GROUP BY 1 ORDER BY 1", tuple(params), origen="reporte_ventas_por_periodo")
+
+@operacion_servicio("reportes.por_vendedor")
+def reporte_por_vendedor(desde, hasta):
+    """Filas (vendedor, boletas, neto, iva, total) ordenadas por total descendente."""
+    where, params = _filtro_reporte(desde, hasta)
+    return consultar_bd(f"SELECT vendedor_usuario, SUM(boletas), SUM(neto), SUM(iva), SUM(total) FROM resumen_boletas_diario WHERE {where} GROUP BY vendedor_usuario ORDER BY SUM(total) DESC", tuple(params), origen="reporte_por_vendedor")
+
+@operacion_servicio("reportes.por_producto")
+def reporte_por_producto(desde, hasta, limite=None, vendedor=None):
+    """Filas (producto_id, código, nombre, cantidad, neto, iva) ordenadas por neto vendido; con `limite` entrega los más vendidos."""
+    where, params = _filtro_reporte(desde, hasta, vendedor, alias="r.")
+    query = f"SELECT r.producto_id, p.codigo, p.nombre, SUM(r.cantidad), SUM(r.neto), SUM(r.iva) FROM resumen_ventas_diario r JOIN productos p ON p.id = r.producto_id WHERE {where} GROUP BY r.producto_id, p.codigo, p.nombre ORDER BY SUM(r.neto) DESC"
+    if limite: query += " LIMIT %s"; params.append(limite)
+    return consultar_bd(query, tuple(params), origen="reporte_por_producto")
+
+def filtros_historial(texto_producto="", vendedor=None, desde=None, hasta=None, detalle="detalle_ventas"):
+    """(condiciones, parámetros) del historial por producto, vendedor y fechas (inclusive), sobre la tabla de líneas `detalle`."""
+    condiciones, params = [], []
+    texto_producto = texto_producto.replace('"', ' ').strip()
+    if texto_producto:
+        # Productos por nombre -> idx (producto_id, boleta_id) -> boletas
+        subconsulta, param = obtener_repositorio().filtro_nombre_producto(texto_producto)
+        condiciones.append(f"b.id IN (SELECT dv.boleta_id FROM {detalle} dv WHERE dv.producto_id IN ({subconsulta}))"); params.append(param)
+    if vendedor is not None: condiciones.append("b.vendedor_usuario = %s"); params.append(vendedor)
+    if desde is not None: condiciones.append("b.fecha >= %s"); params.append(desde)
+    if hasta is not None: condiciones.append("b.fecha < %s"); params.append(hasta + timedelta(days=1))
+    return condiciones, params
+
+@operacion_servicio("historial.pagina")
+def pagina_historial(texto_producto, vendedor_filtro, agrupado, cursor, limite, desde=None, hasta=None):
+    """Boletas (id, fecha, vendedor, total, tipo) que siguen a la clave `cursor`, de la más reciente a la más antigua."""
+    repositorio = obtener_repositorio(); boletas = []
+    for archivo in repositorio.particiones_ventas(desde, hasta):
+        tablas = repositorio.TABLAS_VENTAS[archivo]
+        conds, params = filtros_historial(texto_producto, vendedor_filtro, desde, hasta, tablas["detalle"])
+        if cursor is not None:
+            vendedor, fecha, boleta_id = cursor
+            if agrupado:
+                conds.append("(b.vendedor_usuario > %s OR (b.vendedor_usuario = %s AND (b.fecha < %s OR (b.fecha = %s AND b.id < %s))))"); params += [vendedor, vendedor, fecha, fecha, boleta_id]
+            else:
+                conds.append("(b.fecha < %s OR (b.fecha = %s AND b.id < %s))"); params += [fecha, fecha, boleta_id]
+        orden = "b.vendedor_usuario ASC, b.fecha DESC, b.id DESC" if agrupado else "b.fecha DESC, b.id DESC"
+        where = f" WHERE {' AND '.join(conds)}" if conds else ""
+        boletas += consultar_bd(f"SELECT b.id, b.fecha, b.vendedor_usuario, b.total_boleta, b.tipo_documento FROM {tablas['boletas']} b{where} ORDER BY {orden} LIMIT %s", tuple(params + [limite]), origen="aplicar_filtros")
+    # Mismo orden que el SQL: por fecha e id descendentes y, agrupado, antes por vendedor (el orden de Python es estable)
+    boletas.sort(key=lambda boleta: (boleta[1], boleta[0]), reverse=True)
+    if agrupado: boletas.sort(key=lambda boleta: boleta[2] or "")
+    return boletas[:limite]
+
+@operacion_servicio("historial.conteos")
+def conteos_historial(texto_producto, vendedor_filtro, desde=None, hasta=None):
+    """{vendedor: boletas} con los mismos filtros, para las cabeceras agrupadas del historial."""
+    repositorio = obtener_repositorio(); conteos = Counter()
+    for archivo in repositorio.particiones_ventas(desde, hasta):
+        tablas = repositorio.TABLAS_VENTAS[archivo]
+        condiciones, params = filtros_historial(texto_producto, vendedor_filtro, desde, hasta, tablas["detalle"])
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        conteos.update(dict(consultar_bd(f"SELECT b.vendedor_usuario, COUNT(*) FROM {tablas['boletas']} b{where} GROUP BY b.vendedor_usuario", tuple(params), origen="aplicar_filtros")))
+    return dict(conteos)
+
+class CacheDetallesBoleta:
+    """Detalles de boleta ya formateados de los últimos `capacidad` pedidos (LRU); una boleta registrada no cambia."""
+    def __init__(self, capacidad=DETALLES_EN_CACHE):
+        self.capacidad = capacidad; self._lock = threading.Lock()
+        self._entradas = OrderedDict() # boleta_id -> (campos, líneas), de la menos a la más usada
+
+    def en_cache(self, boleta_id):
+        with self._lock:
+            detalle = self._entradas.get(int(boleta_id))
+            if detalle is not None: self._entradas.move_to_end(int(boleta_id))
+            return detalle
+
+    def obtener(self, boleta_id):
+        """(campos, líneas) formateados, o None si la boleta no existe; fuera de la caché consulta al servidor."""
+        boleta_id = int(boleta_id); detalle = self.en_cache(boleta_id)
+        if detalle is not None: return detalle
+        boleta, lineas = obtener_repositorio().obtener_boleta(boleta_id)
+        if boleta is None: return None # No se guarda: puede ser una venta que aún no llega al servidor
+        fecha, vendedor, neto, iva, total, tipo_doc, cliente_rut, cliente_nombre = boleta
+        campos = {"tipo": tipo_doc, "id": str(boleta_id), "fecha": fecha.strftime('%d de %B de %Y, %H:%M:%S'), "vendedor": vendedor or "Desconocido",
+                  "rut": cliente_rut or "", "cliente": cliente_nombre or "", "neto": formatear_a_clp(neto), "iva": formatear_a_clp(iva), "total": formatear_a_clp(total)}
+        detalle = (campos, [(codigo, nombre, cantidad, formatear_a_clp(precio), formatear_a_clp(subtotal)) for codigo, nombre, cantidad, precio, subtotal in lineas])
+        with self._lock:
+            self._entradas[boleta_id] = detalle
+            while len(self._entradas) > self.capacidad: self._entradas.popitem(last=False)
+        return detalle
+
+detalles_boleta = CacheDetallesBoleta()
+
+def corte_archivo(meses=ARCHIVO_MESES_ACTIVOS, hoy=None):
+    """Primer día que queda en las tablas activas: el del mes en curso menos `meses` meses cerrados."""
+    hoy = hoy or datetime.now().date(); mes = hoy.year * 12 + hoy.month - 1 - meses
+    return date(mes // 12, mes % 12 + 1, 1)
+
+class ArchivadorVentas:
+    """Hilo que pasa al archivo, en lotes cortos, las boletas anteriores a corte_archivo()."""
+    # Corre en un solo lugar: servicio.py, la caja de un bazar con SQLite o `python bazar.py --archivar-ventas`
+    def __init__(self, meses=ARCHIVO_MESES_ACTIVOS, lote=ARCHIVO_LOTE, pausa=ARCHIVO_PAUSA, intervalo=ARCHIVO_INTERVALO):
+        self.meses, self.lote, self.pausa, self.intervalo = meses, lote, pausa, intervalo
+        self._despertar = threading.Event(); self._detenido = False; self._hilo = None
+        self.archivadas = 0; self.ultimo_error = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._ciclo, name="archivador-ventas", daemon=True); self._hilo.start()
+
+    def detener(self, espera=5.0):
+        self._detenido = True; self._despertar.set()
+        if self._hilo is not None: self._hilo.join(espera)
+
+    def _ciclo(self):
+        while not self._detenido:
+            try: iniciar_bd(); self.archivar(); self.ultimo_error = None # iniciar_bd: las tablas de archivo llegan con la migración 12
+            except Exception as err:
+                if self.ultimo_error is None: print(f"ADVERTENCIA: No se pudieron archivar las boletas antiguas; se reintentará. Error: {err}")
+                self.ultimo_error = err
+            self._despertar.wait(self.intervalo)
+
+    def archivar(self):
+        """Una pasada completa hasta el corte actual. Devuelve cuántas boletas movió."""
+        corte, movidas = corte_archivo(self.meses), 0
+        while not self._detenido:
+            cantidad = obtener_repositorio().archivar_ventas(corte, self.lote); movidas += cantidad
+            if cantidad < self.lote: break
+            self._despertar.wait(self.pausa)
+        self.archivadas += movidas
+        return movidas
+
+# ==============================================================================
+# 3.5 DIARIO LOCAL DE VENTAS Y SINCRONIZACIÓN CON EL SERVIDOR
+# ==============================================================================
+class DiarioVentas:
+    """Diario local (SQLite) de ventas por enviar; las que el servidor rechazó quedan apartadas hasta revisarlas."""
+    def __init__(self, ruta=CONFIG.sincronizacion.diario_ruta):
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None) # Autocommit: cada anotación es su propia transacción
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL"); self._conn.execute("PRAGMA synchronous=FULL") # Una venta confirmada sobrevive a un corte de luz
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ventas_pendientes (
+                    clave TEXT PRIMARY KEY,
+                    creada_en TEXT NOT NULL,
+                    vendedor TEXT NOT NULL,
+                    tipo_documento TEXT NOT NULL,
+                    cliente_rut TEXT,
+                    cliente_nombre TEXT,
+                    lineas TEXT NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    ultimo_error TEXT,
+                    boleta_id INTEGER,
+                    enviada_en TEXT,
+                    reservas TEXT
+                )
+            """)
+            if "reservas" not in {fila[1] for fila in self._conn.execute("PRAGMA table_info(ventas_pendientes)").fetchall()}: self._conn.execute("ALTER TABLE ventas_pendientes ADD COLUMN reservas TEXT") # Diarios anteriores a las reservas de stock
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ventas_por_enviar ON ventas_pendientes (intentos, creada_en) WHERE boleta_id IS NULL")
+            self._conn.execute("DELETE FROM ventas_pendientes WHERE boleta_id IS NOT NULL AND enviada_en < datetime('now', 'localtime', ?)", (f"-{CONFIG.sincronizacion.dias_retencion} days",))
+
+    def anotar(self, vendedor, lineas, tipo_doc="Boleta", cliente_rut=None, cliente_nombre=None, reservas=None):
+        """Guarda una venta por enviar con los ids de reservas_stock que la apartan. Devuelve su clave."""
+        clave = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("INSERT INTO ventas_pendientes (clave, creada_en, vendedor, tipo_documento, cliente_rut, cliente_nombre, lineas, reservas) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (clave, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), vendedor, tipo_doc, cliente_rut, cliente_nombre, json.dumps(lineas), json.dumps(reservas or [])))
+        return clave
+
+    def por_enviar(self, limite):
+        """Ventas aún no registradas en el servidor ni rechazadas, primero las que menos han fallado y luego las más antiguas."""
+        with self._lock:
+            filas = self._conn.execute("SELECT clave, creada_en, vendedor, tipo_documento, cliente_rut, cliente_nombre, lineas, reservas FROM ventas_pendientes WHERE boleta_id IS NULL AND ultimo_error IS NULL ORDER BY intentos, creada_en LIMIT ?", (limite,)).fetchall()
+        return [(*fila[:6], json.loads(fila[6]), json.loads(fila[7] or "[]")) for fila in filas]
+
+    def marcar_enviada(self, clave, boleta_id):
+        with self._lock: self._conn.execute("UPDATE ventas_pendientes SET boleta_id = ?, enviada_en = datetime('now', 'localtime'), ultimo_error = NULL WHERE clave = ?", (boleta_id, clave))
+
+    def marcar_error(self, clave, error):
+        with self._lock: self._conn.execute("UPDATE ventas_pendientes SET intentos = intentos + 1, ultimo_error = ? WHERE clave = ?", (str(error), clave))
+
+    def contar_pendientes(self):
+        with self._lock: return self._conn.execute("SELECT COUNT(*) FROM ventas_pendientes WHERE boleta_id IS NULL AND ultimo_error IS NULL").fetchone()[0]
+
+    def contar_rechazadas(self):
+        with self._lock: return self._conn.execute("SELECT COUNT(*) FROM ventas_pendientes WHERE boleta_id IS NULL AND ultimo_error IS NOT NULL").fetchone()[0]
+
+    def rechazadas(self):
+        """Ventas que el servidor rechazó, de la más antigua a la más nueva: (clave, creada_en, vendedor, tipo_documento, lineas, intentos, motivo)."""
+        with self._lock:
+            filas = self._conn.execute("SELECT clave, creada_en, vendedor, tipo_documento, lineas, intentos, ultimo_error FROM ventas_pendientes WHERE boleta_id IS NULL AND ultimo_error IS NOT NULL ORDER BY creada_en").fetchall()
+        return [(*fila[:4], json.loads(fila[4]), *fila[5:]) for fila in filas]
+
+    def reintentar(self, clave):
+        """Devuelve una venta rechazada a la cola de envío (p. ej. después de reponer el stock que faltaba)."""
+        with self._lock: self._conn.execute("UPDATE ventas_pendientes SET ultimo_error = NULL WHERE clave = ? AND boleta_id IS NULL", (clave,))
+
+    def descartar(self, clave):
+        """Borra una venta rechazada que no se va a registrar; sus reservas de stock vencen solas."""
+        with self._lock: self._conn.execute("DELETE FROM ventas_pendientes WHERE clave = ? AND boleta_id IS NULL AND ultimo_error IS NOT NULL", (clave,))
+
+    def cerrar(self):
+        with self._lock: self._conn.close()
+
+class SincronizadorVentas:
+    """Hilo que envía al servidor por lotes las ventas del diario, con espera exponencial mientras no haya conexión."""
+    def __init__(self, diario, lote=CONFIG.sincronizacion.lote, espera_max=CONFIG.sincronizacion.espera_max):
+        self.diario, self.lote, self.espera_max = diario, lote, espera_max
+        self._despertar = threading.Event(); self._detenido = False; self._hilo = None
+        self._esquema_listo = False
+        self.en_linea = None; self.ultimo_error = None # Estado de la última pasada, para mostrarlo en la interfaz
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._ciclo, name="sincronizador-ventas", daemon=True); self._hilo.start()
+
+    def avisar(self): self._despertar.set()
+
+    def detener(self, espera=5.0):
+        self._detenido = True; self._despertar.set()
+        if self._hilo is not None: self._hilo.join(espera)
+
+    def _ciclo(self):
+        espera = 1.0
+        while not self._detenido:
+            try:
+                while not self._detenido and self.sincronizar() == self.lote: pass # Lote lleno: puede quedar más
+                self.en_linea, self.ultimo_error, espera, pausa = True, None, 1.0, None
+            except Exception as err:
+                if self.en_linea is not False: print(f"ADVERTENCIA: Sin conexión con el servidor, las ventas quedan en el diario local. Error: {err}")
+                self.en_linea, self.ultimo_error = False, err; pausa = espera; espera = min(espera * 2, self.espera_max)
+            self._despertar.wait(pausa); self._despertar.clear()
+
+    def sincronizar(self):
+        """Envía un lote de ventas pendientes y aparta las que el servidor rechace. Devuelve cuántas procesó."""
+        pendientes = self.diario.por_enviar(self.lote)
+        if not pendientes: return 0
+        if not self._esquema_listo: iniciar_bd(); self._esquema_listo = True # La columna clave_idempotencia llega con la migración 8
+        for clave, boleta_id, motivo in obtener_repositorio().registrar_ventas(pendientes):
+            if boleta_id is not None: self.diario.marcar_enviada(clave, boleta_id)
+            else: self.diario.marcar_error(clave, motivo)
+        return len(pendientes)
+
+# ==============================================================================
+# 3.6 IMPORTACIÓN Y EXPORTACIÓN CSV
+# ==============================================================================
+COLUMNAS_IMPORTACION = {"codigo": "codigo", "código": "codigo", "nombre": "nombre", "producto": "nombre", "precio": "precio", "precio neto": "precio", "stock": "stock"}
+COLUMNAS_EXPORTACION_VENTAS = ("boleta_id", "fecha", "vendedor", "tipo_documento", "cliente_rut", "cliente_nombre", "neto_boleta", "iva_boleta", "total_boleta", "codigo", "producto", "cantidad", "precio_unitario", "subtotal")
+MAX_ERRORES_IMPORTACION = 100 # Filas inválidas que se guardan para el informe; las demás solo se cuentan
+
+def _lineas_con_avance(archivo, total, al_progresar):
+    leidos = 0
+    for numero, linea in enumerate(archivo, 1):
+        leidos += len(linea)
+        if al_progresar and numero % 1000 == 0: al_progresar(min(leidos / total, 1.0))
+        yield linea
+
+def _entero_csv(valor):
+    return int(valor.replace("$", "").replace(".", "").replace(" ", "")) # Acepta "$1.990" tal como lo exporta Excel
+
+def importar_productos_csv(ruta, al_progresar=None, tamano_lote=IMPORTACION_LOTE):
+    """Importa productos de un CSV (nombre, precio, stock y opcionalmente codigo) por lotes. Devuelve (importadas, omitidas, errores)."""
+    repositorio = obtener_repositorio(); catalogo.revalidar(forzar=True)
+    codigo_por_nombre = {p.nombre: p.codigo for p in catalogo.todos()}
+    nombre_por_codigo = {} # Códigos escritos en esta importación, para detectar uno repetido en dos productos distintos
+    importadas, omitidas, errores, lote, maximos_explicitos = 0, 0, [], [], {}
+
+    def enviar(lote):
+        if maximos_explicitos: # Antes de numerar: la secuencia no debe entregar un código que ya trae el archivo
+            repositorio.avanzar_secuencias(maximos_explicitos); asignador_codigos.descartar(maximos_explicitos); maximos_explicitos.clear()
+        sin_codigo = [i for i, fila in enumerate(lote) if fila[0] is None]
+        for i, codigo in zip(sin_codigo, asignador_codigos.varios([lote[i][1] for i in sin_codigo])): lote[i] = (codigo, *lote[i][1:]); nombre_por_codigo[codigo] = lote[i][1]
+        return repositorio.upsert_productos(lote)
+
+    with open(ruta, newline="", encoding="utf-8-sig") as archivo:
+        muestra = archivo.read(4096); archivo.seek(0)
+        try: dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error: dialecto = csv.excel
+        lector = csv.reader(_lineas_con_avance(archivo, max(os.path.getsize(ruta), 1), al_progresar), dialecto)
+        encabezado = [COLUMNAS_IMPORTACION.get(columna.strip().lower()) for columna in next(lector, [])]
+        if not {"nombre", "precio", "stock"} <= set(encabezado): raise ValueError("El archivo debe tener las columnas nombre, precio y stock (codigo es opcional).")
+        for fila in lector:
+            if not any(campo.strip() for campo in fila): continue
+            datos = {columna: campo.strip() for columna, campo in zip(encabezado, fila) if columna}
+            nombre = datos.get("nombre", "")[:100]; codigo = datos.get("codigo") or codigo_por_nombre.get(nombre)
+            try: precio, stock = _entero_csv(datos.get("precio", "")), _entero_csv(datos.get("stock", ""))
+            except ValueError: motivo = "precio o stock no es un número entero"
+            else: motivo = ("nombre vacío" if not nombre else "precio o stock negativo" if precio < 0 or stock < 0
+                            else "el código ya se asignó a otro producto del archivo" if codigo and nombre_por_codigo.get(codigo, nombre) != nombre else None)
+            if motivo:
+                omitidas += 1
+                if len(errores) < MAX_ERRORES_IMPORTACION: errores.append((lector.line_num, motivo))
+                continue
+            if codigo:
+                nombre_por_codigo[codigo] = nombre; coincidencia = PATRON_CODIGO.match(codigo)
+                if coincidencia and datos.get("codigo"): prefijo = coincidencia.group(1); maximos_explicitos[prefijo] = max(maximos_explicitos.get(prefijo, 0), int(coincidencia.group(2)))
+            codigo_por_nombre[nombre] = codigo
+            lote.append((codigo, nombre, precio, stock))
+            if len(lote) >= tamano_lote: importadas += enviar(lote); lote = []
+        if lote: importadas += enviar(lote)
+    if al_progresar: al_progresar(1.0)
+    catalogo.revalidar(forzar=True)
+    return importadas, omitidas, errores
+
+def exportar_ventas_csv(ruta, desde, hasta, al_progresar=None):
+    """Escribe en `ruta` una fila por línea vendida entre dos fechas, leyendo del servidor por lotes. Devuelve las filas escritas."""
+    repositorio = obtener_repositorio(); total = max(repositorio.contar_lineas_venta(desde, hasta), 1); escritas = 0
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as archivo:
+        escritor = csv.writer(archivo, delimiter=CSV_DELIMITADOR); escritor.writerow(COLUMNAS_EXPORTACION_VENTAS)
+        for filas in repositorio.iterar_lineas_venta(desde, hasta):
+            escritor.writerows((boleta_id, fecha.strftime('%Y-%m-%d %H:%M:%S'), *resto) for boleta_id, fecha, *resto in filas)
+            escritas += len(filas)
+            if al_progresar: al_progresar(min(escritas / total, 1.0))
+    return escritas
+
+# ==============================================================================
+# 3.7 INSTRUMENTACIÓN
+# ==============================================================================
+class HistogramaRodante:
+    """Duraciones de las últimas `ventana` mediciones (para los percentiles) más los totales desde el arranque."""
+    __slots__ = ("muestras", "veces", "total", "maximo", "filas")
+    def __init__(self, ventana):
+        self.muestras = deque(maxlen=ventana); self.veces = 0; self.total = 0.0; self.maximo = 0.0; self.filas = 0
+
+    def agregar(self, duracion, filas):
+        self.muestras.append(duracion); self.veces += 1; self.total += duracion; self.filas += filas
+        if duracion > self.maximo: self.maximo = duracion
+
+    def percentiles(self, *porcentajes):
+        ordenadas = sorted(self.muestras)
+        if not ordenadas: return [0.0] * len(porcentajes)
+        return [ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))] for p in porcentajes]
+
+class Instrumentacion:
+    """Tiempos de consultas, vistas y Treeview por nombre, con percentiles para Diagnóstico y traza opcional en formato Chrome."""
+    def __init__(self, ventana=INSTRUMENTACION_VENTANA):
+        self.ventana = ventana; self._lock = threading.Lock()
+        self._medidas = {} # (categoría, nombre) -> HistogramaRodante
+        self._traza = None; self.ruta_traza = None; self._hilos_trazados = set()
+
+    def registrar(self, categoria, nombre, duracion, inicio=None, filas=0, **datos):
+        with self._lock:
+            medida = self._medidas.get((categoria, nombre))
+            if medida is None: medida = self._medidas[(categoria, nombre)] = HistogramaRodante(self.ventana)
+            medida.agregar(duracion, filas)
+            if self._traza is not None: self._escribir_evento(categoria, nombre, duracion, inicio, filas, datos)
+
+    @contextlib.contextmanager
+    def tramo(self, categoria, nombre, filas=0, **datos):
+        inicio = time.perf_counter()
+        try: yield
+        finally: self.registrar(categoria, nombre, time.perf_counter() - inicio, inicio, filas, **datos)
+
+    def _escribir_evento(self, categoria, nombre, duracion, inicio, filas, datos):
+        hilo = threading.get_ident()
+        if hilo not in self._hilos_trazados: # Metadato: el visor muestra el nombre del hilo en vez de su número
+            self._hilos_trazados.add(hilo); self._traza.write(json.dumps({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": hilo, "args": {"name": threading.current_thread().name}}) + ",\n")
+        inicio = time.perf_counter() - duracion if inicio is None else inicio
+        evento = {"name": nombre, "cat": categoria, "ph": "X", "ts": round((inicio - _INICIO_PROCESO) * 1e6, 1), "dur": round(duracion * 1e6, 1), "pid": os.getpid(), "tid": hilo, "args": {"filas": filas, **datos}}
+        self._traza.write(json.dumps(evento, ensure_ascii=False, default=str) + ",\n")
+
+    def iniciar_traza(self, ruta):
+        archivo = open(ruta, "w", encoding="utf-8"); archivo.write("[\n")
+        with self._lock:
+            anterior, self._traza, self.ruta_traza = self._traza, archivo, ruta; self._hilos_trazados = set()
+        if anterior is not None: self._cerrar_archivo(anterior)
+
+    def detener_traza(self):
+        with self._lock: archivo, self._traza, self.ruta_traza = self._traza, None, None
+        if archivo is not None: self._cerrar_archivo(archivo)
+
+    def _cerrar_archivo(self, archivo):
+        # Un último evento sin coma y el corchete final dejan el archivo como JSON válido
+        archivo.write(json.dumps({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "Bazar de la Nona"}}) + "\n]\n"); archivo.close()
+
+    def resumen(self, categoria):
+        """[(nombre, veces, filas, p50, p95, p99, máximo, total)] de una categoría, de mayor a menor tiempo total."""
+        with self._lock: medidas = [(nombre, medida) for (cat, nombre), medida in self._medidas.items() if cat == categoria]
+        filas = [(nombre, m.veces, m.filas, *m.percentiles(50, 95, 99), m.maximo, m.total) for nombre, m in medidas]
+        return sorted(filas, key=lambda fila: fila[-1], reverse=True)
+
+    def reiniciar(self):
+        with self._lock: self._medidas.clear()
+
+instrumentacion = Instrumentacion()
+
+@functools.lru_cache(maxsize=512)
+def forma_sql(query):
+    """Forma de una consulta para agruparla: espacios colapsados y listas de marcadores (IN, VALUES multi-fila) abreviadas."""
+    forma = re.sub(r"\((?:%s|\?)(?:, (?:%s|\?))+\)", "(%s, ...)", " ".join(query.split()))
+    return re.sub(r"(\(%s, \.\.\.\))(?:, \(%s, \.\.\.\))+", r"\1, ...", forma)
+
+# ==============================================================================
+# 3.8 RESERVAS DE STOCK ENTRE CAJAS
+# ==============================================================================
+class ServicioReservas:
+    """Reservas de stock del carrito de esta caja, una por producto; vencen solas si la caja deja de renovarlas."""
+    def __init__(self, terminal=CONFIG.reservas.terminal, duracion=CONFIG.reservas.duracion):
+        self.terminal, self.duracion = terminal, duracion
+        self._lock = threading.Lock()
+        self._reservas = {} # producto_id -> (id de la reserva, unidades)
+        self._ultima_renovacion = time.monotonic()
+
+    def apartar(self, producto_id, delta):
+        """Suma `delta` unidades (negativo: devuelve) a la reserva del producto; si no alcanzan, la anterior queda igual."""
+        with self._lock: # Los cambios de esta caja van en fila: cada uno parte de la reserva que dejó el anterior
+            reserva_id, cantidad = self._reservas.get(producto_id, (None, 0)); nueva = max(0, cantidad + delta)
+            if reserva_id is None and nueva == 0: self._reservas.pop(producto_id, None); return
+            reserva_id, stock, reservado = obtener_repositorio().reservar_stock(producto_id, nueva, self.terminal, self.duracion, reemplaza=reserva_id)
+            if nueva: self._reservas[producto_id] = (reserva_id, nueva)
+            else: self._reservas.pop(producto_id, None)
+        catalogo.actualizar(producto_id, stock=stock, reservado=reservado)
+
+    def actuales(self):
+        with self._lock: return dict(self._reservas)
+
+    def olvidar(self):
+        """Deja de renovar las reservas del carrito (pasaron a una venta confirmada) y las devuelve."""
+        with self._lock: reservas, self._reservas = self._reservas, {}
+        return reservas
+
+    def liberar_todas(self):
+        """Devuelve al stock lo apartado por el carrito actual, p. ej. al abandonarlo o al cerrar la aplicación."""
+        ids = [reserva_id for reserva_id, _ in self.olvidar().values()]
+        if ids: obtener_repositorio().liberar_reservas(ids)
+
+    def mantener(self):
+        """Renueva las reservas propias cuando ya pasó un tercio de su duración y borra las vencidas de cualquier caja."""
+        repositorio = obtener_repositorio()
+        if time.monotonic() - self._ultima_renovacion >= self.duracion / 3:
+            repositorio.renovar_reservas([reserva_id for reserva_id, _ in self.actuales().values()], self.duracion); self._ultima_renovacion = time.monotonic()
+        repositorio.purgar_reservas_vencidas()
+
+servicio_reservas = ServicioReservas()
+
+# ==============================================================================
+# 4. ARQUITECTURA DE LA INTERFAZ Y SEGURIDAD
+# ==============================================================================
+def limpiar_frame(frame):
+    for widget in frame.winfo_children(): widget.destroy()
+
+def configurar_estilo_treeview():
+    style = ttk.Style(); style.theme_use("default")
+    style.configure("Treeview", background="#2a2d2e", foreground="white", rowheight=25, fieldbackground="#343638", bordercolor="#343638", borderwidth=0)
+    style.map('Treeview', background=[('selected', '#22559b')]); style.configure("Treeview.Heading", background="#565b5e", foreground="white", relief="flat", font=('Roboto', 10, 'bold')); style.map("Treeview.Heading", background=[('active', '#3484F0')])
+
+_cache_iconos = {} # (archivo, tamaño) -> CTkImage; un CTkImage se puede compartir entre widgets
+
+def cargar_icono(nombre_archivo, size=(24, 24)):
+    clave = (nombre_archivo, tuple(size))
+    if clave in _cache_iconos: return _cache_iconos[clave]
+    try:
+        script_dir = os.path.dirname(__file__)
+        ruta_completa = os.path.join(script_dir, "icons", nombre_archivo)
+        with Image.open(ruta_completa) as imagen: imagen.load(); icono = ctk.CTkImage(imagen.copy(), size=size)
+    except Exception as e:
+        print(f"ADVERTENCIA: No se pudo cargar el ícono {nombre_archivo}. Error: {e}"); icono = None
+    _cache_iconos[clave] = icono
+    return icono
+
+def cerrar_sesion_por_inactividad():
+    global temporizador_id
+    if current_user["usuario"] is not None:
+        messagebox.showwarning("Sesión Expirada", "Tu sesión ha expirado por inactividad.")
+        temporizador_id = None
+        mostrar_vista("login")
+
+def reiniciar_temporizador(event=None):
+    global temporizador_id
+    if temporizador_id is not None: root.after_cancel(temporizador_id)
+    temporizador_id = root.after(TIEMPO_INACTIVIDAD, cerrar_sesion_por_inactividad)
+
+def iniciar_temporizador_inactividad():
+    reiniciar_temporizador()
+    root.bind_all("<Key>", reiniciar_temporizador)
+    root.bind_all("<Button-1>", reiniciar_temporizador)
+
+def detener_temporizador_inactividad():
+    global temporizador_id
+    if temporizador_id is not None:
+        root.after_cancel(temporizador_id)
+        temporizador_id = None
+    root.unbind_all("<Key>")
+    root.unbind_all("<Button-1>")
+
+class GestorVistas:
+    """Construye cada vista una vez y la conserva oculta; al volver solo llama a su refrescar(**kwargs)."""
+    def __init__(self, contenedor, registro, max_vistas=MAX_VISTAS_EN_CACHE):
+        self.contenedor, self.registro, self.max_vistas = contenedor, registro, max(1, max_vistas)
+        self._vistas = OrderedDict() # clave -> (frame, refrescar, opciones de pack), de la menos a la más usada
+        self._actual = None
+        self.tiempos = {} # nombre -> {"construir": [veces, total_s, ultimo_s], "refrescar": [...]}
+
+    def _clave(self, nombre):
+        return (nombre, current_user["usuario"], current_user["rol"]) if self.registro[nombre][2] else (nombre,)
+
+    def _medir(self, nombre, etapa, inicio):
+        medida = self.tiempos.setdefault(nombre, {"construir": [0, 0.0, 0.0], "refrescar": [0, 0.0, 0.0]})[etapa]
+        duracion = time.perf_counter() - inicio; medida[0] += 1; medida[1] += duracion; medida[2] = duracion
+        instrumentacion.registrar("vista", f"{nombre}.{etapa}", duracion, inicio)
+        # Tk dibuja en tareas ociosas ya encoladas: esta corre después de ellas y mide hasta la vista en pantalla
+        root.after_idle(lambda: instrumentacion.registrar("vista", f"{nombre}.{etapa}+dibujo", time.perf_counter() - inicio, inicio))
+
+    def mostrar(self, nombre, **kwargs):
+        constructor, geometria, _ = self.registro[nombre]
+        cargador.cancelar(); clave = self._clave(nombre)
+        if self._actual is not None and self._actual != clave and self._actual in self._vistas: self._vistas[self._actual][0].pack_forget()
+        root.geometry(geometria); inicio = time.perf_counter()
+        entrada = self._vistas.get(clave)
+        if entrada is None:
+            frame = ctk.CTkFrame(master=self.contenedor, fg_color="transparent")
+            refrescar = constructor(frame, **kwargs)
+            if not frame.winfo_manager(): frame.pack(fill="both", expand=True)
+            self._vistas[clave] = (frame, refrescar, frame.pack_info()); self._actual = clave
+            self._medir(nombre, "construir", inicio); self._podar()
+        else:
+            frame, refrescar, opciones = entrada; self._vistas.move_to_end(clave)
+            if self._actual != clave: frame.pack(**opciones)
+            self._actual = clave
+            if refrescar: refrescar(**kwargs)
+            self._medir(nombre, "refrescar", inicio)
+
+    def _podar(self):
+        while len(self._vistas) > self.max_vistas:
+            clave, (frame, _, _) = next(iter(self._vistas.items()))
+            if clave == self._actual: self._vistas.move_to_end(clave); continue
+            del self._vistas[clave]; frame.destroy()
+
+    def descartar_ajenas(self):
+        """Destruye las vistas de otros usuarios (se llama al iniciar sesión); las independientes del usuario se conservan."""
+        for clave in [c for c in self._vistas if len(c) > 1 and c[1:] != (current_user["usuario"], current_user["rol"]) and c != self._actual]:
+            self._vistas.pop(clave)[0].destroy()
+
+    def resumen_tiempos(self):
+        lineas = [f"Vistas en caché: {len(self._vistas)}/{self.max_vistas}"]
+        for nombre, etapas in sorted(self.tiempos.items()):
+            partes = [f"{etapa} {veces}x prom {total / veces * 1000:6.1f} ms (último {ultimo * 1000:6.1f} ms)" for etapa, (veces, total, ultimo) in etapas.items() if veces]
+            lineas.append(f"  {nombre:<22} " + "  |  ".join(partes))
+        return "\n".join(lineas)
+
+def mostrar_vista(nombre_vista, **kwargs):
+    if nombre_vista in gestor_vistas.registro: gestor_vistas.mostrar(nombre_vista, **kwargs)
+
+def _crear_header(parent_frame, titulo, vista_volver):
+    header_frame = ctk.CTkFrame(master=parent_frame, fg_color="transparent"); header_frame.pack(fill="x", pady=(0, 20))
+    label_titulo = ctk.CTkLabel(master=header_frame, text=titulo, font=("Roboto", 24, "bold")); label_titulo.pack(side="left")
+    ctk.CTkButton(master=header_frame, text="← Volver", width=120, command=lambda: mostrar_vista(vista_volver)).pack(side="right")
+    return label_titulo
+
+# ==============================================================================
+# 5. CONSTRUCTORES DE VISTAS PRINCIPALES
+# ==============================================================================
+
+def mostrar_vista_login(frame, **kwargs):
+    detener_temporizador_inactividad()
+    login_frame = ctk.CTkFrame(master=frame, corner_radius=15, fg_color=("#dbdbdb", "#2b2b2b")); login_frame.place(relx=0.5, rely=0.5, anchor="center")
+    ctk.CTkLabel(master=login_frame, text="Sistema Bazar", font=("Roboto", 28, "bold")).pack(pady=(40, 20))
+    user_icon = cargar_icono("login-user.png", size=(20, 20)); pass_icon = cargar_icono("login-pass.png", size=(20, 20))
+    user_frame = ctk.CTkFrame(master=login_frame, fg_color="transparent"); user_frame.pack(pady=10, padx=30, fill="x")
+    if user_icon: ctk.CTkLabel(master=user_frame, text="", image=user_icon).pack(side="left", padx=(0, 10))
+    entry_usuario = ctk.CTkEntry(master=user_frame, placeholder_text="Usuario", width=220, height=40); entry_usuario.pack(side="left", fill="x", expand=True)
+    pass_frame = ctk.CTkFrame(master=login_frame, fg_color="transparent"); pass_frame.pack(pady=10, padx=30, fill="x")
+    if pass_icon: ctk.CTkLabel(master=pass_frame, text="", image=pass_icon).pack(side="left", padx=(0, 10))
+    entry_clave = ctk.CTkEntry(master=pass_frame, placeholder_text="Contraseña", show="*", width=220, height=40); entry_clave.pack(side="left", fill="x", expand=True)
+    def validar_login(usuario, clave):
+        if not usuario or not clave: messagebox.showwarning("Campos Vacíos", "Por favor, ingrese usuario y contraseña."); return
+        if btn_ingresar.cget("state") == "disabled": return # Ya hay una verificación en curso
+        # bcrypt tarda cientos de ms a propósito: se verifica en un hilo de trabajo con el botón ocupado
+        btn_ingresar.configure(state="disabled", text="Verificando...")
+        def al_verificar(resultado):
+            btn_ingresar.configure(state="normal", text="Ingresar"); rol = resultado
+            if rol is None: messagebox.showerror("Error de Acceso", "Usuario o contraseña incorrectos."); return
+            current_user["usuario"], current_user["rol"] = usuario, rol
+            gestor_vistas.descartar_ajenas(); iniciar_temporizador_inactividad(); mostrar_vista("dashboard")
+        def al_fallar(err):
+            btn_ingresar.configure(state="normal", text="Ingresar"); messagebox.showerror("Error de Conexión", f"No se pudo conectar: {err}")
+        cargador.ejecutar("login", lambda: verificar_credenciales(usuario, clave), al_verificar, al_fallar)
+    btn_ingresar = ctk.CTkButton(master=login_frame, text="Ingresar", width=220, height=40, command=lambda: validar_login(entry_usuario.get(), entry_clave.get())); btn_ingresar.pack(pady=(20, 40))
+    def refrescar(**kwargs):
+        detener_temporizador_inactividad(); btn_ingresar.configure(state="normal", text="Ingresar"); entry_usuario.delete(0, "end"); entry_clave.delete(0, "end"); entry_usuario.focus_set()
+    return refrescar
+
+def mostrar_vista_dashboard(frame, **kwargs):
+    frame.pack(pady=20, padx=60, fill="both", expand=True)
+    header_frame = ctk.CTkFrame(master=frame, fg_color="transparent"); header_frame.pack(fill="x", pady=(0, 20))
+    ctk.CTkLabel(master=header_frame, text=f"Bienvenido, {current_user['rol'].capitalize()}", font=("Roboto", 24, "bold")).pack(side="left")
+    logout_icon = cargar_icono("salir.png", size=(20, 20))
+    ctk.CTkButton(master=header_frame, text="Cerrar Sesión", width=140, image=logout_icon, compound="left", command=lambda: (detener_temporizador_inactividad(), mostrar_vista("login")), fg_color="#D32F2F", hover_color="#B71C1C").pack(side="right")
+    
+    productos_icon = cargar_icono("products.png", size=(48, 48)); usuarios_icon = cargar_icono("users.png", size=(48, 48)); historial_icon = cargar_icono("history.png", size=(48, 48)); venta_icon = cargar_icono("sales.png", size=(48, 48))
+    actions_grid = ctk.CTkFrame(master=frame, fg_color="transparent"); actions_grid.pack(fill="both", expand=True); actions_grid.grid_columnconfigure((0, 1), weight=1); actions_grid.grid_rowconfigure((0, 1), weight=1)
+    button_font = ("Roboto", 18, "bold")
+    
+    if current_user['rol'] == 'admin':
+        ctk.CTkButton(master=actions_grid, text="Gestionar Productos", height=120, font=button_font, image=productos_icon, compound="top", command=lambda: mostrar_vista("productos")).grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        # Una caja remota no administra usuarios: el servicio no expone esos métodos a las cajas
+        gestionar_usuarios = (lambda: messagebox.showinfo("Gestionar Usuarios", "Los usuarios se administran en el equipo donde corre servicio.py (con BAZAR_BACKEND=mysql o sqlite).")) if BACKEND_BD == "remoto" else (lambda: mostrar_vista("usuarios"))
+        ctk.CTkButton(master=actions_grid, text="Gestionar Usuarios", height=120, font=button_font, image=usuarios_icon, compound="top", command=gestionar_usuarios).grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
+        ctk.CTkButton(master=actions_grid, text="Historial de Ventas", height=120, font=button_font, image=historial_icon, compound="top", command=lambda: mostrar_vista("historial")).grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
+        ctk.CTkButton(master=actions_grid, text="Realizar Venta", height=120, font=button_font, image=venta_icon, compound="top", command=lambda: mostrar_vista("venta")).grid(row=1, column=1, padx=10, pady=10, sticky="nsew")
+        ctk.CTkButton(master=actions_grid, text="Reportes de Ventas", height=50, font=("Roboto", 16, "bold"), command=lambda: mostrar_vista("reportes")).grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
+        ctk.CTkButton(master=actions_grid, text="Diagnóstico", height=50, font=("Roboto", 16, "bold"), fg_color="gray30", hover_color="gray20", command=lambda: mostrar_vista("diagnostico")).grid(row=2, column=1, padx=10, pady=10, sticky="nsew")
+    else:
+        ctk.CTkButton(master=actions_grid, text="Ver Productos", height=120, font=button_font, image=productos_icon, compound="top", command=lambda: mostrar_vista("productos")).grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        ctk.CTkButton(master=actions_grid, text="Realizar Venta", height=120, font=button_font, image=venta_icon, compound="top", command=lambda: mostrar_vista("venta")).grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
+        ctk.CTkButton(master=actions_grid, text="Mi Historial de Ventas", height=120, font=button_font, image=historial_icon, compound="top", command=lambda: mostrar_vista("historial")).grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+
+    # Aviso de ventas del diario que el servidor rechazó: no se reintentan solas y alguien tiene que revisarlas
+    aviso_frame = ctk.CTkFrame(master=frame, fg_color="#E67E22", corner_radius=8)
+    label_aviso = ctk.CTkLabel(master=aviso_frame, text="", text_color="white", font=("Roboto", 14, "bold")); label_aviso.pack(side="left", padx=15, pady=8)
+    if current_user['rol'] == 'admin': ctk.CTkButton(master=aviso_frame, text="Revisar", width=100, fg_color="#D35400", hover_color="#A04000", command=lambda: mostrar_vista("ventas_rechazadas")).pack(side="right", padx=10)
+    def actualizar_aviso():
+        rechazadas = diario_ventas.contar_rechazadas()
+        if not rechazadas: aviso_frame.pack_forget(); return
+        texto = f"El servidor rechazó {rechazadas} venta(s) de esta caja."
+        label_aviso.configure(text=texto if current_user['rol'] == 'admin' else f"{texto} Avise al administrador.")
+        if not aviso_frame.winfo_manager(): aviso_frame.pack(fill="x", pady=(0, 10), before=actions_grid)
+    def sondear_aviso():
+        if not frame.winfo_exists(): return
+        if frame.winfo_ismapped(): actualizar_aviso()
+        frame.after(CONFIG.sincronizacion.aviso_rechazadas_ms, sondear_aviso)
+    actualizar_aviso(); frame.after(CONFIG.sincronizacion.aviso_rechazadas_ms, sondear_aviso)
+    return lambda **kwargs: actualizar_aviso()
+
+def mostrar_vista_productos(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Gestión de Productos", "dashboard")
+    producto_seleccionado_actual = {"id": None}
+    if current_user['rol'] == 'admin':
+        actions_frame = ctk.CTkFrame(master=frame); actions_frame.pack(fill="x", pady=10)
+        ctk.CTkButton(master=actions_frame, text="Agregar Nuevo Producto", command=lambda: mostrar_vista("formulario_producto", modo="agregar")).pack(side="left", padx=10)
+        btn_editar = ctk.CTkButton(master=actions_frame, text="Editar Producto", state="disabled"); btn_editar.pack(side="left", padx=10)
+        btn_archivar = ctk.CTkButton(master=actions_frame, text="Archivar Producto", state="disabled", fg_color="#E67E22", hover_color="#D35400"); btn_archivar.pack(side="left", padx=10)
+        btn_importar = ctk.CTkButton(master=actions_frame, text="Importar CSV"); btn_importar.pack(side="right", padx=10)
+        barra_importacion = BarraProgreso(actions_frame, side="right", padx=10)
+    tree_frame = ctk.CTkFrame(master=frame); tree_frame.pack(fill="both", expand=True, pady=10)
+    cols = ("Código", "Nombre", "Precio Neto", "Stock"); tree = ttk.Treeview(tree_frame, columns=cols, show='headings', style="Treeview")
+    for col in cols: tree.heading(col, text=col)
+    tree.column("Código", width=100, anchor='center'); tree.column("Nombre", width=300); tree.column("Precio Neto", width=120, anchor='e'); tree.column("Stock", width=100, anchor='center')
+    scrollbar = ttk.Scrollbar(tree_frame, orient="vertical"); scrollbar.pack(side="right", fill="y")
+    indicador = IndicadorCarga(tree_frame)
+    def obtener_pagina_productos(ultimo_nombre, limite):
+        if ultimo_nombre is None: catalogo.revalidar()
+        return catalogo.pagina_activos(ultimo_nombre, limite)
+    def insertar_producto(producto, posicion):
+        valores_formateados = (producto[1], producto[2], formatear_a_clp(producto[3]), producto[4]); return tree.insert("", posicion, values=valores_formateados, iid=producto[0])
+    paginador = TreeviewPaginado(tree, scrollbar, "productos", obtener_pagina_productos, lambda producto: producto[2], insertar_producto, indicador=indicador)
+    def cargar_productos(): paginador.reiniciar()
+    def aplicar_cambios(ids):
+        # Solo se tocan las filas ya cargadas; un producto nuevo aparece en su lugar al recargar la lista
+        for prod_id in ids:
+            iid, producto = str(prod_id), catalogo.por_id.get(prod_id)
+            if not tree.exists(iid): continue
+            if producto is None or producto.estado != 'activo': paginador.quitar_fila(iid)
+            else: tree.item(iid, values=(producto.codigo, producto.nombre, formatear_a_clp(producto.precio), producto.stock))
+    def vigilar_cambios():
+        # Mientras la vista está en pantalla trae los cambios de otras cajas, con la misma revalidación del Punto de Venta
+        if not frame.winfo_exists(): return
+        if frame.winfo_ismapped(): cargador.ejecutar("productos.cambios", catalogo.revalidar, lambda cambios: aplicar_cambios(cambios) if cambios else None, al_fallar=lambda err: None)
+        frame.after(int(CATALOGO_INTERVALO_REVALIDACION * 1000), vigilar_cambios)
+    tree.pack(fill='both', expand=True); cargar_productos(); vigilar_cambios()
+    if current_user['rol'] == 'admin':
+        def on_select(event):
+            if tree.selection():
+                producto_seleccionado_actual["id"] = tree.selection()[0]
+                btn_editar.configure(state="normal"); btn_archivar.configure(state="normal")
+            else:
+                producto_seleccionado_actual["id"] = None; btn_editar.configure(state="disabled"); btn_archivar.configure(state="disabled")
+        def editar_seleccionado():
+            if producto_seleccionado_actual["id"] is not None: mostrar_vista("formulario_producto", modo="editar", producto_id=producto_seleccionado_actual["id"])
+        def archivar_seleccionado():
+            if producto_seleccionado_actual["id"] is not None:
+                prod_id = producto_seleccionado_actual["id"]; nombre_prod = tree.item(prod_id, "values")[1]
+                if messagebox.askyesno("Archivar Producto", f"¿Seguro que desea archivar '{nombre_prod}'?"):
+                    def archivar():
+                        obtener_repositorio().archivar_producto(prod_id); catalogo.actualizar(int(prod_id), estado='inactivo')
+                    def al_archivar(_):
+                        if frame.winfo_exists(): cargar_productos()
+                        messagebox.showinfo("Éxito", "Producto archivado.")
+                    # Persistente: salir de la vista no debe descartar el aviso de una escritura que ya se envió
+                    cargador.ejecutar("archivar", archivar, al_archivar, indicador=indicador, persistente=True)
+        def importar_csv():
+            ruta = filedialog.askopenfilename(title="Importar productos", filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")])
+            if not ruta: return
+            btn_importar.configure(state="disabled", text="Importando...")
+            def al_importar(resultado):
+                importadas, omitidas, errores = resultado
+                if frame.winfo_exists(): btn_importar.configure(state="normal", text="Importar CSV"); cargar_productos()
+                detalle = "" if not omitidas else f"\n\n{omitidas} fila(s) omitida(s):\n" + "\n".join(f"- Línea {linea}: {motivo}" for linea, motivo in errores[:10])
+                messagebox.showinfo("Importación", f"{importadas} producto(s) importados o actualizados.{detalle}")
+            def al_fallar(err):
+                if frame.winfo_exists(): btn_importar.configure(state="normal", text="Importar CSV")
+                messagebox.showerror("Error", f"No se pudo importar el archivo: {err}")
+            cargador.ejecutar("importar_productos", lambda: importar_productos_csv(ruta, barra_importacion.avanzar), al_importar, al_fallar, indicador=barra_importacion, persistente=True)
+        tree.bind("<<TreeviewSelect>>", on_select); btn_editar.configure(command=editar_seleccionado); btn_archivar.configure(command=archivar_seleccionado); btn_importar.configure(command=importar_csv)
+    def refrescar(**kwargs):
+        producto_seleccionado_actual["id"] = None
+        if current_user['rol'] == 'admin': btn_editar.configure(state="disabled"); btn_archivar.configure(state="disabled"); btn_importar.configure(state="normal", text="Importar CSV")
+        cargar_productos()
+    return refrescar
+
+def mostrar_vista_formulario_producto(frame, modo, producto_id=None):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); frame.grid_columnconfigure(0, weight=1); frame.grid_columnconfigure(1, weight=2); frame.grid_rowconfigure(0, weight=1)
+    form_frame = ctk.CTkFrame(master=frame); form_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10)); label_titulo = ctk.CTkLabel(master=form_frame, text="", font=("Roboto", 20, "bold")); label_titulo.pack(pady=20)
+    ctk.CTkLabel(master=form_frame, text="Código:", font=("Roboto", 14)).pack(anchor="w", padx=20); entry_codigo = ctk.CTkEntry(master=form_frame, height=35, state="disabled", placeholder_text="Se genera automáticamente"); entry_codigo.pack(fill="x", padx=20)
+    ctk.CTkLabel(master=form_frame, text="Nombre:").pack(anchor="w", padx=20); entry_nombre = ctk.CTkEntry(master=form_frame, height=35); entry_nombre.pack(fill="x", padx=20)
+    ctk.CTkLabel(master=form_frame, text="Precio Neto (sin IVA):").pack(anchor="w", padx=20); entry_precio = ctk.CTkEntry(master=form_frame, height=35); entry_precio.pack(fill="x", padx=20)
+    ctk.CTkLabel(master=form_frame, text="Stock:").pack(anchor="w", padx=20); entry_stock = ctk.CTkEntry(master=form_frame, height=35); entry_stock.pack(fill="x", padx=20)
+    list_frame = ctk.CTkFrame(master=frame); list_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0)); ctk.CTkLabel(master=list_frame, text="Productos Existentes", font=("Roboto", 16, "bold")).pack(pady=10)
+    cols = ("Código", "Nombre"); tree = ttk.Treeview(list_frame, columns=cols, show='headings', style="Treeview", height=15); tree.heading("Código", text="Código"); tree.heading("Nombre", text="Nombre"); tree.column("Código", width=80, anchor="center"); tree.pack(fill="both", expand=True, padx=10, pady=10)
+    def cargar_lista_productos():
+        def mostrar_lista(productos):
+            with instrumentacion.tramo("treeview", "formulario_producto", filas=len(productos)):
+                for i in tree.get_children(): tree.delete(i)
+                for p in productos: tree.insert("", "end", values=(p.codigo, p.nombre), iid=p.id)
+        def consultar_lista():
+            catalogo.revalidar(); return catalogo.activos()
+        cargador.ejecutar("formulario_producto", consultar_lista, mostrar_lista)
+    def limpiar_campos():
+        entry_nombre.delete(0, "end"); entry_precio.delete(0, "end"); entry_stock.delete(0, "end"); entry_codigo.configure(state="normal"); entry_codigo.delete(0, "end"); entry_codigo.configure(state="disabled", placeholder_text="Se genera automáticamente")
+    def autocompletar_formulario_por_doble_clic(event):
+        if not tree.selection(): return
+        item_id = tree.selection()[0]
+        mostrar_vista("formulario_producto", modo="editar", producto_id=item_id)
+    tree.bind("<Double-1>", autocompletar_formulario_por_doble_clic)
+    def guardar_cambios(modo_guardar, p_id=None):
+        nombre, precio_str, stock_str = entry_nombre.get(), entry_precio.get(), entry_stock.get()
+        if not all([nombre, precio_str, stock_str]): messagebox.showerror("Error", "Todos los campos son obligatorios."); return
+        try: precio, stock = int(precio_str), int(stock_str)
+        except ValueError: messagebox.showerror("Error", "Precio y Stock deben ser números enteros."); return
+        def guardar(): # En un hilo de trabajo: reservar el código y escribir en la base no congelan la ventana
+            repositorio = obtener_repositorio()
+            if modo_guardar == "agregar":
+                codigo = generar_codigo_producto(nombre)
+                prod_id = repositorio.crear_producto(codigo, nombre, precio, stock)
+                catalogo.actualizar(prod_id, codigo=codigo, nombre=nombre, precio=precio, stock=stock, estado='activo')
+            elif modo_guardar == "editar":
+                repositorio.actualizar_producto(p_id, nombre, precio, stock)
+                catalogo.actualizar(int(p_id), nombre=nombre, precio=precio, stock=stock)
+        def al_guardar(_):
+            messagebox.showinfo("Éxito", "Producto agregado." if modo_guardar == "agregar" else "Producto actualizado.")
+            if not frame.winfo_exists(): return
+            btn_guardar.configure(state="normal", text="Guardar Cambios")
+            if not frame.winfo_ismapped(): return # El usuario ya se fue a otra vista: no se le trae de vuelta
+            cargar_lista_productos(); limpiar_campos()
+            if modo_guardar == "editar": mostrar_vista("productos")
+        def al_fallar(err):
+            if frame.winfo_exists(): btn_guardar.configure(state="normal", text="Guardar Cambios")
+            messagebox.showerror("Error de DB", f"No se pudo guardar: {err}")
+        btn_guardar.configure(state="disabled", text="Guardando...")
+        cargador.ejecutar("guardar_producto", guardar, al_guardar, al_fallar, persistente=True)
+    action_form_frame = ctk.CTkFrame(master=form_frame, fg_color="transparent"); action_form_frame.pack(pady=20, fill="x", padx=20)
+    btn_guardar = ctk.CTkButton(master=action_form_frame, text="Guardar Cambios", height=40); btn_guardar.pack(side="left", expand=True, padx=(0,5)); ctk.CTkButton(master=action_form_frame, text="Volver", height=40, fg_color="gray", command=lambda: mostrar_vista("productos")).pack(side="left", expand=True, padx=(5,0))
+    def preparar_formulario(modo, producto_id=None):
+        label_titulo.configure(text="Agregar Nuevo Producto" if modo == "agregar" else "Editar Producto"); limpiar_campos()
+        if modo == "agregar": btn_guardar.configure(state="normal", text="Guardar Cambios", command=lambda: guardar_cambios("agregar"))
+        elif modo == "editar" and producto_id:
+            # Guardar queda deshabilitado hasta tener los datos: así no se guarda un formulario a medio llenar
+            btn_guardar.configure(state="disabled", text="Guardar Cambios")
+            def llenar_formulario(data):
+                if not data: messagebox.showerror("Error", "El producto ya no existe."); return
+                entry_codigo.configure(state="normal"); entry_codigo.delete(0, "end"); entry_codigo.insert(0, data.codigo); entry_codigo.configure(state="disabled")
+                entry_nombre.insert(0, data.nombre); entry_precio.insert(0, str(int(round(float(data.precio))))); entry_stock.insert(0, str(data.stock))
+                btn_guardar.configure(state="normal", command=lambda: guardar_cambios("editar", producto_id))
+            cargador.ejecutar("formulario_producto.datos", lambda: catalogo.obtener(int(producto_id)), llenar_formulario) # obtener puede revalidar contra el servidor
+        cargar_lista_productos()
+    preparar_formulario(modo, producto_id)
+    return preparar_formulario
+
+def mostrar_vista_usuarios(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Gestión de Usuarios", "dashboard")
+    main_content = ctk.CTkFrame(frame, fg_color="transparent"); main_content.pack(fill="both", expand=True); main_content.grid_columnconfigure(0, weight=2); main_content.grid_columnconfigure(1, weight=1); main_content.grid_rowconfigure(0, weight=1)
+    list_frame = ctk.CTkFrame(main_content); list_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10)); ctk.CTkLabel(list_frame, text="Usuarios Registrados", font=("Roboto", 16, "bold")).pack(pady=10)
+    cols = ("ID", "Usuario", "Rol"); tree = ttk.Treeview(list_frame, columns=cols, show='headings', style="Treeview"); tree.heading("ID", text="ID"); tree.heading("Usuario", text="Usuario"); tree.heading("Rol", text="Rol"); tree.column("ID", width=50); tree.pack(fill="both", expand=True, padx=10, pady=10)
+    form_frame = ctk.CTkFrame(main_content); form_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0)); form_title = ctk.CTkLabel(form_frame, text="Agregar/Editar Usuario", font=("Roboto", 16, "bold")); form_title.pack(pady=10)
+    id_value = ctk.CTkLabel(form_frame, text=""); ctk.CTkLabel(form_frame, text="Usuario:").pack(anchor="w", padx=20); entry_usuario = ctk.CTkEntry(form_frame, height=35); entry_usuario.pack(fill="x", padx=20); ctk.CTkLabel(form_frame, text="Clave (dejar en blanco para no cambiar):").pack(anchor="w", padx=20); entry_clave = ctk.CTkEntry(form_frame, height=35); entry_clave.pack(fill="x", padx=20); ctk.CTkLabel(form_frame, text="Rol:").pack(anchor="w", padx=20); combo_rol = ctk.CTkComboBox(form_frame, height=35, values=["vendedor", "admin"], state="readonly"); combo_rol.pack(fill="x", padx=20)
+    def limpiar_formulario():
+        id_value.configure(text=""); entry_usuario.delete(0, "end"); entry_clave.delete(0, "end"); combo_rol.set(""); form_title.configure(text="Agregar Usuario"); btn_guardar.configure(command=lambda: guardar_usuario("agregar")); btn_eliminar.configure(state="disabled")
+    def cargar_usuarios():
+        def mostrar_usuarios(usuarios):
+            with instrumentacion.tramo("treeview", "usuarios", filas=len(usuarios)):
+                for i in tree.get_children(): tree.delete(i)
+                for u in usuarios: tree.insert("", "end", values=u)
+            limpiar_formulario()
+        cargador.ejecutar("usuarios", lambda: obtener_repositorio().listar_usuarios(), mostrar_usuarios, lambda err: messagebox.showerror("Error de Conexión", f"No se pudo conectar: {err}"))
+    def seleccionar_usuario(event):
+        if not tree.selection(): return
+        item = tree.item(tree.selection()[0])['values']; id_value.configure(text=str(item[0])); entry_usuario.delete(0,"end"); entry_usuario.insert(0, item[1]); combo_rol.set(item[2]); form_title.configure(text=f"Editando a: {item[1]}"); btn_guardar.configure(command=lambda: guardar_usuario("editar", item[0]))
+        if item[1] != 'admin': btn_eliminar.configure(state="normal")
+    def guardar_usuario(modo, user_id=None):
+        usuario, clave, rol = entry_usuario.get(), entry_clave.get(), combo_rol.get()
+        if not all([usuario, rol]): messagebox.showerror("Error", "Usuario y Rol son obligatorios."); return
+        if modo == "agregar" and not clave: messagebox.showerror("Error", "La clave es obligatoria para nuevos usuarios."); return
+        def guardar(): # En un hilo de trabajo: el hash bcrypt no congela la ventana
+            obtener_repositorio().guardar_usuario(usuario, rol, hashear_clave(clave) if clave else None, user_id if modo == "editar" else None)
+        def al_guardar(_):
+            messagebox.showinfo("Éxito", "Usuario agregado." if modo == "agregar" else "Usuario actualizado.")
+            if frame.winfo_exists(): btn_guardar.configure(state="normal", text="Guardar"); cargar_usuarios()
+        def al_fallar(err):
+            messagebox.showerror("Error de DB", f"No se pudo guardar: {err}")
+            if frame.winfo_exists(): btn_guardar.configure(state="normal", text="Guardar"); cargar_usuarios()
+        btn_guardar.configure(state="disabled", text="Guardando...")
+        cargador.ejecutar("guardar_usuario", guardar, al_guardar, al_fallar, persistente=True)
+    def eliminar_usuario():
+        user_id, user_name = id_value.cget("text"), entry_usuario.get()
+        if user_name == 'admin': messagebox.showerror("Error", "No se puede eliminar al usuario 'admin'."); return
+        if messagebox.askyesno("Confirmar", f"¿Seguro que desea eliminar al usuario '{user_name}'?"):
+            def al_eliminar(_):
+                if frame.winfo_exists(): cargar_usuarios()
+                messagebox.showinfo("Éxito", "Usuario eliminado.")
+            def al_fallar(err):
+                if frame.winfo_exists(): btn_eliminar.configure(state="normal")
+                messagebox.showerror("Error de DB", f"No se pudo eliminar: {err}")
+            btn_eliminar.configure(state="disabled")
+            cargador.ejecutar("eliminar_usuario", lambda: obtener_repositorio().eliminar_usuario(user_id), al_eliminar, al_fallar, persistente=True)
+    btn_guardar = ctk.CTkButton(form_frame, text="Guardar", command=lambda: guardar_usuario("agregar")); btn_guardar.pack(pady=10, fill="x", padx=20); btn_eliminar = ctk.CTkButton(form_frame, text="Eliminar Seleccionado", state="disabled", fg_color="#D32F2F", command=eliminar_usuario); btn_eliminar.pack(pady=5, fill="x", padx=20); ctk.CTkButton(form_frame, text="Limpiar / Nuevo", fg_color="gray", command=limpiar_formulario).pack(pady=5, fill="x", padx=20)
+    tree.bind("<<TreeviewSelect>>", seleccionar_usuario); cargar_usuarios()
+    return lambda **kwargs: (btn_guardar.configure(state="normal", text="Guardar"), cargar_usuarios())
+
+def mostrar_vista_venta(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Punto de Venta", "dashboard")
+    main_content = ctk.CTkFrame(frame, fg_color="transparent"); main_content.pack(fill="both", expand=True); main_content.grid_columnconfigure(0, weight=1); main_content.grid_columnconfigure(1, weight=1); main_content.grid_rowconfigure(0, weight=1)
+    carrito = Carrito(); secuencia_reservas = itertools.count(1)
+    
+    select_frame = ctk.CTkFrame(main_content); select_frame.grid(row=0, column=0, sticky="nsew", padx=(0,10))
+    ctk.CTkLabel(select_frame, text="Añadir Producto", font=("Roboto", 16, "bold")).pack(pady=10)
+    ctk.CTkLabel(select_frame, text="Buscar por nombre o código:").pack(anchor="w", padx=20); entry_busqueda = ctk.CTkEntry(select_frame, height=35, placeholder_text="Cargando productos...", state="disabled"); entry_busqueda.pack(fill="x", padx=20)
+    resultados_frame = ctk.CTkFrame(select_frame, fg_color="transparent"); resultados_frame.pack(fill="x", padx=20, pady=(5, 0))
+    cols_resultados = ("Código", "Producto", "Precio Neto", "Disponible"); tree_resultados = ttk.Treeview(resultados_frame, columns=cols_resultados, show='headings', style="Treeview", height=6, selectmode="browse")
+    for col in cols_resultados: tree_resultados.heading(col, text=col)
+    tree_resultados.column("Código", width=80, anchor="center"); tree_resultados.column("Producto", width=180); tree_resultados.column("Precio Neto", width=100, anchor="e"); tree_resultados.column("Disponible", width=80, anchor="center"); tree_resultados.pack(fill="x")
+    label_resultados = ctk.CTkLabel(select_frame, text="", font=("Roboto", 11), text_color="gray60"); label_resultados.pack(anchor="w", padx=20)
+
+    def mostrar_resultados(productos):
+        with instrumentacion.tramo("treeview", "venta.resultados", filas=len(productos)): actualizar_resultados(productos)
+
+    def actualizar_resultados(productos):
+        # Actualiza las filas existentes en lugar de borrar y volver a insertar toda la lista
+        nuevos = {str(p.id) for p in productos}
+        sobrantes = [iid for iid in tree_resultados.get_children() if iid not in nuevos]
+        if sobrantes: tree_resultados.delete(*sobrantes)
+        for posicion, p in enumerate(productos):
+            iid, valores = str(p.id), (p.codigo, p.nombre, formatear_a_clp(p.precio), p.disponible)
+            if tree_resultados.exists(iid): tree_resultados.item(iid, values=valores); tree_resultados.move(iid, "", posicion)
+            else: tree_resultados.insert("", posicion, iid=iid, values=valores)
+        if productos: tree_resultados.selection_set(str(productos[0].id))
+
+    def refrescar_disponibles(ids=None):
+        # Solo cambian precio y unidades disponibles de las filas afectadas: no reordena ni mueve la selección mientras el usuario elige
+        iids = tree_resultados.get_children() if ids is None else [str(prod_id) for prod_id in ids if tree_resultados.exists(str(prod_id))]
+        for iid in iids:
+            producto = catalogo.por_id.get(int(iid))
+            if producto is None or producto.estado != 'activo': tree_resultados.delete(iid)
+            else: tree_resultados.set(iid, "Precio Neto", formatear_a_clp(producto.precio)); tree_resultados.set(iid, "Disponible", producto.disponible)
+
+    def vigilar_disponibles():
+        # Mientras la vista está en pantalla renueva las reservas propias y trae las de otras cajas; oculta, las reservas vencen solas
+        if not frame.winfo_exists(): return
+        if frame.winfo_ismapped():
+            def revisar(): servicio_reservas.mantener(); return catalogo.revalidar()
+            cargador.ejecutar("venta.disponibles", revisar, lambda cambios: refrescar_disponibles(cambios) if cambios else None, al_fallar=lambda err: None)
+        frame.after(int(CATALOGO_INTERVALO_REVALIDACION * 1000), vigilar_disponibles)
+
+    def apartar(producto, delta, al_apartar):
+        """Aparta `delta` unidades más en el servidor y, si alcanzan, aplica el cambio al carrito con al_apartar()."""
+        def al_fallar(err):
+            if not frame.winfo_exists(): return # La vista (y su carrito) ya se destruyó
+            if isinstance(err, StockInsuficienteError): messagebox.showerror("Stock insuficiente", f"Quedan {max(0, err.faltantes[0][1])} unidad(es) de '{producto.nombre}' sin apartar por otras cajas; el carrito ya tiene {carrito.cantidad_de(producto.id)}.")
+            elif isinstance(err, ReservaEnConflictoError): messagebox.showwarning("Intente de nuevo", str(err))
+            elif carrito.cantidad_de(producto.id) + delta <= producto.stock: al_apartar() # Sin conexión se valida contra el catálogo local y la venta queda en el diario
+            else: messagebox.showerror("Stock insuficiente", f"Solo hay {producto.stock} unidades.")
+        def al_reservar(_):
+            if frame.winfo_exists(): al_apartar(); refrescar_disponibles()
+        # Persistente: una reserva ya hecha en el servidor tiene que llegar al carrito aunque el usuario cambie de vista
+        cargador.ejecutar(f"venta.reserva.{next(secuencia_reservas)}", lambda: servicio_reservas.apartar(producto.id, delta), al_reservar, al_fallar, persistente=True)
+
+    def devolver(prod_id, cantidad):
+        # Bajar una reserva no puede fallar por stock: el carrito cambia en el acto y, sin conexión, la reserva vence sola
+        cargador.ejecutar(f"venta.reserva.{next(secuencia_reservas)}", lambda: servicio_reservas.apartar(prod_id, -cantidad), lambda _: frame.winfo_exists() and refrescar_disponibles(), al_fallar=lambda err: None, persistente=True)
+
+    def al_escribir_busqueda(event=None):
+        if event is not None and event.keysym in ("Up", "Down", "Return", "KP_Enter", "Tab"): return
+        productos, completo = indice_busqueda.buscar(entry_busqueda.get())
+        mostrar_resultados(productos)
+        label_resultados.configure(text="" if not entry_busqueda.get() else f"{len(productos)} resultado(s)" + ("" if completo else " (parcial, siga escribiendo)"))
+
+    def mover_seleccion(delta):
+        filas = tree_resultados.get_children()
+        if not filas: return "break"
+        actual = tree_resultados.selection(); i = filas.index(actual[0]) if actual else -1
+        nuevo = filas[max(0, min(len(filas) - 1, i + delta))]; tree_resultados.selection_set(nuevo); tree_resultados.see(nuevo)
+        return "break"
+
+    def al_presionar_enter(event=None):
+        # Un lector de código de barras escribe el código completo y envía Enter: se agrega 1 unidad si no hay cantidad
+        producto = indice_busqueda.buscar_codigo(entry_busqueda.get()) or producto_seleccionado()
+        if producto is not None: anadir_al_carrito(producto, cantidad_por_defecto=1)
+        return "break"
+
+    def producto_seleccionado():
+        seleccion = tree_resultados.selection()
+        return catalogo.por_id.get(int(seleccion[0])) if seleccion else None
+
+    def habilitar_busqueda(_):
+        entry_busqueda.configure(state="normal", placeholder_text="Ej: bebida, PAN-0042..."); entry_busqueda.focus_set(); al_escribir_busqueda()
+    def preparar_indice():
+        try: catalogo.revalidar()
+        except errores_bd():
+            if not catalogo.por_id: raise # Sin conexión se sigue vendiendo con el catálogo ya cargado
+        indice_busqueda.asegurar_construido()
+    cargador.ejecutar("venta", preparar_indice, habilitar_busqueda); vigilar_disponibles()
+    entry_busqueda.bind("<KeyRelease>", al_escribir_busqueda); entry_busqueda.bind("<Return>", al_presionar_enter)
+    entry_busqueda.bind("<Down>", lambda e: mover_seleccion(1)); entry_busqueda.bind("<Up>", lambda e: mover_seleccion(-1))
+    ctk.CTkLabel(select_frame, text="Cantidad:").pack(anchor="w", padx=20); entry_cantidad = ctk.CTkEntry(select_frame, height=35); entry_cantidad.pack(fill="x", padx=20)
+    cart_add_icon = cargar_icono("cart-add.png", size=(20, 20))
+    ctk.CTkButton(select_frame, text="Añadir al Carrito", height=40, image=cart_add_icon, compound="left", command=lambda: anadir_al_carrito()).pack(pady=20, fill="x", padx=20)
+    
+    ctk.CTkLabel(select_frame, text="Tipo de Documento:", font=("Roboto", 16, "bold")).pack(pady=(20, 5), anchor="w", padx=20)
+    tipo_documento_var = tkinter.StringVar(value="Boleta")
+    factura_frame = ctk.CTkFrame(select_frame, fg_color="transparent")
+    def toggle_factura_fields():
+        if tipo_documento_var.get() == "Factura": factura_frame.pack(fill="x", padx=20, pady=5, after=radio_factura)
+        else: factura_frame.pack_forget()
+    radio_boleta = ctk.CTkRadioButton(select_frame, text="Boleta", variable=tipo_documento_var, value="Boleta", command=toggle_factura_fields); radio_boleta.pack(anchor="w", padx=20, pady=5)
+    radio_factura = ctk.CTkRadioButton(select_frame, text="Factura", variable=tipo_documento_var, value="Factura", command=toggle_factura_fields); radio_factura.pack(anchor="w", padx=20, pady=5)
+    entry_rut_cliente = ctk.CTkEntry(factura_frame, placeholder_text="RUT Cliente"); entry_rut_cliente.pack(fill="x", pady=5)
+    entry_nombre_cliente = ctk.CTkEntry(factura_frame, placeholder_text="Nombre o Razón Social"); entry_nombre_cliente.pack(fill="x", pady=5)
+
+    cart_frame = ctk.CTkFrame(main_content); cart_frame.grid(row=0, column=1, sticky="nsew", padx=(10,0)); ctk.CTkLabel(cart_frame, text="Carrito de Compras", font=("Roboto", 16, "bold")).pack(pady=10); cols = ("Producto", "Cant.", "Precio Neto", "Subtotal"); tree_carrito = ttk.Treeview(cart_frame, columns=cols, show='headings', style="Treeview");
+    for col in cols: tree_carrito.heading(col, text=col)
+    tree_carrito.column("Cant.", width=60, anchor="center"); tree_carrito.column("Precio Neto", width=120, anchor="e"); tree_carrito.column("Subtotal", width=120, anchor="e"); tree_carrito.pack(fill="both", expand=True, padx=10, pady=10)
+    cart_actions_frame = ctk.CTkFrame(cart_frame, fg_color="transparent"); cart_actions_frame.pack(fill="x", padx=10)
+    btn_cambiar_cantidad = ctk.CTkButton(cart_actions_frame, text="Cambiar Cantidad", state="disabled", command=lambda: editar_cantidad_seleccionada()); btn_cambiar_cantidad.pack(side="left", expand=True, fill="x", padx=(0, 5))
+    btn_quitar = ctk.CTkButton(cart_actions_frame, text="Quitar Producto", state="disabled", fg_color="#D32F2F", hover_color="#B71C1C", command=lambda: quitar_seleccionado()); btn_quitar.pack(side="left", expand=True, fill="x", padx=(5, 0))
+    
+    # Desglose de totales
+    label_neto = ctk.CTkLabel(cart_frame, text="Neto: CLP$ 0", font=("Roboto", 14)); label_neto.pack(anchor="e", padx=10)
+    label_iva = ctk.CTkLabel(cart_frame, text="IVA (19%): CLP$ 0", font=("Roboto", 14)); label_iva.pack(anchor="e", padx=10)
+    total_label = ctk.CTkLabel(cart_frame, text="TOTAL: CLP$ 0", font=("Roboto", 22, "bold")); total_label.pack(anchor="e", padx=10, pady=(5,10))
+    
+    def actualizar_vista_carrito(prod_id):
+        # Solo se toca la fila del producto afectado; los totales vienen ya acumulados en el carrito
+        iid, linea = str(prod_id), carrito.lineas.get(prod_id)
+        if linea is None:
+            if tree_carrito.exists(iid): tree_carrito.delete(iid)
+        else:
+            valores_formateados = (linea.nombre, linea.cantidad, formatear_a_clp(linea.precio), formatear_a_clp(linea.subtotal))
+            if tree_carrito.exists(iid): tree_carrito.item(iid, values=valores_formateados)
+            else: tree_carrito.insert("", "end", iid=iid, values=valores_formateados)
+        actualizar_totales()
+
+    def actualizar_totales():
+        label_neto.configure(text=f"Neto: {formatear_a_clp(carrito.neto)}")
+        label_iva.configure(text=f"IVA ({int(TASA_IVA*100)}%): {formatear_a_clp(carrito.iva)}")
+        total_label.configure(text=f"TOTAL: {formatear_a_clp(carrito.total)}")
+
+    def linea_seleccionada():
+        seleccion = tree_carrito.selection()
+        return int(seleccion[0]) if seleccion else None
+
+    def al_seleccionar_linea(event=None):
+        estado = "normal" if linea_seleccionada() is not None else "disabled"
+        btn_cambiar_cantidad.configure(state=estado); btn_quitar.configure(state=estado)
+
+    def editar_cantidad_seleccionada(event=None):
+        prod_id = linea_seleccionada()
+        if prod_id is None: return
+        linea = carrito.lineas[prod_id]
+        respuesta = ctk.CTkInputDialog(title="Cambiar Cantidad", text=f"Nueva cantidad para '{linea.nombre}' (0 para quitar):").get_input()
+        if respuesta is None or respuesta.strip() == "": return
+        try: cantidad = int(respuesta)
+        except ValueError: messagebox.showerror("Error", "Cantidad debe ser un número."); return
+        def cambiar(): carrito.cambiar_cantidad(prod_id, cantidad); actualizar_vista_carrito(prod_id); al_seleccionar_linea()
+        producto, delta = catalogo.por_id.get(prod_id), max(0, cantidad) - linea.cantidad
+        if delta > 0 and producto is not None: apartar(producto, delta, cambiar)
+        else:
+            cambiar()
+            if delta < 0: devolver(prod_id, -delta)
+
+    def quitar_seleccionado(event=None):
+        prod_id = linea_seleccionada()
+        if prod_id is None: return
+        linea = carrito.quitar(prod_id); actualizar_vista_carrito(prod_id); al_seleccionar_linea(); devolver(prod_id, linea.cantidad)
+
+    tree_carrito.bind("<<TreeviewSelect>>", al_seleccionar_linea); tree_carrito.bind("<Double-1>", editar_cantidad_seleccionada); tree_carrito.bind("<Delete>", quitar_seleccionado)
+        
+    def anadir_al_carrito(producto=None, cantidad_por_defecto=None):
+        producto, cant_str = producto or producto_seleccionado(), entry_cantidad.get() or (str(cantidad_por_defecto) if cantidad_por_defecto else "")
+        if producto is None or not cant_str: return
+        try: cantidad = int(cant_str)
+        except ValueError: messagebox.showerror("Error", "Cantidad debe ser un número."); return
+        if cantidad <= 0: messagebox.showerror("Error", "Cantidad debe ser positiva."); return
+        def agregar(): carrito.agregar(producto.id, producto.nombre, producto.precio, cantidad); actualizar_vista_carrito(producto.id)
+        apartar(producto, cantidad, agregar) # El carrito cambia cuando el servidor confirma la reserva (unos milisegundos)
+        entry_cantidad.delete(0, 'end'); entry_busqueda.delete(0, 'end'); al_escribir_busqueda(); entry_busqueda.focus_set()
+    
+    def confirmar_venta():
+        if not carrito: messagebox.showwarning("Carrito Vacío", "Debe añadir productos al carrito."); return
+        
+        tipo_doc = tipo_documento_var.get()
+        cliente_rut, cliente_nombre = None, None
+        if tipo_doc == "Factura":
+            cliente_rut, cliente_nombre = entry_rut_cliente.get(), entry_nombre_cliente.get()
+            if not cliente_rut or not cliente_nombre:
+                messagebox.showerror("Datos Faltantes", "Para una factura, debe ingresar el RUT y Nombre del cliente."); return
+
+        if not messagebox.askyesno("Confirmar", f"Total a pagar: {formatear_a_clp(carrito.total)}. ¿Continuar?"): return
+        
+        # La venta se anota en el diario local y el sincronizador la envía al servidor: confirmar no espera a MySQL
+        # Las reservas del carrito viajan con la venta: siguen apartando las unidades hasta que la boleta llega al servidor
+        reservas = servicio_reservas.actuales()
+        try: diario_ventas.anotar(current_user['usuario'], carrito.lineas_venta(), tipo_doc, cliente_rut, cliente_nombre, reservas=[reserva_id for reserva_id, _ in reservas.values()])
+        except sqlite3.Error as err: messagebox.showerror("Error", f"No se pudo guardar la venta: {err}"); return
+        servicio_reservas.olvidar(); sincronizador.avisar(); catalogo.descontar_stock({linea.id: linea.cantidad for linea in carrito}, liberadas={prod_id: cantidad for prod_id, (_, cantidad) in reservas.items()})
+        if sincronizador.en_linea is False: messagebox.showinfo("Éxito", f"Venta registrada en esta caja. Se enviará al servidor cuando vuelva la conexión ({diario_ventas.contar_pendientes()} pendiente(s)).")
+        else: messagebox.showinfo("Éxito", "Venta registrada.")
+        mostrar_vista("dashboard")
+        
+    ctk.CTkButton(cart_frame, text="Confirmar Venta", height=40, fg_color="green", command=confirmar_venta).pack(pady=10, fill="x", padx=10)
+
+    def nueva_venta(**kwargs):
+        # Al volver a la vista se parte con un carrito vacío, igual que cuando la vista se construía de cero
+        carrito.vaciar(); tree_carrito.delete(*tree_carrito.get_children()); actualizar_totales(); al_seleccionar_linea()
+        entry_busqueda.delete(0, 'end'); entry_cantidad.delete(0, 'end'); mostrar_resultados([]); label_resultados.configure(text="")
+        entry_rut_cliente.delete(0, 'end'); entry_nombre_cliente.delete(0, 'end'); tipo_documento_var.set("Boleta"); toggle_factura_fields()
+        cargador.ejecutar("venta.liberar", servicio_reservas.liberar_todas, lambda _: None, al_fallar=lambda err: None, persistente=True) # Carrito abandonado: sus reservas, si no vencieron, vuelven al stock
+        cargador.ejecutar("venta", preparar_indice, habilitar_busqueda)
+    return nueva_venta
+
+def mostrar_vista_historial(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True)
+    titulo_vista = "Historial General de Boletas" if current_user['rol'] == 'admin' else "Mi Historial de Boletas"
+    _crear_header(frame, titulo_vista, "dashboard")
+    main_content = ctk.CTkFrame(frame, fg_color="transparent"); main_content.pack(fill="both", expand=True); main_content.grid_columnconfigure(0, weight=2); main_content.grid_columnconfigure(1, weight=1); main_content.grid_rowconfigure(0, weight=1)
+    
+    left_frame = ctk.CTkFrame(main_content, fg_color="transparent"); left_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10)); filtros_frame = ctk.CTkFrame(master=left_frame); filtros_frame.pack(fill="x", pady=5)
+    ctk.CTkLabel(master=filtros_frame, text="Filtros:", font=("Roboto", 16, "bold")).pack(anchor="w", padx=10, pady=(5,0)); ctk.CTkLabel(master=filtros_frame, text="Buscar por Nombre de Producto:").pack(anchor="w", padx=10)
+    entry_producto = ctk.CTkEntry(master=filtros_frame, placeholder_text="Ej: bebida, pan..."); entry_producto.pack(fill="x", padx=10, pady=(0,10))
+    # Las boletas de meses cerrados están en el archivo: solo se consulta si el rango lo alcanza ('Desde' vacío: todo el historial)
+    rango_frame = ctk.CTkFrame(master=filtros_frame, fg_color="transparent"); rango_frame.pack(fill="x", padx=10, pady=(0, 10)); hoy = datetime.now().date()
+    ctk.CTkLabel(master=rango_frame, text="Desde (dd/mm/aaaa):").pack(side="left", padx=(0, 5)); entry_desde = ctk.CTkEntry(master=rango_frame, width=110, placeholder_text="(todo)"); entry_desde.insert(0, (hoy - timedelta(days=HISTORIAL_DIAS)).strftime('%d/%m/%Y')); entry_desde.pack(side="left")
+    ctk.CTkLabel(master=rango_frame, text="Hasta:").pack(side="left", padx=(15, 5)); entry_hasta = ctk.CTkEntry(master=rango_frame, width=110, placeholder_text="(hoy)"); entry_hasta.pack(side="left") # Vacío: la vista sigue al día aunque quede abierta
+    def buscar(event=None): aplicar_filtros()
+    for entry in (entry_producto, entry_desde, entry_hasta): entry.bind("<Return>", buscar)
+    ctk.CTkButton(master=filtros_frame, text="Buscar", command=buscar).pack(padx=10, pady=(0, 10))
+    
+    tree_frame = ctk.CTkFrame(left_frame); tree_frame.pack(fill="both", expand=True, pady=5)
+    cols = ("ID Boleta", "Fecha", "Tipo", "Total"); tree = ttk.Treeview(tree_frame, columns=cols, show='headings', style="Treeview")
+    scrollbar = ttk.Scrollbar(tree_frame, orient="vertical"); scrollbar.pack(side="right", fill="y")
+    if current_user['rol'] == 'admin':
+        tree.heading("#0", text="Vendedor"); tree.column("#0", width=180)
+    else: tree.column("#0", width=0, stretch=tkinter.NO)
+    tree.heading("ID Boleta", text="ID Boleta"); tree.heading("Fecha", text="Fecha"); tree.heading("Tipo", text="Tipo"); tree.heading("Total", text="Total Boleta")
+    tree.column("ID Boleta", width=100, anchor="center"); tree.column("Fecha", width=150); tree.column("Tipo", width=80, anchor="center"); tree.column("Total", anchor="e")
+    
+    right_frame = ctk.CTkFrame(main_content); right_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0)); ctk.CTkLabel(master=right_frame, text="Acciones", font=("Roboto", 16, "bold")).pack(pady=10)
+    ctk.CTkLabel(master=right_frame, text="Seleccione una boleta\n(fila con ID) para ver\nsus detalles completos.", justify="center", wraplength=250).pack(pady=20, padx=10)
+    btn_ver_detalle = ctk.CTkButton(master=right_frame, text="Ver Detalle de Boleta", state="disabled"); btn_ver_detalle.pack(pady=10, padx=20, fill="x")
+    
+    def on_tree_select(event):
+        if tree.selection():
+            selected_item = tree.selection()[0]
+            if tree.parent(selected_item) or current_user['rol'] == 'vendedor': btn_ver_detalle.configure(state="normal")
+            else: btn_ver_detalle.configure(state="disabled")
+        else: btn_ver_detalle.configure(state="disabled")
+        
+    def ver_detalle_seleccionado():
+        if tree.selection():
+            selected_item = tree.selection()[0]
+            if tree.parent(selected_item) or current_user['rol'] == 'vendedor':
+                boleta_id = tree.item(selected_item, "values")[0]; mostrar_vista("detalle_boleta", boleta_id=boleta_id)
+
+    tree.bind("<<TreeviewSelect>>", on_tree_select); btn_ver_detalle.configure(command=ver_detalle_seleccionado); tree.pack(fill='both', expand=True)
+    indicador = IndicadorCarga(tree_frame)
+
+    es_admin = current_user['rol'] == 'admin'
+    padres_vendedor = {}; conteo_vendedor = {}
+    def etiqueta_vendedor(vendedor):
+        nombre = vendedor if vendedor else "Desconocido"
+        return f" {nombre} ({conteo_vendedor[vendedor]} boletas)" if vendedor in conteo_vendedor else f" {nombre}"
+
+    def insertar_boleta(boleta, posicion):
+        parent_id = ""
+        if es_admin:
+            vendedor = boleta[2] or ""; parent_id = padres_vendedor.get(vendedor)
+            if not parent_id or not tree.exists(parent_id):
+                parent_id = padres_vendedor[vendedor] = tree.insert("", posicion, text=etiqueta_vendedor(vendedor), open=True)
+        valores_formateados = (boleta[0], boleta[1].strftime('%d/%m/%Y %H:%M'), boleta[4], formatear_a_clp(boleta[3]))
+        return tree.insert(parent_id, posicion, values=valores_formateados)
+
+    def mostrar_conteos(conteos):
+        conteo_vendedor.clear(); conteo_vendedor.update(conteos)
+        for vendedor, parent_id in padres_vendedor.items():
+            if tree.exists(parent_id): tree.item(parent_id, text=etiqueta_vendedor(vendedor))
+
+    paginador = TreeviewPaginado(tree, scrollbar, "historial", None, lambda boleta: (boleta[2] or "", boleta[1], boleta[0]), insertar_boleta, indicador=indicador, agrupado=es_admin)
+
+    def leer_rango():
+        try: desde, hasta = [datetime.strptime(entry.get().strip(), '%d/%m/%Y').date() if entry.get().strip() else None for entry in (entry_desde, entry_hasta)]
+        except ValueError: messagebox.showerror("Error", "Las fechas deben tener el formato dd/mm/aaaa."); return None
+        if desde and hasta and desde > hasta: messagebox.showerror("Error", "La fecha 'Desde' no puede ser posterior a 'Hasta'."); return None
+        return desde, hasta
+
+    def aplicar_filtros():
+        rango = leer_rango()
+        if rango is None: return
+        btn_ver_detalle.configure(state="disabled"); padres_vendedor.clear(); conteo_vendedor.clear()
+        texto_producto, vendedor = entry_producto.get(), None if es_admin else current_user['usuario']; desde, hasta = rango
+        paginador.reiniciar(lambda cursor, limite: pagina_historial(texto_producto, vendedor, es_admin, cursor, limite, desde, hasta))
+        if es_admin: cargador.ejecutar("historial_conteos", lambda: conteos_historial(texto_producto, vendedor, desde, hasta), mostrar_conteos)
+    
+    aplicar_filtros()
+    return lambda **kwargs: aplicar_filtros()
+
+def mostrar_vista_reportes(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Reportes de Ventas", "dashboard")
+    filtros_frame = ctk.CTkFrame(master=frame); filtros_frame.pack(fill="x", pady=(0, 10))
+    hoy = datetime.now().date()
+    ctk.CTkLabel(master=filtros_frame, text="Desde (dd/mm/aaaa):").pack(side="left", padx=(10, 5), pady=10); entry_desde = ctk.CTkEntry(master=filtros_frame, width=110); entry_desde.insert(0, (hoy - timedelta(days=30)).strftime('%d/%m/%Y')); entry_desde.pack(side="left")
+    ctk.CTkLabel(master=filtros_frame, text="Hasta:").pack(side="left", padx=(15, 5)); entry_hasta = ctk.CTkEntry(master=filtros_frame, width=110); entry_hasta.insert(0, hoy.strftime('%d/%m/%Y')); entry_hasta.pack(side="left")
+    granularidades = {"Día": "dia", "Semana": "semana", "Mes": "mes"}
+    selector_granularidad = ctk.CTkSegmentedButton(master=filtros_frame, values=list(granularidades)); selector_granularidad.set("Día"); selector_granularidad.pack(side="left", padx=15)
+    ctk.CTkButton(master=filtros_frame, text="Generar", width=120, command=lambda: generar_reporte()).pack(side="left", padx=10)
+    btn_exportar = ctk.CTkButton(master=filtros_frame, text="Exportar Ventas CSV", width=160, command=lambda: exportar_csv()); btn_exportar.pack(side="left", padx=10)
+    barra_exportacion = BarraProgreso(filtros_frame, side="left", padx=10)
+
+    totales_frame = ctk.CTkFrame(master=frame, fg_color="transparent"); totales_frame.pack(fill="x")
+    label_totales = ctk.CTkLabel(master=totales_frame, text="", font=("Roboto", 14, "bold")); label_totales.pack(anchor="w", padx=10)
+
+    tabs = ctk.CTkTabview(master=frame); tabs.pack(fill="both", expand=True, pady=10)
+    def crear_tabla(tab, columnas, anchos):
+        tree = ttk.Treeview(tabs.add(tab), columns=columnas, show='headings', style="Treeview")
+        for col, ancho in zip(columnas, anchos): tree.heading(col, text=col); tree.column(col, width=ancho, anchor="w" if ancho >= 200 else "e")
+        tree.pack(fill="both", expand=True); return tree
+    tree_periodo = crear_tabla("Por Período", ("Período", "Boletas", "Neto", "IVA", "Total"), (200, 100, 150, 150, 150))
+    tree_vendedor = crear_tabla("Por Vendedor", ("Vendedor", "Boletas", "Neto", "IVA", "Total"), (200, 100, 150, 150, 150))
+    tree_productos = crear_tabla("Por Producto", ("Código", "Producto", "Unidades", "Neto", "IVA"), (100, 300, 100, 150, 150))
+    indicador = IndicadorCarga(tabs)
+
+    def llenar(tree, filas):
+        with instrumentacion.tramo("treeview", f"reportes.{tree.heading('#1', 'text')}", filas=len(filas)):
+            tree.delete(*tree.get_children())
+            for fila in filas: tree.insert("", "end", values=fila)
+
+    def mostrar_reporte(datos):
+        granularidad, por_periodo, por_vendedor, por_producto = datos
+        formato_periodo = {"dia": '%d/%m/%Y', "semana": 'Semana del %d/%m/%Y', "mes": '%m/%Y'}[granularidad]
+        llenar(tree_periodo, [(p.strftime(formato_periodo), b, formatear_a_clp(n), formatear_a_clp(i), formatear_a_clp(t)) for p, b, n, i, t in por_periodo])
+        llenar(tree_vendedor, [(v or "Desconocido", b, formatear_a_clp(n), formatear_a_clp(i), formatear_a_clp(t)) for v, b, n, i, t in por_vendedor])
+        llenar(tree_productos, [(c, nom, u, formatear_a_clp(n), formatear_a_clp(i)) for _, c, nom, u, n, i in por_producto])
+        boletas = sum(f[1] for f in por_vendedor); neto = sum(f[2] for f in por_vendedor); iva = sum(f[3] for f in por_vendedor); total = sum(f[4] for f in por_vendedor)
+        label_totales.configure(text=f"{boletas} documentos  |  Neto: {formatear_a_clp(neto)}  |  IVA: {formatear_a_clp(iva)}  |  Total: {formatear_a_clp(total)}")
+
+    def leer_rango():
+        try: desde, hasta = datetime.strptime(entry_desde.get(), '%d/%m/%Y').date(), datetime.strptime(entry_hasta.get(), '%d/%m/%Y').date()
+        except ValueError: messagebox.showerror("Error", "Las fechas deben tener el formato dd/mm/aaaa."); return None
+        if desde > hasta: messagebox.showerror("Error", "La fecha 'Desde' no puede ser posterior a 'Hasta'."); return None
+        return desde, hasta
+
+    def generar_reporte():
+        rango = leer_rango()
+        if rango is None: return
+        desde, hasta = rango; granularidad = granularidades[selector_granularidad.get()]
+        cargador.ejecutar("reportes", lambda: (granularidad, reporte_ventas_por_periodo(desde, hasta, granularidad), reporte_por_vendedor(desde, hasta), reporte_por_producto(desde, hasta)), mostrar_reporte, indicador=indicador)
+
+    def exportar_csv():
+        rango = leer_rango()
+        if rango is None: return
+        desde, hasta = rango
+        ruta = filedialog.asksaveasfilename(title="Exportar ventas", defaultextension=".csv", initialfile=f"ventas_{desde:%Y%m%d}_{hasta:%Y%m%d}.csv", filetypes=[("Archivos CSV", "*.csv")])
+        if not ruta: return
+        btn_exportar.configure(state="disabled", text="Exportando...")
+        def al_exportar(filas):
+            btn_exportar.configure(state="normal", text="Exportar Ventas CSV"); messagebox.showinfo("Exportación", f"Se exportaron {filas} línea(s) de venta a:\n{ruta}")
+        def al_fallar(err):
+            btn_exportar.configure(state="normal", text="Exportar Ventas CSV"); messagebox.showerror("Error", f"No se pudo exportar: {err}")
+        cargador.ejecutar("exportar_ventas", lambda: exportar_ventas_csv(ruta, desde, hasta, barra_exportacion.avanzar), al_exportar, al_fallar, indicador=barra_exportacion)
+
+    generar_reporte()
+    def refrescar(**kwargs):
+        btn_exportar.configure(state="normal", text="Exportar Ventas CSV"); generar_reporte()
+    return refrescar
+
+def mostrar_vista_detalle_boleta(frame, boleta_id):
+    # Los widgets se crean una vez; las líneas van en un Treeview, que solo dibuja las filas visibles aunque la factura tenga cientos
+    frame.pack(pady=20, padx=20, fill="both", expand=True); label_titulo = _crear_header(frame, "", "historial")
+    detalle_frame = ctk.CTkFrame(master=frame, corner_radius=10); detalle_frame.pack(fill="both", expand=True, padx=20, pady=10)
+    info_grid = ctk.CTkFrame(detalle_frame, fg_color="transparent"); info_grid.pack(pady=(20, 10), padx=40, fill="x")
+    info_grid.grid_columnconfigure(0, weight=1); info_grid.grid_columnconfigure(1, weight=2)
+    def crear_fila_detalle(parent, label_text, row, font_size=14, is_bold=False, value_color=None):
+        label_font = ("Roboto", font_size); value_font = ("Roboto", font_size, "bold") if is_bold else ("Roboto", font_size)
+        etiqueta = ctk.CTkLabel(parent, text=label_text, font=label_font, anchor="e"); etiqueta.grid(row=row, column=0, sticky="e", padx=(0, 10), pady=4)
+        valor = ctk.CTkLabel(parent, text="", font=value_font, anchor="w", text_color=value_color); valor.grid(row=row, column=1, sticky="w", padx=(10, 0), pady=4)
+        return etiqueta, valor
+
+    filas = {clave: crear_fila_detalle(info_grid, texto, i) for i, (clave, texto) in enumerate((("tipo", "Tipo Documento:"), ("id", "ID de Boleta:"), ("fecha", "Fecha y Hora:"), ("vendedor", "Vendido por:"), ("rut", "RUT Cliente:"), ("cliente", "Nombre Cliente:")))}
+    ctk.CTkLabel(detalle_frame, text="Productos:", font=("Roboto", 14, "bold")).pack(pady=(0, 5))
+    tabla_frame = ctk.CTkFrame(detalle_frame, fg_color="transparent"); tabla_frame.pack(fill="both", expand=True, padx=40)
+    cols = ("Código", "Producto", "Cantidad", "P. Unitario (Neto)", "Subtotal (Neto)"); tree = ttk.Treeview(tabla_frame, columns=cols, show='headings', style="Treeview")
+    for col in cols: tree.heading(col, text=col)
+    tree.column("Código", width=90, anchor="center"); tree.column("Producto", width=220); tree.column("Cantidad", width=80, anchor="center"); tree.column("P. Unitario (Neto)", width=130, anchor="e"); tree.column("Subtotal (Neto)", width=130, anchor="e")
+    scrollbar = ttk.Scrollbar(tabla_frame, orient="vertical", command=tree.yview); tree.configure(yscrollcommand=scrollbar.set); scrollbar.pack(side="right", fill="y"); tree.pack(fill="both", expand=True)
+    totales_grid = ctk.CTkFrame(detalle_frame, fg_color="transparent"); totales_grid.pack(pady=10, padx=40, fill="x")
+    totales_grid.grid_columnconfigure(0, weight=1); totales_grid.grid_columnconfigure(1, weight=2)
+    filas["neto"] = crear_fila_detalle(totales_grid, "Neto:", 0); filas["iva"] = crear_fila_detalle(totales_grid, f"IVA ({int(TASA_IVA*100)}%):", 1)
+    filas["total"] = crear_fila_detalle(totales_grid, "TOTAL:", 2, font_size=18, is_bold=True, value_color="#2ECC71")
+    label_vacio = ctk.CTkLabel(detalle_frame, text="No se encontraron datos para esta boleta.", font=("Roboto", 16))
+    indicador = IndicadorCarga(detalle_frame, texto="Cargando detalle...")
+
+    def limpiar():
+        for _, valor in filas.values(): valor.configure(text="")
+        tree.delete(*tree.get_children())
+
+    def mostrar_detalle(detalle):
+        if detalle is None: label_vacio.place(relx=0.5, rely=0.5, anchor="center"); return
+        campos, lineas = detalle
+        for clave, (_, valor) in filas.items(): valor.configure(text=campos[clave])
+        for clave in ("rut", "cliente"):
+            for widget in filas[clave]:
+                if campos["tipo"] == "Factura": widget.grid()
+                else: widget.grid_remove()
+        with instrumentacion.tramo("treeview", "detalle_boleta", filas=len(lineas)):
+            tree.delete(*tree.get_children())
+            for linea in lineas: tree.insert("", "end", values=linea)
+
+    def cargar_boleta(boleta_id):
+        label_titulo.configure(text=f"Detalle de Boleta #{boleta_id}"); label_vacio.place_forget()
+        detalle = detalles_boleta.en_cache(boleta_id)
+        if detalle is not None: cargador.cancelar("detalle_boleta"); mostrar_detalle(detalle); return
+        limpiar(); cargador.ejecutar("detalle_boleta", lambda: detalles_boleta.obtener(boleta_id), mostrar_detalle, indicador=indicador)
+    cargar_boleta(boleta_id)
+    return cargar_boleta
+
+def mostrar_vista_diagnostico(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Diagnóstico de Rendimiento", "dashboard")
+    barra_frame = ctk.CTkFrame(master=frame); barra_frame.pack(fill="x", pady=(0, 10))
+    ctk.CTkButton(master=barra_frame, text="Actualizar", width=120, command=lambda: actualizar()).pack(side="left", padx=10, pady=10)
+    ctk.CTkButton(master=barra_frame, text="Reiniciar Contadores", width=160, fg_color="gray", command=lambda: (instrumentacion.reiniciar(), actualizar())).pack(side="left", padx=10)
+    btn_traza = ctk.CTkButton(master=barra_frame, text="", width=140, command=lambda: alternar_traza()); btn_traza.pack(side="right", padx=10)
+    label_traza = ctk.CTkLabel(master=barra_frame, text="", text_color="gray60"); label_traza.pack(side="right", padx=10)
+
+    tabs = ctk.CTkTabview(master=frame); tabs.pack(fill="both", expand=True)
+    columnas = ("Nombre", "Veces", "Filas", "p50 ms", "p95 ms", "p99 ms", "Máx ms", "Total s")
+    def crear_tabla(tab):
+        tree = ttk.Treeview(tabs.add(tab), columns=columnas, show='headings', style="Treeview")
+        for col in columnas: tree.heading(col, text=col); tree.column(col, width=560 if col == "Nombre" else 80, anchor="w" if col == "Nombre" else "e")
+        tree.pack(fill="both", expand=True)
+        tree.bind("<Double-1>", lambda event: tree.selection() and messagebox.showinfo("Detalle", tree.item(tree.selection()[0], "values")[0]))
+        return tree
+    tablas = {"sql": crear_tabla("Consultas"), "vista": crear_tabla("Vistas"), "treeview": crear_tabla("Tablas"), "servicio": crear_tabla("Servicio")}
+    texto_estado = ctk.CTkTextbox(master=tabs.add("Conexiones"), font=("Courier", 12)); texto_estado.pack(fill="both", expand=True)
+
+    def actualizar():
+        for categoria, tree in tablas.items():
+            tree.delete(*tree.get_children())
+            for nombre, veces, filas, p50, p95, p99, maximo, total in instrumentacion.resumen(categoria):
+                tree.insert("", "end", values=(nombre, veces, filas, f"{p50 * 1000:.1f}", f"{p95 * 1000:.1f}", f"{p99 * 1000:.1f}", f"{maximo * 1000:.1f}", f"{total:.2f}"))
+        estado_servidor = {True: "en línea", False: f"sin conexión ({sincronizador.ultimo_error})", None: "sin verificar"}[sincronizador.en_linea]
+        texto = f"Backend: {obtener_repositorio().nombre}\nVentas pendientes de envío: {diario_ventas.contar_pendientes()} (servidor {estado_servidor})\nVentas rechazadas por el servidor: {diario_ventas.contar_rechazadas()}\n\n{obtener_pool().resumen()}\n\n{gestor_vistas.resumen_tiempos()}"
+        texto_estado.configure(state="normal"); texto_estado.delete("1.0", "end"); texto_estado.insert("1.0", texto); texto_estado.configure(state="disabled")
+        label_traza.configure(text=f"Traza: {instrumentacion.ruta_traza}" if instrumentacion.ruta_traza else "Traza desactivada")
+        btn_traza.configure(text="Detener Traza" if instrumentacion.ruta_traza else "Iniciar Traza")
+
+    def alternar_traza():
+        if instrumentacion.ruta_traza:
+            ruta = instrumentacion.ruta_traza; instrumentacion.detener_traza()
+            messagebox.showinfo("Traza", f"Traza guardada en:\n{ruta}\n\nSe abre en https://ui.perfetto.dev o chrome://tracing.")
+        else:
+            ruta = filedialog.asksaveasfilename(title="Guardar traza", defaultextension=".json", initialfile=f"traza_{datetime.now():%Y%m%d_%H%M%S}.json", filetypes=[("Traza JSON", "*.json")])
+            if not ruta: return
+            try: instrumentacion.iniciar_traza(ruta)
+            except OSError as err: messagebox.showerror("Error", f"No se pudo crear el archivo: {err}"); return
+        actualizar()
+
+    actualizar()
+    return lambda **kwargs: actualizar()
+
+def mostrar_vista_ventas_rechazadas(frame, **kwargs):
+    frame.pack(pady=20, padx=20, fill="both", expand=True); _crear_header(frame, "Ventas Rechazadas por el Servidor", "dashboard")
+    ctk.CTkLabel(master=frame, text="Estas ventas se hicieron en esta caja pero el servidor no las registró. Reintente después de corregir la causa (p. ej. reponer el stock) o descártelas.", wraplength=1100, justify="left").pack(anchor="w", pady=(0, 10))
+    cols = ("Fecha", "Vendedor", "Documento", "Productos", "Neto", "Intentos", "Motivo")
+    tree = ttk.Treeview(frame, columns=cols, show='headings', style="Treeview")
+    for col, ancho in zip(cols, (140, 100, 90, 300, 90, 70, 360)): tree.heading(col, text=col); tree.column(col, width=ancho)
+    tree.pack(fill="both", expand=True)
+    acciones_frame = ctk.CTkFrame(master=frame, fg_color="transparent"); acciones_frame.pack(fill="x", pady=10)
+    btn_reintentar = ctk.CTkButton(master=acciones_frame, text="Reintentar Envío", state="disabled", command=lambda: reintentar()); btn_reintentar.pack(side="left", padx=10)
+    btn_descartar = ctk.CTkButton(master=acciones_frame, text="Descartar Venta", state="disabled", fg_color="#D32F2F", hover_color="#B71C1C", command=lambda: descartar()); btn_descartar.pack(side="left", padx=10)
+    def cargar():
+        nombres = {p.id: p.nombre for p in catalogo.todos()} # Solo la caché: sin consultas al servidor desde el hilo de la interfaz
+        tree.delete(*tree.get_children())
+        for clave, creada_en, vendedor, tipo_doc, lineas, intentos, motivo in diario_ventas.rechazadas():
+            productos = ", ".join(f"{cantidad} x {nombres.get(prod_id, f'producto {prod_id}')}" for prod_id, cantidad, _, _ in lineas)
+            tree.insert("", "end", iid=clave, values=(creada_en, vendedor, tipo_doc, productos, formatear_a_clp(sum(linea[3] for linea in lineas)), intentos, motivo))
+        seleccionar()
+    def seleccionar(event=None):
+        estado = "normal" if tree.selection() else "disabled"; btn_reintentar.configure(state=estado); btn_descartar.configure(state=estado)
+    def reintentar():
+        for clave in tree.selection(): diario_ventas.reintentar(clave)
+        sincronizador.avisar(); cargar()
+        messagebox.showinfo("Reintento", "Las ventas seleccionadas volvieron a la cola de envío. Si el servidor las rechaza otra vez, aparecerán de nuevo en esta lista.")
+    def descartar():
+        seleccion = tree.selection()
+        if not messagebox.askyesno("Confirmar", f"¿Descartar {len(seleccion)} venta(s)? No quedarán registradas en el servidor y no se podrán recuperar."): return
+        for clave in seleccion: diario_ventas.descartar(clave)
+        cargar()
+    tree.bind("<<TreeviewSelect>>", seleccionar); cargar()
+    return lambda **kwargs: cargar()
+
+# nombre -> (constructor, geometría de la ventana, depende del usuario)
+VISTAS = {
+    "login": (mostrar_vista_login, "400x500", False),
+    "dashboard": (mostrar_vista_dashboard, "800x600", True),
+    "productos": (mostrar_vista_productos, "1000x600", True),
+    "formulario_producto": (mostrar_vista_formulario_producto, "1100x600", True),
+    "usuarios": (mostrar_vista_usuarios, "1100x600", True),
+    "venta": (mostrar_vista_venta, "1200x700", True),
+    "historial": (mostrar_vista_historial, "1200x700", True),
+    "detalle_boleta": (mostrar_vista_detalle_boleta, "800x600", True),
+    "reportes": (mostrar_vista_reportes, "1200x700", True),
+    "diagnostico": (mostrar_vista_diagnostico, "1200x700", True),
+    "ventas_rechazadas": (mostrar_vista_ventas_rechazadas, "1200x700", True),
+}
+
+# ==============================================================================
+# 6. PUNTO DE ENTRADA PRINCIPAL
+# ==============================================================================
+def marcar_arranque(etapa, desde):
+    ahora = time.perf_counter(); TIEMPOS_ARRANQUE.append((etapa, ahora - desde)); return ahora
+
+def reporte_arranque():
+    lineas = [f"Arranque: {(time.perf_counter() - _INICIO_PROCESO) * 1000:.0f} ms hasta la primera vista"]
+    lineas += [f"  {etapa:<40} {segundos * 1000:8.1f} ms" for etapa, segundos in TIEMPOS_ARRANQUE]
+    return "\n".join(lineas)
+
+def al_fallar_inicio_bd(err):
+    # La aplicación sigue abierta: una caja con sesión iniciada vende contra el diario local hasta que vuelva el servidor
+    messagebox.showwarning("Error de Conexión", f"No se pudo conectar: {err}\n\nLas ventas se guardarán en esta caja y se enviarán al servidor cuando vuelva la conexión.")
+
+if __name__ == "__main__":
+    if "--calibrar-bcrypt" in sys.argv:
+        costo, medidas = calibrar_costo_bcrypt()
+        for costo_medido, ms in medidas: print(f"  costo {costo_medido:>2}: {ms:8.1f} ms por hash")
+        print(f"Costo sugerido para ~{BCRYPT_OBJETIVO_MS:.0f} ms por hash: BAZAR_BCRYPT_COSTO={costo}"); sys.exit(0)
+    if "--archivar-ventas" in sys.argv:
+        # Para el programador de tareas de un bazar con MySQL y sin servicio.py: una pasada del archivado y termina
+        iniciar_bd(); movidas = ArchivadorVentas().archivar()
+        print(f"Se archivaron {movidas} boleta(s) anteriores al {corte_archivo():%d/%m/%Y}."); obtener_repositorio().cerrar(); sys.exit(0)
+    t = marcar_arranque("imports de la librería estándar", _INICIO_PROCESO)
+    if RUTA_TRAZA: instrumentacion.iniciar_traza(RUTA_TRAZA)
+    ctk.set_appearance_mode("dark")
+    ctk.set_default_color_theme("blue")
+    root = ctk.CTk()
+    root.title("Sistema Bazar Integrado 2025")
+    root.geometry("800x600")
+
+    root.update_idletasks(); x = (root.winfo_screenwidth() // 2) - (root.winfo_width() // 2); y = (root.winfo_screenheight() // 2) - (root.winfo_height() // 2); root.geometry(f'+{x}+{y}')
+
+    content_frame = ctk.CTkFrame(master=root, fg_color="transparent")
+    content_frame.pack(fill="both", expand=True)
+    gestor_vistas = GestorVistas(content_frame, VISTAS)
+    diario_ventas = DiarioVentas(); sincronizador = SincronizadorVentas(diario_ventas); sincronizador.iniciar()
+    archivador = ArchivadorVentas() if BACKEND_BD == "sqlite" else None # Con MySQL archiva servicio.py o la tarea programada, no cada caja
+    if archivador: archivador.iniciar()
+
+    configurar_estilo_treeview()
+    t = marcar_arranque("ventana principal y estilos", t)
+    # La verificación del esquema (y el import de mysql.connector) corre en un hilo mientras se dibuja el login
+    inicio_bd = time.perf_counter()
+    cargador.ejecutar("iniciar_bd", iniciar_bd, lambda version: TIEMPOS_ARRANQUE.append((f"verificación de esquema (v{version})", time.perf_counter() - inicio_bd)), al_fallar_inicio_bd, persistente=True)
+    
+    mostrar_vista("login")
+    t = marcar_arranque("vista de login", t)
+    if os.environ.get("BAZAR_TIEMPOS_ARRANQUE"): root.after(1000, lambda: print(reporte_arranque()))
+    
+    root.mainloop()
+    cargador.cerrar(); sincronizador.detener(); diario_ventas.cerrar()
+    if archivador: archivador.detener()
+    try: servicio_reservas.liberar_todas()
+    except Exception as err: print(f"ADVERTENCIA: No se pudieron liberar las reservas de stock; vencerán solas. Error: {err}")
+    if os.environ.get("BAZAR_TIEMPOS_VISTAS"): print(gestor_vistas.resumen_tiempos())
+    if _repositorio is not None:
+        if os.environ.get("BAZAR_ESTADISTICAS_POOL"): print(_repositorio.pool.resumen())
+        _repositorio.cerrar()
+    instrumentacion.detener_traza()
\ No newline at end of file
@@ -0,0 +1,302 @@
+# ==============================================================================
+# BANCO DE PRUEBAS DE RENDIMIENTO (SIN INTERFAZ) PARA bazar.py
+# ==============================================================================
+# Mide los caminos críticos de bazar.py (catálogo, búsqueda del Punto de Venta, historial, boletas, reportes, registro de
+# ventas y, con pantalla, los Treeview) sobre una base SQLite sintética que se genera una vez por --productos, --boletas
+# y --semilla. Informa operaciones por segundo y percentiles y los compara con una línea base guardada; las ventas que
+# registra se deshacen al terminar.
+#
+#   python benchmark.py --guardar-base        # antes del cambio
+#   python benchmark.py                       # después: sale con código 1 si algún escenario empeoró
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+PALABRAS = ("Arroz", "Azúcar", "Aceite", "Bebida", "Galletas", "Fideos", "Harina", "Leche", "Yogur", "Queso", "Jamón", "Pan", "Café", "Té",
+            "Detergente", "Jabón", "Shampoo", "Cloro", "Servilletas", "Chocolate", "Cerveza", "Jugo", "Agua", "Atún", "Salsa", "Mantequilla")
+VARIANTES = ("Grande", "Chico", "Light", "Integral", "Familiar", "Premium", "Económico", "Zero", "Natural", "Clásico", "Extra", "Mini")
+VENDEDORES = tuple(f"vendedor{i}" for i in range(1, 9)) + ("admin",)
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento de bazar.py sobre datos sintéticos.")
+    parser.add_argument("--productos", type=int, default=10_000)
+    parser.add_argument("--boletas", type=int, default=1_000_000)
+    parser.add_argument("--semilla", type=int, default=2025)
+    parser.add_argument("--ruta", default=os.path.join(DIRECTORIO, "benchmark.db"), help="Base SQLite de trabajo (se crea si no existe)")
+    parser.add_argument("--repeticiones", type=int, default=200, help="Mediciones por escenario (los escenarios pesados usan menos)")
+    parser.add_argument("--linea-base", default=os.path.join(DIRECTORIO, "benchmark_base.json"))
+    parser.add_argument("--guardar-base", action="store_true", help="Guarda los resultados como nueva línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.20, help="Empeoramiento relativo de p50 o p95 que cuenta como regresión")
+    parser.add_argument("--solo", default="", help="Mide solo los escenarios que empiezan con este prefijo")
+    parser.add_argument("--regenerar", action="store_true", help="Vuelve a generar los datos aunque la base ya exista")
+    return parser.parse_args(argv)
+
+bazar = None # Se importa en importar_bazar(), una vez elegida la base de trabajo
+
+def importar_bazar(args):
+    """Importa bazar.py sobre la base SQLite de trabajo, elegida con las variables de entorno que lee al importarse."""
+    global bazar
+    os.environ["BAZAR_BACKEND"] = "sqlite"; os.environ["BAZAR_SQLITE_RUTA"] = args.ruta
+    os.environ["BAZAR_DIARIO_VENTAS"] = os.path.join(tempfile.mkdtemp(prefix="bazar-bench-"), "diario.db")
+    sys.path.insert(0, DIRECTORIO)
+    import bazar
+
+
+# ==============================================================================
+# 1. GENERACIÓN DE DATOS SINTÉTICOS
+# ==============================================================================
+def parametros_generacion(args):
+    return {"productos": args.productos, "boletas": args.boletas, "semilla": args.semilla}
+
+def base_reutilizable(args):
+    """True si args.ruta ya tiene datos generados con los mismos parámetros. Nunca borra una base que no creó el benchmark."""
+    ruta = args.ruta
+    if not os.path.exists(ruta): return False
+    conn = sqlite3.connect(ruta)
+    try: guardados = dict(conn.execute("SELECT clave, valor FROM benchmark_parametros").fetchall())
+    except sqlite3.OperationalError: sys.exit(f"ERROR: {ruta} existe y no es una base del benchmark; use otra --ruta.")
+    finally: conn.close()
+    if guardados == {clave: str(valor) for clave, valor in parametros_generacion(args).items()} and not args.regenerar: return True
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo): os.remove(ruta + sufijo)
+    return False
+
+def generar_datos(args):
+    rng = random.Random(args.semilla); inicio = time.perf_counter()
+    bazar.iniciar_bd(); repositorio = bazar.obtener_repositorio()
+    # Catálogo: nombres únicos y códigos numerados por prefijo, como los entrega el asignador
+    productos, siguientes = [], {}
+    for i in range(args.productos):
+        nombre = f"{rng.choice(PALABRAS)} {rng.choice(VARIANTES)} {i + 1}"; prefijo = bazar.prefijo_codigo(nombre)
+        siguientes[prefijo] = numero = siguientes.get(prefijo, 0) + 1
+        productos.append((i + 1, bazar.formatear_codigo(prefijo, numero), nombre, rng.randrange(300, 15_000, 10), 1_000_000))
+    precios = {prod_id: precio for prod_id, _, _, precio, _ in productos}
+    with repositorio.pool.obtener(origen="benchmark") as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO productos (id, codigo, nombre, precio, stock) VALUES (%s, %s, %s, %s, %s)", productos); conn.commit()
+    repositorio.avanzar_secuencias(siguientes)
+
+    # Historial: un año de ventas con fechas crecientes; unos pocos productos concentran la mayoría de las líneas
+    lote, fin = 20_000, datetime.now().replace(microsecond=0); paso = timedelta(days=365) / max(args.boletas, 1)
+    fecha, detalle_id = fin - timedelta(days=365), 0
+    with repositorio.pool.obtener(origen="benchmark") as conn:
+        cursor = conn.cursor()
+        for desde in range(0, args.boletas, lote):
+            boletas, detalle = [], []
+            for boleta_id in range(desde + 1, min(desde + lote, args.boletas) + 1):
+                fecha += paso; neto = 0
+                for _ in range(rng.choice((1, 1, 2, 2, 3, 4, 6))):
+                    prod_id = min(int(rng.expovariate(8 / args.productos)), args.productos - 1) + 1; cantidad = rng.choice((1, 1, 1, 2, 3))
+                    subtotal = precios[prod_id] * cantidad; neto += subtotal; detalle_id += 1
+                    detalle.append((detalle_id, boleta_id, prod_id, cantidad, precios[prod_id], subtotal))
+                factura = rng.random() < 0.1; iva = neto * bazar.TASA_IVA
+                boletas.append((boleta_id, rng.choice(VENDEDORES), neto, iva, neto + iva, fecha.replace(microsecond=0), "Factura" if factura else "Boleta",
+                                f"{rng.randint(5, 25)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(0, 9)}" if factura else None, f"Cliente {boleta_id}" if factura else None))
+            cursor.executemany("INSERT INTO boletas (id, vendedor_usuario, neto, iva, total_boleta, fecha, tipo_documento, cliente_rut, cliente_nombre) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", boletas)
+            cursor.executemany("INSERT INTO detalle_ventas (id, boleta_id, producto_id, cantidad, precio_unitario, subtotal) VALUES (%s, %s, %s, %s, %s, %s)", detalle)
+            conn.commit(); print(f"\r  Generando boletas: {min(desde + lote, args.boletas):>9,}/{args.boletas:,}", end="", flush=True)
+        print()
+        reconstruir_resumenes(cursor); conn.commit()
+        cursor.execute("CREATE TABLE benchmark_parametros (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+        cursor.executemany("INSERT INTO benchmark_parametros (clave, valor) VALUES (%s, %s)", [(clave, str(valor)) for clave, valor in parametros_generacion(args).items()])
+        conn.commit(); cursor.execute("ANALYZE"); conn.commit()
+    print(f"  Datos generados en {time.perf_counter() - inicio:.1f} s")
+
+def reconstruir_resumenes(cursor, desde_fecha=None):
+    """Recalcula las tablas de resumen diario a partir de boletas y detalle (todas, o desde una fecha)."""
+    filtro, params = ("WHERE b.fecha >= %s", (desde_fecha,)) if desde_fecha else ("", ())
+    for tabla in ("resumen_boletas_diario", "resumen_ventas_diario"):
+        cursor.execute(f"DELETE FROM {tabla}" + (" WHERE fecha >= %s" if desde_fecha else ""), params)
+    cursor.execute(f"INSERT INTO resumen_boletas_diario (fecha, vendedor_usuario, boletas, neto, iva, total) SELECT DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), COUNT(*), SUM(b.neto), SUM(b.iva), SUM(b.total_boleta) FROM boletas b {filtro} GROUP BY 1, 2", params)
+    cursor.execute(f"INSERT INTO resumen_ventas_diario (fecha, vendedor_usuario, producto_id, cantidad, neto, iva) SELECT DATE(b.fecha), COALESCE(b.vendedor_usuario, ''), dv.producto_id, SUM(dv.cantidad), SUM(dv.subtotal), SUM(dv.subtotal) * %s "
+                   f"FROM detalle_ventas dv JOIN boletas b ON b.id = dv.boleta_id {filtro} GROUP BY 1, 2, 3", (bazar.TASA_IVA, *params))
+
+def deshacer_ventas(ultima_boleta, desde_fecha):
+    """Quita las boletas que registró el benchmark (id > ultima_boleta) y devuelve su stock, para que la base siga igual."""
+    with bazar.obtener_pool().obtener(origen="benchmark") as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT producto_id, SUM(cantidad) FROM detalle_ventas WHERE boleta_id > %s GROUP BY producto_id", (ultima_boleta,))
+        cursor.executemany("UPDATE productos SET stock = stock + %s WHERE id = %s", [(cantidad, prod_id) for prod_id, cantidad in cursor.fetchall()])
+        cursor.execute("DELETE FROM detalle_ventas WHERE boleta_id > %s", (ultima_boleta,)); cursor.execute("DELETE FROM boletas WHERE id > %s", (ultima_boleta,))
+        reconstruir_resumenes(cursor, desde_fecha); conn.commit()
+
+
+# ==============================================================================
+# 2. MEDICIÓN
+# ==============================================================================
+def medir(nombre, funcion, repeticiones, calentamiento=3):
+    """Ejecuta funcion() `repeticiones` veces (tras unas de calentamiento) y devuelve sus estadísticas en ms."""
+    for _ in range(min(calentamiento, repeticiones)): funcion()
+    histograma = bazar.HistogramaRodante(repeticiones); inicio_total = time.perf_counter()
+    for _ in range(repeticiones):
+        inicio = time.perf_counter(); funcion(); histograma.agregar(time.perf_counter() - inicio, 0)
+    total = time.perf_counter() - inicio_total
+    p50, p95, p99 = histograma.percentiles(50, 95, 99)
+    resultado = {"repeticiones": repeticiones, "ops_s": round(repeticiones / total, 2), "p50_ms": round(p50 * 1000, 4), "p95_ms": round(p95 * 1000, 4), "p99_ms": round(p99 * 1000, 4), "max_ms": round(histograma.maximo * 1000, 4)}
+    print(f"  {nombre:<34} {resultado['ops_s']:>10,.1f}/s  p50 {resultado['p50_ms']:>9.3f}  p95 {resultado['p95_ms']:>9.3f}  p99 {resultado['p99_ms']:>9.3f}  máx {resultado['max_ms']:>9.3f} ms")
+    return resultado
+
+def ciclo(valores):
+    """Función que devuelve los elementos de `valores` uno tras otro, en círculo."""
+    indice = [0]
+    def siguiente():
+        valor = valores[indice[0] % len(valores)]; indice[0] += 1; return valor
+    return siguiente
+
+def escenarios_datos(rng, args):
+    """(nombre, función, repeticiones) de los caminos sin interfaz, en el orden en que se miden."""
+    repositorio = bazar.obtener_repositorio(); n = args.repeticiones; pocas = max(n // 20, 5)
+    bazar.catalogo.revalidar(forzar=True); activos = bazar.catalogo.activos()
+    nombres = [p.nombre for p in rng.sample(activos, min(200, len(activos)))]
+
+    # Productos: carga en frío (caja recién abierta), revalidación sin cambios y paginado del Treeview
+    yield "catalogo.carga_completa", lambda: bazar.CatalogoProductos().revalidar(forzar=True), pocas
+    yield "catalogo.revalidar_sin_cambios", lambda: bazar.catalogo.revalidar(forzar=True), n
+    ultimo = [None]
+    def pagina_productos():
+        pagina = bazar.catalogo.pagina_activos(ultimo[0], bazar.TAMANO_PAGINA); ultimo[0] = pagina[-1][2] if len(pagina) == bazar.TAMANO_PAGINA else None
+    yield "productos.pagina", pagina_productos, n
+
+    # Punto de Venta: cada pulsación de una búsqueda escrita letra a letra
+    indice = bazar.IndiceBusqueda(bazar.catalogo)
+    yield "venta.indice_construir", indice.construir, pocas
+    pulsaciones = [nombre.split()[0][:largo] for nombre in nombres[:50] for largo in range(1, 6)] + [p.codigo for p in activos[:50]]
+    siguiente_pulsacion = ciclo(pulsaciones)
+    yield "venta.buscar_pulsacion", lambda: indice.buscar(siguiente_pulsacion()), n * 5
+
+    # Historial: primera página y páginas siguientes, por vendedor y por producto
+    todos = ("", None)
+    yield "historial.primera_pagina_admin", lambda: bazar.pagina_historial(*todos, True, None, bazar.TAMANO_PAGINA), n
+    cursores = [(fila[2] or "", fila[1], fila[0]) for fila in bazar.consultar_bd("SELECT id, fecha, vendedor_usuario FROM boletas WHERE id IN (" + ", ".join(["%s"] * 50) + ")", tuple(rng.randint(1, args.boletas) for _ in range(50)), origen="benchmark.cursores_historial")]
+    siguiente_cursor = ciclo(cursores)
+    yield "historial.pagina_siguiente_admin", lambda: bazar.pagina_historial(*todos, True, siguiente_cursor(), bazar.TAMANO_PAGINA), n
+    siguiente_vendedor = ciclo(VENDEDORES)
+    yield "historial.pagina_vendedor", lambda: bazar.pagina_historial("", siguiente_vendedor(), False, None, bazar.TAMANO_PAGINA), n
+    siguiente_palabra = ciclo([nombre.split()[0] for nombre in nombres])
+    yield "historial.filtro_producto", lambda: bazar.pagina_historial(siguiente_palabra(), None, True, None, bazar.TAMANO_PAGINA), pocas
+    yield "historial.conteos_admin", lambda: bazar.conteos_historial(*todos), pocas
+    ultimo_mes = (datetime.now().date() - timedelta(days=bazar.HISTORIAL_DIAS), None) # Rango con que se abre el historial
+    yield "historial.primera_pagina_30_dias", lambda: bazar.pagina_historial(*todos, True, None, bazar.TAMANO_PAGINA, *ultimo_mes), n
+    yield "historial.conteos_30_dias", lambda: bazar.conteos_historial(*todos, *ultimo_mes), pocas
+
+    # Detalle de boleta y reportes del último mes
+    yield "detalle_boleta", lambda: repositorio.obtener_boleta(rng.randint(1, args.boletas)), n
+    hasta = datetime.now().date(); desde = hasta - timedelta(days=30)
+    yield "reportes.30_dias", lambda: (bazar.reporte_ventas_por_periodo(desde, hasta, "dia"), bazar.reporte_por_vendedor(desde, hasta), bazar.reporte_por_producto(desde, hasta)), pocas
+
+def escenarios_venta(rng, args):
+    """Añadir al carrito (reservar stock) y confirmar una venta: anotarla en el diario de la caja y enviarla al servidor (registrar_venta)."""
+    diario = bazar.DiarioVentas(); sincronizador = bazar.SincronizadorVentas(diario)
+    activos = bazar.catalogo.activos()[:500]
+    reservas = bazar.ServicioReservas("benchmark")
+    def reservar_y_devolver(): prod_id = rng.choice(activos).id; reservas.apartar(prod_id, 1); reservas.apartar(prod_id, -1)
+    yield "venta.reservar_y_devolver", reservar_y_devolver, args.repeticiones
+    def carrito(): return [(p.id, 1, p.precio, p.precio) for p in rng.sample(activos, rng.randint(1, 6))]
+    yield "venta.anotar_en_diario", lambda: diario.anotar(rng.choice(VENDEDORES), carrito()), args.repeticiones
+    def registrar():
+        with bazar.obtener_pool().obtener(origen="benchmark") as conn: bazar.registrar_venta(conn, rng.choice(VENDEDORES), carrito())
+    yield "venta.registrar_en_servidor", registrar, args.repeticiones
+    lotes = max(args.repeticiones // bazar.CONFIG.sincronizacion.lote, 2)
+    for _ in range((lotes + 3) * bazar.CONFIG.sincronizacion.lote - diario.contar_pendientes()): diario.anotar(rng.choice(VENDEDORES), carrito()) # Que ningún lote medido llegue vacío
+    yield "venta.sincronizar_lote", sincronizador.sincronizar, lotes
+
+def preparar_pantalla():
+    """True si hay una pantalla para Tk; sin DISPLAY intenta levantar un Xvfb propio."""
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"): return True
+    if not shutil.which("Xvfb"): return False
+    pantalla = ":%d" % (90 + os.getpid() % 100)
+    proceso = subprocess.Popen(["Xvfb", pantalla, "-screen", "0", "1280x800x24"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    atexit.register(proceso.terminate)
+    os.environ["DISPLAY"] = pantalla; time.sleep(0.5)
+    return proceso.poll() is None
+
+def escenarios_treeview(rng, args):
+    """Llenado de Treeview con las mismas filas y formato que las vistas de productos e historial."""
+    import tkinter
+    from tkinter import ttk
+    raiz = tkinter.Tk(); raiz.geometry("1200x700")
+    tree = ttk.Treeview(raiz, columns=("Código", "Nombre", "Precio Neto", "Stock"), show="headings"); tree.pack(fill="both", expand=True)
+    pagina = bazar.catalogo.pagina_activos(None, bazar.TAMANO_PAGINA)
+    def llenar_productos():
+        tree.delete(*tree.get_children())
+        for producto in pagina: tree.insert("", "end", values=(producto[1], producto[2], bazar.formatear_a_clp(producto[3]), producto[4]), iid=producto[0])
+        raiz.update_idletasks()
+    yield "treeview.pagina_productos", llenar_productos, args.repeticiones
+
+    historial = ttk.Treeview(raiz, columns=("ID Boleta", "Fecha", "Tipo", "Total")); historial.pack(fill="both", expand=True)
+    boletas = bazar.pagina_historial("", None, True, None, bazar.TAMANO_PAGINA)
+    def llenar_historial():
+        historial.delete(*historial.get_children()); padres = {}
+        for boleta in boletas:
+            vendedor = boleta[2] or ""
+            if vendedor not in padres: padres[vendedor] = historial.insert("", "end", text=f" {vendedor}", open=True)
+            historial.insert(padres[vendedor], "end", values=(boleta[0], boleta[1].strftime('%d/%m/%Y %H:%M'), boleta[4], bazar.formatear_a_clp(boleta[3])))
+        raiz.update_idletasks()
+    yield "treeview.pagina_historial_agrupada", llenar_historial, args.repeticiones
+
+
+# ==============================================================================
+# 3. LÍNEA BASE
+# ==============================================================================
+def comparar(resultados, args):
+    """Imprime la diferencia con la línea base y devuelve los escenarios que empeoraron más que la tolerancia."""
+    ruta_base = args.linea_base
+    with open(ruta_base, encoding="utf-8") as archivo: base = json.load(archivo)
+    if base.get("parametros") != parametros_generacion(args): print(f"ADVERTENCIA: La línea base se midió con otros datos ({base.get('parametros')}); la comparación es orientativa.")
+    print(f"\nComparación con {ruta_base} ({base.get('fecha', '?')}):")
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anterior = base["resultados"].get(nombre)
+        if anterior is None: print(f"  {nombre:<34} (nuevo)"); continue
+        cambios = {metrica: actual[metrica] / anterior[metrica] - 1 if anterior[metrica] else 0.0 for metrica in ("p50_ms", "p95_ms")}
+        # Bajo 0,05 ms las diferencias son ruido del reloj, no del código
+        empeoro = any(cambio > args.tolerancia and actual[metrica] - anterior[metrica] > 0.05 for metrica, cambio in cambios.items())
+        if empeoro: regresiones.append(nombre)
+        print(f"  {nombre:<34} p50 {cambios['p50_ms']:+7.1%}  p95 {cambios['p95_ms']:+7.1%}" + ("   <-- REGRESIÓN" if empeoro else ""))
+    return regresiones
+
+def main(argv=None):
+    args = parsear_argumentos(argv); importar_bazar(args)
+    print(f"Base de trabajo: {args.ruta} ({args.productos:,} productos, {args.boletas:,} boletas, semilla {args.semilla})")
+    if not base_reutilizable(args): generar_datos(args)
+    bazar.iniciar_bd()
+    rng = random.Random(args.semilla)
+    ultima_boleta = bazar.consultar_bd("SELECT MAX(id) FROM boletas", uno=True, origen="benchmark.ultima_boleta")[0] or 0; inicio_ventas = datetime.now().replace(microsecond=0)
+    bazar.instrumentacion.reiniciar() # Solo interesan las consultas de la medición, no las de la generación
+    grupos = [("Consultas", escenarios_datos), ("Venta", escenarios_venta)]
+    if preparar_pantalla(): grupos.append(("Interfaz", escenarios_treeview))
+    else: print("ADVERTENCIA: Sin DISPLAY ni Xvfb: se omiten los escenarios de Treeview.")
+    resultados = {}
+    try:
+        for titulo, escenarios in grupos:
+            print(f"\n{titulo}:")
+            for nombre, funcion, repeticiones in escenarios(rng, args):
+                if nombre.startswith(args.solo): resultados[nombre] = medir(nombre, funcion, repeticiones)
+    finally:
+        deshacer_ventas(ultima_boleta, inicio_ventas.date())
+    print("\nConsultas más costosas durante la medición:")
+    for forma, veces, _, p50, p95, _, _, total in bazar.instrumentacion.resumen("sql")[:5]: print(f"  {total:7.2f} s  {veces:>7}x  p50 {p50 * 1000:7.3f} ms  p95 {p95 * 1000:7.3f} ms  {forma[:90]}")
+
+    regresiones = comparar(resultados, args) if os.path.exists(args.linea_base) and not args.guardar_base else []
+    if args.guardar_base:
+        entorno = {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "sistema": platform.platform(), "procesador": platform.processor() or platform.machine()}
+        with open(args.linea_base, "w", encoding="utf-8") as archivo:
+            json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "parametros": parametros_generacion(args), "entorno": entorno, "resultados": resultados}, archivo, indent=2, ensure_ascii=False)
+        print(f"\nLínea base guardada en {args.linea_base}")
+    bazar.obtener_repositorio().cerrar()
+    if regresiones: print(f"\n{len(regresiones)} escenario(s) empeoraron más de {args.tolerancia:.0%}: {', '.join(regresiones)}"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# ==============================================================================
+# SERVICIO DE CATÁLOGO Y VENTAS COMPARTIDO POR VARIAS CAJAS (SIN INTERFAZ)
+# ==============================================================================
+# Servidor HTTP/JSON (asyncio, solo librería estándar) con las operaciones de bazar.py sobre productos, ventas e
+# historial, para que muchas cajas compartan un catálogo y un punto de registro de ventas. Es el único que abre
+# conexiones a la base (MySQL, o SQLite como base local de prueba) y las reparte con el pool de bazar.py.
+#
+#   BAZAR_BACKEND=mysql  BAZAR_SERVICIO_TOKEN=secreto  python servicio.py --host 0.0.0.0
+#   BAZAR_BACKEND=remoto BAZAR_SERVICIO_URL=http://servidor:8765 BAZAR_SERVICIO_TOKEN=secreto python bazar.py
+#
+# Prueba de carga con cajas simuladas (registra ventas reales: use una copia de la base o la del benchmark):
+#   BAZAR_BACKEND=sqlite BAZAR_SQLITE_RUTA=benchmark.db python servicio.py --simular-cajas 50 --segundos 30
+
+# ==============================================================================
+# 1. IMPORTS Y CONFIGURACIÓN
+# ==============================================================================
+import argparse
+import asyncio
+import functools
+import hmac
+import inspect
+import ipaddress
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+MAX_CUERPO = 8 * 1024 * 1024 # Bytes máximos de una petición; un lote de ventas del diario pesa unos pocos KB
+MAX_CABECERAS = 100
+INACTIVIDAD_CONEXION = 75.0 # Segundos que se mantiene abierta una conexión keep-alive sin peticiones
+VENTANA_LOTE_VENTAS = 0.005 # Segundos que se esperan más ventas de otras cajas antes de registrar el lote
+ESTADOS_HTTP = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON de catálogo y ventas de bazar.py para varias cajas.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz donde escuchar (0.0.0.0 para aceptar cajas de la red)")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--token", default=None, help="Secreto que deben enviar las cajas (por defecto BAZAR_SERVICIO_TOKEN); obligatorio fuera de 127.0.0.1")
+    parser.add_argument("--simular-cajas", type=int, default=0, metavar="N", help="Prueba de carga: N cajas simuladas contra el servicio")
+    parser.add_argument("--segundos", type=float, default=10.0, help="Duración de la prueba de carga")
+    parser.add_argument("--url", default=None, help="Servicio ya en marcha para la prueba de carga; sin --url se levanta uno en este proceso")
+    parser.add_argument("--semilla", type=int, default=2025)
+    return parser.parse_args(argv)
+
+sys.path.insert(0, DIRECTORIO)
+import bazar  # noqa: E402
+
+# ==============================================================================
+# 2. SERVIDOR
+# ==============================================================================
+class PeticionInvalida(Exception):
+    """La petición HTTP no se puede atender; lleva el código de estado a responder."""
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+class ServicioBazar:
+    """Atiende POST /op/<operación> y GET /salud; la base se usa desde un ThreadPoolExecutor y asyncio solo atiende sockets."""
+    def __init__(self, token=bazar.SERVICIO_TOKEN, hilos=bazar.CONFIG.pool.tamano, ventana_lote=VENTANA_LOTE_VENTAS, max_lote=bazar.CONFIG.sincronizacion.lote):
+        self.token, self.ventana_lote, self.max_lote = token, ventana_lote, max_lote
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="servicio-bd")
+        self._en_vuelo = {} # (operación, cuerpo) -> futuro de una lectura en curso que comparten las peticiones iguales
+        self._ventas = []; self._temporizador = None # Lote de ventas en espera: [(ventas, futuro)]
+        self.contadores = Counter(); self.conexiones_abiertas = 0
+        self.servidor = None; self.archivador = None; self.loop = None
+
+    async def iniciar(self, host, puerto):
+        """Verifica el esquema y empieza a escuchar. Devuelve la versión del esquema."""
+        self.loop = asyncio.get_running_loop()
+        version = await asyncio.get_running_loop().run_in_executor(self.ejecutor, bazar.iniciar_bd)
+        self.servidor = await asyncio.start_server(self._atender, host, puerto)
+        return version
+
+    @property
+    def puerto(self): return self.servidor.sockets[0].getsockname()[1]
+
+    async def cerrar(self):
+        if self.servidor is not None: self.servidor.close(); await self.servidor.wait_closed()
+        self.ejecutor.shutdown(wait=True)
+
+    # --- HTTP ---
+    async def _atender(self, lector, escritor):
+        self.conexiones_abiertas += 1
+        try:
+            while True:
+                try: peticion = await asyncio.wait_for(self._leer_peticion(lector), INACTIVIDAD_CONEXION)
+                except PeticionInvalida as err:
+                    await self._responder(escritor, err.estado, {"error": str(err), "tipo": "peticion"}, seguir=False); break
+                if peticion is None: break
+                metodo, ruta, cabeceras, cuerpo = peticion
+                estado, respuesta = await self._despachar(metodo, ruta, cabeceras, cuerpo)
+                seguir = cabeceras.get("connection", "").lower() != "close"
+                await self._responder(escritor, estado, respuesta, seguir)
+                if not seguir: break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError): pass # Caja inactiva o que cortó la conexión
+        finally:
+            self.conexiones_abiertas -= 1; escritor.close()
+
+    async def _leer_peticion(self, lector):
+        """(método, ruta, cabeceras, cuerpo) de la siguiente petición, o None si la caja cerró la conexión."""
+        linea = await lector.readline()
+        if not linea: return None
+        partes = linea.decode("latin-1").split()
+        if len(partes) != 3 or not partes[2].startswith("HTTP/1."): raise PeticionInvalida(400, "Línea de petición inválida.")
+        cabeceras = {}
+        while True:
+            linea = await lector.readline()
+            if linea in (b"\r\n", b"\n", b""): break
+            if len(cabeceras) >= MAX_CABECERAS: raise PeticionInvalida(400, "Demasiadas cabeceras.")
+            nombre, _, valor = linea.decode("latin-1").partition(":"); cabeceras[nombre.strip().lower()] = valor.strip()
+        try: largo = int(cabeceras.get("content-length", "0"))
+        except ValueError: raise PeticionInvalida(400, "Content-Length inválido.") from None
+        if largo > MAX_CUERPO: raise PeticionInvalida(413, f"La petición supera {MAX_CUERPO} bytes.")
+        return partes[0], partes[1], cabeceras, await lector.readexactly(largo) if largo else b""
+
+    async def _responder(self, escritor, estado, respuesta, seguir):
+        cuerpo = bazar.codificar_json(respuesta)
+        escritor.write(f"HTTP/1.1 {estado} {ESTADOS_HTTP.get(estado, 'Error')}\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: {len(cuerpo)}\r\n"
+                       f"Connection: {'keep-alive' if seguir else 'close'}\r\n\r\n".encode("latin-1") + cuerpo)
+        await escritor.drain()
+
+    # --- Operaciones ---
+    async def _despachar(self, metodo, ruta, cabeceras, cuerpo):
+        if self.token and not hmac.compare_digest(cabeceras.get("x-bazar-token", "").encode("utf-8"), self.token.encode("utf-8")): return 401, {"error": "Token del servicio inválido.", "tipo": "autorizacion"}
+        if ruta == "/salud": return (200, {"resultado": self.salud()}) if metodo == "GET" else (405, {"error": "Use GET.", "tipo": "peticion"})
+        if not ruta.startswith("/op/"): return 404, {"error": f"Ruta desconocida: {ruta}", "tipo": "peticion"}
+        if metodo != "POST": return 405, {"error": "Use POST.", "tipo": "peticion"}
+        nombre = ruta[len("/op/"):]; funcion, lectura = bazar.resolver_operacion(nombre)
+        if funcion is None: return 404, {"error": f"Operación desconocida: {nombre}", "tipo": "peticion"}
+        try:
+            peticion = bazar.decodificar_json(cuerpo or b"{}"); args, kwargs = list(peticion.get("args", [])), dict(peticion.get("kwargs", {}))
+            inspect.signature(funcion).bind(*args, **kwargs)
+        except (ValueError, TypeError, AttributeError) as err: return 400, {"error": f"Argumentos inválidos para {nombre}: {err}", "tipo": "peticion"}
+        self.contadores[nombre] += 1
+        try:
+            if nombre == "repositorio.registrar_ventas": resultado = await self._registrar_en_lote(*args, **kwargs)
+            elif lectura: resultado = await self._leer_una_vez((nombre, cuerpo), funcion, args, kwargs)
+            else: resultado = await asyncio.get_running_loop().run_in_executor(self.ejecutor, functools.partial(funcion, *args, **kwargs))
+        except PeticionInvalida as err: return err.estado, {"error": str(err), "tipo": "peticion"}
+        except bazar.StockInsuficienteError as err: return 409, {"error": str(err), "tipo": "stock", "faltantes": err.faltantes}
+        except bazar.ReservaEnConflictoError as err: return 409, {"error": str(err), "tipo": "conflicto"}
+        except bazar.errores_bd() as err: self.contadores["errores_bd"] += 1; return 503, {"error": f"Error de base de datos: {err}", "tipo": "bd"}
+        except Exception as err:
+            print(f"ADVERTENCIA: La operación {nombre} falló: {err!r}"); self.contadores["errores"] += 1
+            return 500, {"error": f"Error interno en {nombre}: {err}", "tipo": "interno"}
+        return 200, {"resultado": resultado}
+
+    async def _leer_una_vez(self, clave, funcion, args, kwargs):
+        """Ejecuta una lectura, o se suma a la misma lectura que otra caja ya pidió y aún no termina."""
+        futuro = self._en_vuelo.get(clave)
+        if futuro is None:
+            futuro = self._en_vuelo[clave] = asyncio.get_running_loop().run_in_executor(self.ejecutor, functools.partial(funcion, *args, **kwargs))
+            futuro.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        else: self.contadores["lecturas_compartidas"] += 1
+        return await asyncio.shield(futuro) # Si una caja se desconecta, las demás siguen esperando el mismo resultado
+
+    async def _registrar_en_lote(self, ventas):
+        """Encola las ventas de una caja; el lote de todas se registra con una conexión al cumplirse la ventana o max_lote."""
+        if not isinstance(ventas, list) or not all(isinstance(venta, list) and len(venta) == 8 and isinstance(venta[6], list) and all(isinstance(linea, list) and len(linea) == 4 for linea in venta[6]) for venta in ventas):
+            raise PeticionInvalida(400, "Cada venta debe ser (clave, creada_en, vendedor, tipo_doc, cliente_rut, cliente_nombre, lineas, reservas).")
+        if not ventas: return []
+        loop = asyncio.get_running_loop(); futuro = loop.create_future()
+        self._ventas.append((ventas, futuro))
+        if sum(len(encoladas) for encoladas, _ in self._ventas) >= self.max_lote: self._vaciar_lote()
+        elif self._temporizador is None: self._temporizador = loop.call_later(self.ventana_lote, self._vaciar_lote)
+        return await futuro
+
+    def _vaciar_lote(self):
+        if self._temporizador is not None: self._temporizador.cancel(); self._temporizador = None
+        lote, self._ventas = self._ventas, []
+        if lote: asyncio.ensure_future(self._enviar_lote(lote))
+
+    async def _enviar_lote(self, lote):
+        todas = [venta for ventas, _ in lote for venta in ventas]
+        self.contadores["lotes_ventas"] += 1; self.contadores["ventas"] += len(todas)
+        try: resultados = await asyncio.get_running_loop().run_in_executor(self.ejecutor, bazar.obtener_repositorio().registrar_ventas, todas)
+        except Exception as err: # Sin conexión: fallan todas y cada caja reintenta su parte (las claves evitan duplicados)
+            for _, futuro in lote:
+                if not futuro.done(): futuro.set_exception(err)
+            return
+        por_clave = {resultado[0]: resultado for resultado in resultados}
+        for ventas, futuro in lote:
+            if not futuro.done(): futuro.set_result([por_clave[venta[0]] for venta in ventas])
+
+    def salud(self):
+        repositorio = bazar.obtener_repositorio()
+        return {"backend": repositorio.nombre, "conexiones_cajas": self.conexiones_abiertas, "pool": repositorio.pool.resumen(), "contadores": dict(self.contadores),
+                "boletas_archivadas": self.archivador.archivadas if self.archivador else 0,
+                "consultas": [{"forma": forma, "veces": veces, "p50_ms": round(p50 * 1000, 3), "p95_ms": round(p95 * 1000, 3)} for forma, veces, _, p50, p95, _, _, _ in bazar.instrumentacion.resumen("sql")[:10]]}
+
+async def servir(host, puerto, token):
+    servicio = ServicioBazar(token)
+    version = await servicio.iniciar(host, puerto)
+    print(f"Servicio del bazar en http://{host}:{servicio.puerto} (backend {bazar.obtener_repositorio().nombre}, esquema v{version}, {bazar.CONFIG.pool.tamano} conexiones)")
+    if not token: print("ADVERTENCIA: Sin BAZAR_SERVICIO_TOKEN: solo para pruebas en este equipo.")
+    servicio.archivador = bazar.ArchivadorVentas(); servicio.archivador.iniciar() # El servicio es el único que archiva: las cajas remotas no tocan la base
+    try: await servicio.servidor.serve_forever()
+    finally: servicio.archivador.detener(); await servicio.cerrar()
+
+def servicio_en_hilo(token):
+    """Levanta el servicio en un hilo propio, en un puerto libre de 127.0.0.1. Devuelve (servicio, URL)."""
+    loop = asyncio.new_event_loop(); servicio = ServicioBazar(token)
+    threading.Thread(target=loop.run_forever, name="servicio", daemon=True).start()
+    asyncio.run_coroutine_threadsafe(servicio.iniciar("127.0.0.1", 0), loop).result()
+    return servicio, f"http://127.0.0.1:{servicio.puerto}"
+
+def detener_servicio_en_hilo(servicio):
+    asyncio.run_coroutine_threadsafe(servicio.cerrar(), servicio.loop).result(); servicio.loop.call_soon_threadsafe(servicio.loop.stop)
+
+# ==============================================================================
+# 3. PRUEBA DE CARGA CON CAJAS SIMULADAS
+# ==============================================================================
+
+def simular_caja(numero, url, token, hasta, medir, rng):
+    """Ciclo de una caja: revisar el catálogo, reservar un producto, vender lo reservado y, a veces, mirar el historial."""
+    repositorio = bazar.RepositorioRemoto(url, token); terminal = f"simulada-{numero}"
+    try:
+        marca, filas, _ = medir("revisar_cambios", repositorio.revisar_cambios, None)
+        productos = [(fila[0], fila[3]) for fila in filas if fila[5] == "activo" and fila[4] - int(fila[6]) > 0]
+        if not productos: print("ADVERTENCIA: No hay productos con stock para simular ventas."); return
+        while time.monotonic() < hasta:
+            marca, _, _ = medir("revisar_cambios", repositorio.revisar_cambios, marca)
+            prod_id, precio = rng.choice(productos)
+            try: reserva_id, _, _ = medir("reservar_stock", repositorio.reservar_stock, prod_id, 1, terminal)
+            except (bazar.StockInsuficienteError, bazar.ReservaEnConflictoError): medir.rechazos[terminal] += 1; continue
+            venta = (uuid.uuid4().hex, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), terminal, "Boleta", None, None, [(prod_id, 1, precio, precio)], [reserva_id])
+            medir("registrar_ventas", repositorio.registrar_ventas, [venta])
+            if rng.random() < 0.1: medir("historial.pagina", repositorio.llamar, "historial.pagina", "", None, True, None, bazar.TAMANO_PAGINA)
+    except bazar.ErrorServicio as err: print(f"ADVERTENCIA: La caja {terminal} perdió el servicio: {err}"); medir.rechazos["errores"] += 1
+    finally: repositorio.cerrar()
+
+def simular_cajas(cajas, segundos, url, token, semilla=2025):
+    print("ADVERTENCIA: La prueba de carga registra ventas reales; úsela contra una copia de la base o la del benchmark.")
+    if url is None: _, url = servicio_en_hilo(token)
+    histogramas, lock = {}, threading.Lock()
+    def medir(nombre, funcion, *args):
+        inicio = time.perf_counter(); resultado = funcion(*args); duracion = time.perf_counter() - inicio
+        with lock: histogramas.setdefault(nombre, bazar.HistogramaRodante(1_000_000)).agregar(duracion, 0)
+        return resultado
+    medir.rechazos = Counter()
+    print(f"{cajas} cajas simuladas contra {url} durante {segundos:g} s...")
+    rng = random.Random(semilla); hasta = time.monotonic() + segundos; inicio = time.perf_counter()
+    hilos = [threading.Thread(target=simular_caja, args=(numero, url, token, hasta, medir, random.Random(rng.random())), daemon=True) for numero in range(1, cajas + 1)]
+    for hilo in hilos: hilo.start()
+    for hilo in hilos: hilo.join()
+    total = time.perf_counter() - inicio
+    for nombre, histograma in sorted(histogramas.items()):
+        p50, p95, p99 = histograma.percentiles(50, 95, 99)
+        print(f"  {nombre:<20} {histograma.veces / total:>9,.1f}/s  p50 {p50 * 1000:>8.2f}  p95 {p95 * 1000:>8.2f}  p99 {p99 * 1000:>8.2f}  máx {histograma.maximo * 1000:>8.2f} ms")
+    if medir.rechazos: print(f"  Rechazos: {dict(medir.rechazos)}")
+
+# ==============================================================================
+# 4. PUNTO DE ENTRADA
+# ==============================================================================
+def es_local(host):
+    """True si `host` solo acepta conexiones de este mismo equipo."""
+    if host == "localhost": return True
+    try: return ipaddress.ip_address(host).is_loopback
+    except ValueError: return False
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    if bazar.BACKEND_BD == "remoto" and not (args.simular_cajas and args.url): sys.exit("ERROR: El servicio necesita una base local: use BAZAR_BACKEND=mysql o sqlite.")
+    token = bazar.SERVICIO_TOKEN if args.token is None else args.token
+    if args.simular_cajas: simular_cajas(args.simular_cajas, args.segundos, args.url, token, args.semilla); return
+    # Sin token cualquier equipo de la red podría vender, cambiar precios o reservar todo el stock
+    if not token and not es_local(args.host): sys.exit(f"ERROR: Para escuchar en {args.host} defina --token o BAZAR_SERVICIO_TOKEN; sin token el servicio solo escucha en 127.0.0.1.")
+    try: asyncio.run(servir(args.host, args.puerto, token))
+    except KeyboardInterrupt: pass
+    finally: bazar.obtener_repositorio().cerrar()
+
+if __name__ == "__main__":
+    main()
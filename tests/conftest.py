@@ -0,0 +1,48 @@
+"""Configuración común de las pruebas: bazar.py se importa sobre archivos temporales y cada prueba usa su propia base SQLite."""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# bazar.py lee estas variables al importarse: ninguna prueba toca bazar.db ni el diario de ventas real de esta caja
+_TEMPORAL = tempfile.mkdtemp(prefix="bazar-pruebas-")
+os.environ.update({"BAZAR_BACKEND": "sqlite", "BAZAR_SQLITE_RUTA": os.path.join(_TEMPORAL, "bazar.db"), "BAZAR_DIARIO_VENTAS": os.path.join(_TEMPORAL, "diario.db"),
+                   "BAZAR_BCRYPT_COSTO": "4"}) # Costo mínimo de bcrypt: cada base nueva crea el usuario admin
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bazar  # noqa: E402
+
+
+def _usar(repositorio, monkeypatch):
+    # obtener_repositorio() entrega este repositorio; el catálogo y el asignador de códigos guardan estado de la base anterior
+    repositorio.iniciar(); monkeypatch.setattr(bazar, "_repositorio", repositorio)
+    monkeypatch.setattr(bazar, "catalogo", bazar.CatalogoProductos()); monkeypatch.setattr(bazar, "asignador_codigos", bazar.AsignadorCodigos())
+    return repositorio
+
+def _base_mysql():
+    """Crea una base vacía en el servidor de BAZAR_DB_HOST. Devuelve (nombre, función que la borra); sin servidor omite la prueba."""
+    config = {clave: valor for clave, valor in bazar.DB_CONFIG.items() if clave != "database"}
+    try: conn = bazar.mysql.connector.connect(connection_timeout=2, **config)
+    except bazar.mysql.connector.Error as err: pytest.skip(f"Sin servidor MySQL en {config['host']}: {err}")
+    nombre = f"bazar_pruebas_{uuid.uuid4().hex[:8]}"; cursor = conn.cursor() # Nunca la base configurada: las pruebas registran ventas
+    cursor.execute(f"CREATE DATABASE {nombre}")
+    def borrar(): cursor.execute(f"DROP DATABASE {nombre}"); conn.close()
+    return nombre, borrar
+
+@pytest.fixture
+def repositorio(tmp_path, monkeypatch):
+    """RepositorioSQLite sobre una base nueva y ya migrada, que obtener_repositorio() entrega durante la prueba."""
+    repositorio = _usar(bazar.RepositorioSQLite(str(tmp_path / "bazar.db")), monkeypatch)
+    yield repositorio
+    repositorio.cerrar()
+
+@pytest.fixture(params=["sqlite", "mysql"])
+def repositorio_bd(request, tmp_path, monkeypatch):
+    """Como `repositorio`, una vez con cada backend local. El caso MySQL se omite si no hay un servidor al que conectarse."""
+    if request.param == "sqlite": repositorio, borrar = bazar.RepositorioSQLite(str(tmp_path / "bazar.db")), None
+    else: nombre, borrar = _base_mysql(); repositorio = bazar.RepositorioMySQL({**bazar.DB_CONFIG, "database": nombre})
+    try: yield _usar(repositorio, monkeypatch)
+    finally:
+        repositorio.cerrar()
+        if borrar: borrar()
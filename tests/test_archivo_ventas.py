@@ -0,0 +1,49 @@
+"""Archivado de boletas antiguas (boletas_archivo y detalle_ventas_archivo) y lo que sigue viéndolas."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import bazar
+
+
+HACE_UN_ANO = datetime.now().replace(microsecond=0) - timedelta(days=365)
+
+def venta(clave, producto_id, fecha):
+    return (clave, fecha, "caja", "Boleta", None, None, [(producto_id, 1, 1000, 1000)], [])
+
+def contar(repositorio, tabla): return repositorio.consultar(f"SELECT COUNT(*) FROM {tabla}", uno=True)[0]
+
+@pytest.fixture
+def ventas(repositorio):
+    """Tres boletas de hace un año y una de hoy. Devuelve {clave: boleta_id}."""
+    prod_id = repositorio.crear_producto("ARC-1", "Producto", 1000, 10)
+    lote = [venta(f"antigua-{i}", prod_id, HACE_UN_ANO + timedelta(hours=i)) for i in range(3)] + [venta("reciente", prod_id, datetime.now().replace(microsecond=0))]
+    return {clave: boleta_id for clave, boleta_id, _ in repositorio.registrar_ventas(lote)}
+
+def test_archivar_mueve_boletas_y_detalle(repositorio, ventas):
+    assert repositorio.archivar_ventas(bazar.corte_archivo()) == 3
+    assert (contar(repositorio, "boletas"), contar(repositorio, "detalle_ventas")) == (1, 1)
+    assert (contar(repositorio, "boletas_archivo"), contar(repositorio, "detalle_ventas_archivo")) == (3, 3)
+    assert repositorio.archivar_ventas(bazar.corte_archivo()) == 0
+
+def test_archivado_es_atomico(repositorio, ventas):
+    # Una línea ya presente en el archivo hace fallar el segundo INSERT: nada debe quedar movido a medias
+    repositorio.escribir(f"INSERT INTO detalle_ventas_archivo ({repositorio._SQL_COLUMNAS_DETALLE}) SELECT {repositorio._SQL_COLUMNAS_DETALLE} FROM detalle_ventas WHERE boleta_id = %s", (ventas["antigua-1"],))
+    with pytest.raises(repositorio.Error): repositorio.archivar_ventas(bazar.corte_archivo())
+    assert (contar(repositorio, "boletas"), contar(repositorio, "detalle_ventas")) == (4, 4)
+    assert (contar(repositorio, "boletas_archivo"), contar(repositorio, "detalle_ventas_archivo")) == (0, 1)
+
+def test_historial_y_reportes_ven_boletas_archivadas(repositorio, ventas):
+    repositorio.archivar_ventas(bazar.corte_archivo())
+    assert sorted(boleta[0] for boleta in bazar.pagina_historial("", None, False, None, 50)) == sorted(ventas.values())
+    assert sum(bazar.conteos_historial("", None).values()) == 4
+    assert sum(fila[1] for fila in bazar.reporte_por_vendedor(HACE_UN_ANO.date(), datetime.now().date())) == 4
+    datos, lineas = repositorio.obtener_boleta(ventas["antigua-0"])
+    assert datos is not None and len(lineas) == 1
+
+def test_reenvio_de_venta_archivada_no_duplica(repositorio, ventas):
+    repositorio.archivar_ventas(bazar.corte_archivo())
+    prod_id = repositorio.consultar("SELECT id FROM productos", uno=True)[0]
+    assert repositorio.registrar_ventas([venta("antigua-0", prod_id, HACE_UN_ANO)]) == [("antigua-0", ventas["antigua-0"], None)]
+    assert contar(repositorio, "boletas") + contar(repositorio, "boletas_archivo") == 4
+    assert repositorio.consultar("SELECT stock FROM productos WHERE id = %s", (prod_id,), uno=True)[0] == 6
@@ -0,0 +1,27 @@
+"""Códigos de producto PREFIJO-NNNN que entrega AsignadorCodigos desde secuencias_codigo."""
+import threading
+
+import bazar
+
+
+def test_secuencia_por_prefijo(repositorio):
+    asignador = bazar.AsignadorCodigos(bloque=3)
+    assert [asignador.siguiente(nombre) for nombre in ("Bebida", "Bebida", "Pan", "Bebida", "Bebida")] == ["BEB-0001", "BEB-0002", "PAN-0001", "BEB-0003", "BEB-0004"]
+    assert asignador.varios(["Pan", "Bebida", "Pan"]) == ["PAN-0002", "BEB-0005", "PAN-0003"]
+
+def test_dos_cajas_no_repiten_codigos(repositorio):
+    cajas, codigos = [bazar.AsignadorCodigos(bloque=3) for _ in range(2)], []
+    def pedir(asignador):
+        for _ in range(10): codigos.extend(asignador.varios(["Bebida", "Pan", "Bebida"]))
+    hilos = [threading.Thread(target=pedir, args=(asignador,)) for asignador in cajas]
+    for hilo in hilos: hilo.start()
+    for hilo in hilos: hilo.join()
+    assert len(codigos) == 60 and len(set(codigos)) == 60
+    assert sum(codigo.startswith("BEB-") for codigo in codigos) == 40
+    # Cada bloque que una caja no alcanza a usar queda como hueco, pero la secuencia nunca retrocede
+    assert repositorio.consultar("SELECT siguiente FROM secuencias_codigo WHERE prefijo = 'BEB'", uno=True)[0] > 40
+
+def test_descartar_tras_codigos_explicitos(repositorio):
+    asignador = bazar.AsignadorCodigos(bloque=5); assert asignador.siguiente("Bebida") == "BEB-0001"
+    repositorio.avanzar_secuencias({"BEB": 20}); asignador.descartar(["BEB"])
+    assert asignador.siguiente("Bebida") == "BEB-0021"
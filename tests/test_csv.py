@@ -0,0 +1,31 @@
+"""Importación de productos y exportación de ventas en CSV."""
+import csv
+from datetime import datetime
+
+import bazar
+
+
+def escribir(ruta, texto): ruta.write_text(texto, encoding="utf-8"); return str(ruta)
+
+def productos(): return {p.nombre: (p.codigo, p.precio, p.stock) for p in bazar.catalogo.todos()}
+
+def test_importar_y_reimportar_productos(repositorio, tmp_path):
+    ruta = escribir(tmp_path / "productos.csv", "codigo;nombre;precio;stock\nBEB-0007;Bebida cola;$1.000;10\n;Bebida naranja;900;5\n;Pan amasado;200;30\n;;100;1\n")
+    assert bazar.importar_productos_csv(ruta, tamano_lote=2) == (3, 1, [(5, "nombre vacío")])
+    # El código explícito adelanta la secuencia de su prefijo: los que se numeran después no lo repiten
+    assert productos() == {"Bebida cola": ("BEB-0007", 1000, 10), "Bebida naranja": ("BEB-0008", 900, 5), "Pan amasado": ("PAN-0001", 200, 30)}
+    ruta = escribir(tmp_path / "precios.csv", "Producto,Precio,Stock\nBebida cola,1100,8\nBebida naranja,950,4\n")
+    assert bazar.importar_productos_csv(ruta) == (2, 0, [])
+    assert productos() == {"Bebida cola": ("BEB-0007", 1100, 8), "Bebida naranja": ("BEB-0008", 950, 4), "Pan amasado": ("PAN-0001", 200, 30)}
+    assert repositorio.consultar("SELECT COUNT(*) FROM productos", uno=True)[0] == 3
+
+def test_exportar_ventas(repositorio, tmp_path):
+    prod_id = repositorio.crear_producto("EXP-0001", "Exportable", 1000, 10)
+    ahora = datetime.now().replace(microsecond=0)
+    repositorio.registrar_ventas([(f"clave-{i}", ahora, "caja", "Boleta", None, None, [(prod_id, i, 1000, i * 1000)], []) for i in (1, 2)])
+    ruta = str(tmp_path / "ventas.csv")
+    assert bazar.exportar_ventas_csv(ruta, ahora.date(), ahora.date()) == 2
+    with open(ruta, newline="", encoding="utf-8-sig") as archivo: filas = list(csv.reader(archivo, delimiter=bazar.CSV_DELIMITADOR))
+    assert tuple(filas[0]) == bazar.COLUMNAS_EXPORTACION_VENTAS
+    lineas = [dict(zip(filas[0], fila)) for fila in filas[1:]]
+    assert [(fila["codigo"], fila["cantidad"], fila["vendedor"]) for fila in lineas] == [("EXP-0001", "1", "caja"), ("EXP-0001", "2", "caja")]
@@ -0,0 +1,42 @@
+"""Búsqueda del Punto de Venta (IndiceBusqueda) frente a cambios del catálogo entre una pulsación y la siguiente."""
+import pytest
+
+import bazar
+
+
+@pytest.fixture
+def indice(repositorio):
+    for codigo, nombre, precio, stock in [("BEB-1", "Bebida cola", 1000, 10), ("BEB-2", "Bebida naranja", 900, 5), ("PAN-1", "Pan amasado", 200, 30)]:
+        repositorio.crear_producto(codigo, nombre, precio, stock)
+    bazar.catalogo.revalidar(forzar=True)
+    indice = bazar.IndiceBusqueda(bazar.catalogo); indice.construir()
+    return indice
+
+def nombres(indice, consulta): return [p.nombre for p in indice.buscar(consulta)[0]]
+
+def test_busqueda_tras_cambio_de_nombre(indice):
+    assert nombres(indice, "bebi") == ["Bebida cola", "Bebida naranja"]
+    bazar.catalogo.actualizar(2, nombre="Jugo naranja")
+    assert nombres(indice, "bebid") == ["Bebida cola"]
+    assert nombres(indice, "jugo") == ["Jugo naranja"]
+
+def test_busqueda_tras_producto_nuevo(indice):
+    assert nombres(indice, "bebi") == ["Bebida cola", "Bebida naranja"]
+    bazar.catalogo.actualizar(4, codigo="BEB-3", nombre="Bebida limón", precio=800, stock=3)
+    assert nombres(indice, "bebid") == ["Bebida cola", "Bebida limón", "Bebida naranja"]
+
+def test_busqueda_tras_cambio_de_otra_caja(indice, repositorio):
+    assert nombres(indice, "bebi") == ["Bebida cola", "Bebida naranja"]
+    repositorio.actualizar_producto(1, "Gaseosa cola", 1000, 10)
+    bazar.catalogo.revalidar(forzar=True)
+    assert nombres(indice, "bebid") == ["Bebida naranja"]
+    assert nombres(indice, "gaseo") == ["Gaseosa cola"]
+
+def test_busqueda_tras_recarga_completa(indice, repositorio):
+    assert nombres(indice, "pan a") == ["Pan amasado"]
+    # Como una purga que se llevó cambios que este catálogo no alcanzó a ver: revalidar recarga el catálogo entero
+    repositorio.actualizar_producto(3, "Pan amasado", 250, 30); repositorio.escribir("DELETE FROM cambios_productos")
+    repositorio.actualizar_producto(2, "Bebida naranja", 950, 5)
+    assert sorted(bazar.catalogo.revalidar(forzar=True)) == [1, 2, 3]
+    assert nombres(indice, "pan am") == ["Pan amasado"]
+    assert nombres(indice, "naran") == ["Bebida naranja"]
@@ -0,0 +1,76 @@
+"""Contrato del repositorio, igual en los dos backends locales (SQLite y, si hay un servidor, MySQL)."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import bazar
+
+
+def venta(clave, producto_id, cantidad=1, precio=1000):
+    return (clave, datetime.now().replace(microsecond=0), "caja", "Boleta", None, None, [(producto_id, cantidad, precio, cantidad * precio)], [])
+
+def catalogo_por_id(filas): return {fila[0]: fila for fila in filas}
+
+def test_migraciones_aplicadas(repositorio_bd):
+    migraciones = bazar.MIGRACIONES_SQLITE if repositorio_bd.nombre == "sqlite" else bazar.MIGRACIONES
+    versiones = [fila[0] for fila in repositorio_bd.consultar("SELECT version FROM schema_version ORDER BY version")]
+    assert versiones == [numero for numero, _, _ in migraciones]
+    assert repositorio_bd.iniciar() == migraciones[-1][0] # Una base al día no vuelve a migrar
+
+def test_crear_actualizar_y_archivar_producto(repositorio_bd):
+    prod_id = repositorio_bd.crear_producto("REP-1", "Producto", 1000, 5)
+    marca, filas, completas = repositorio_bd.revisar_cambios(None)
+    assert completas and catalogo_por_id(filas)[prod_id][1:6] == ("REP-1", "Producto", 1000, 5, "activo")
+    repositorio_bd.actualizar_producto(prod_id, "Producto nuevo", 1200, 7)
+    marca, filas, completas = repositorio_bd.revisar_cambios(marca)
+    assert not completas and catalogo_por_id(filas)[prod_id][2:5] == ("Producto nuevo", 1200, 7)
+    repositorio_bd.archivar_producto(prod_id)
+    _, filas, _ = repositorio_bd.revisar_cambios(marca)
+    assert catalogo_por_id(filas)[prod_id][5] == "inactivo"
+
+def test_registrar_ventas_idempotente_por_clave(repositorio_bd):
+    prod_id = repositorio_bd.crear_producto("REP-2", "Producto", 1000, 5)
+    (_, boleta_id, motivo), = repositorio_bd.registrar_ventas([venta("clave-1", prod_id, 2)])
+    assert boleta_id is not None and motivo is None
+    assert repositorio_bd.registrar_ventas([venta("clave-1", prod_id, 2)]) == [("clave-1", boleta_id, None)] # Reenvío tras perder la respuesta
+    assert repositorio_bd.consultar("SELECT stock FROM productos WHERE id = %s", (prod_id,), uno=True)[0] == 3
+    assert repositorio_bd.consultar("SELECT COUNT(*) FROM boletas", uno=True)[0] == 1
+
+def test_reservar_stock_entre_cajas(repositorio_bd):
+    prod_id = repositorio_bd.crear_producto("REP-3", "Producto", 1000, 5)
+    reserva_id, stock, reservado = repositorio_bd.reservar_stock(prod_id, 2, "caja-1")
+    assert (stock, reservado) == (5, 2)
+    with pytest.raises(bazar.StockInsuficienteError): repositorio_bd.reservar_stock(prod_id, 4, "caja-2")
+    otra_id, _, reservado = repositorio_bd.reservar_stock(prod_id, 3, "caja-2")
+    assert reservado == 5
+    reserva_id, _, reservado = repositorio_bd.reservar_stock(prod_id, 1, "caja-1", reemplaza=reserva_id) # Bajar la propia nunca falla
+    assert reservado == 4
+    repositorio_bd.liberar_reservas([reserva_id, otra_id])
+    assert repositorio_bd.consultar("SELECT COUNT(*) FROM reservas_stock", uno=True)[0] == 0
+
+def test_renovar_reservas_no_revive_las_vencidas(repositorio_bd):
+    prod_id = repositorio_bd.crear_producto("REP-4", "Producto", 1000, 5)
+    vigente, _, _ = repositorio_bd.reservar_stock(prod_id, 1, "caja")
+    vencida, _, _ = repositorio_bd.reservar_stock(prod_id, 1, "caja")
+    casi = datetime.now().replace(microsecond=0) + timedelta(seconds=5); pasada = datetime.now().replace(microsecond=0) - timedelta(minutes=1)
+    repositorio_bd.escribir("UPDATE reservas_stock SET expira_en = %s WHERE id = %s", (casi, vigente))
+    repositorio_bd.escribir("UPDATE reservas_stock SET expira_en = %s WHERE id = %s", (pasada, vencida))
+    repositorio_bd.renovar_reservas([vigente, vencida])
+    expiran = dict(repositorio_bd.consultar("SELECT id, expira_en FROM reservas_stock"))
+    assert expiran[vigente] > casi and expiran[vencida] == pasada
+    assert repositorio_bd.purgar_reservas_vencidas() == 1
+
+def test_registro_de_cambios_y_purga(repositorio_bd):
+    marca_inicial, _, _ = repositorio_bd.revisar_cambios(None)
+    ids = [repositorio_bd.crear_producto(f"CAM-{i}", f"Producto {i}", 1000, 5) for i in range(3)]
+    marca, _, _ = repositorio_bd.revisar_cambios(None)
+    # Cambios de hace dos días: fuera del solape de revalidación y de la retención del registro
+    repositorio_bd.escribir("UPDATE cambios_productos SET cambiado_en = %s", (datetime.now().replace(microsecond=0) - timedelta(days=2),))
+    repositorio_bd.actualizar_producto(ids[1], "Producto cambiado", 1000, 5)
+    nueva_marca, filas, completas = repositorio_bd.revisar_cambios(marca)
+    assert not completas and [fila[0] for fila in filas] == [ids[1]] and nueva_marca > marca
+    repositorio_bd.purgar_cambios()
+    assert repositorio_bd.consultar("SELECT COUNT(*) FROM cambios_productos", uno=True)[0] == 1
+    assert repositorio_bd.revisar_cambios(marca)[2] is False # Esta caja ya había visto todo lo purgado
+    _, filas, completas = repositorio_bd.revisar_cambios(marca_inicial) # Esta no: recarga el catálogo entero
+    assert completas and sorted(fila[0] for fila in filas) == ids
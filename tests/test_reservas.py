@@ -0,0 +1,44 @@
+"""Reservas de stock de una caja contra las de las demás (reservas_stock y ServicioReservas)."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import bazar
+
+
+def interferir(monkeypatch, repositorio, veces):
+    """Otra caja escribe el producto justo después de cada lectura de reservar_stock, las primeras `veces` veces."""
+    original, restantes = bazar.CursorSQLite.execute, [veces]
+    def execute(self, query, params=()):
+        resultado = original(self, query, params)
+        if query.startswith("SELECT p.stock, p.version") and restantes[0]:
+            restantes[0] -= 1; otra = sqlite3.connect(repositorio.pool.config["database"])
+            with otra: otra.execute("UPDATE productos SET version = version + 1")
+            otra.close()
+        return resultado
+    monkeypatch.setattr(bazar.CursorSQLite, "execute", execute)
+
+def cantidad_reservada(repositorio): return repositorio.consultar("SELECT SUM(cantidad) FROM reservas_stock", uno=True)[0]
+
+def test_conflicto_de_version_deja_la_reserva_anterior(repositorio, monkeypatch):
+    producto_id = repositorio.crear_producto("RES-2", "Disputado", 1000, 5)
+    reservas = bazar.ServicioReservas(terminal="caja-1"); reservas.apartar(producto_id, 2)
+    interferir(monkeypatch, repositorio, veces=bazar.CONFIG.reservas.reintentos)
+    with pytest.raises(bazar.ReservaEnConflictoError): reservas.apartar(producto_id, 1)
+    assert reservas.actuales()[producto_id][1] == 2 and cantidad_reservada(repositorio) == 2
+
+def test_conflicto_de_version_se_reintenta(repositorio, monkeypatch):
+    producto_id = repositorio.crear_producto("RES-3", "Disputado", 1000, 5)
+    reservas = bazar.ServicioReservas(terminal="caja-1"); reservas.apartar(producto_id, 2)
+    interferir(monkeypatch, repositorio, veces=1)
+    reservas.apartar(producto_id, 1)
+    assert reservas.actuales()[producto_id][1] == 3 and cantidad_reservada(repositorio) == 3
+
+def test_duracion_de_reserva_con_tope(repositorio):
+    producto_id = repositorio.crear_producto("RES-1", "Reservable", 1000, 5)
+    reserva_id, _, _ = repositorio.reservar_stock(producto_id, 1, "caja", duracion=10 ** 6)
+    limite = datetime.now() + timedelta(seconds=bazar.CONFIG.reservas.duracion + 5)
+    assert repositorio.consultar("SELECT expira_en FROM reservas_stock WHERE id = %s", (reserva_id,), uno=True)[0] <= limite
+    repositorio.renovar_reservas([reserva_id], duracion=10 ** 6)
+    assert repositorio.consultar("SELECT expira_en FROM reservas_stock WHERE id = %s", (reserva_id,), uno=True)[0] <= limite
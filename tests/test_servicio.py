@@ -0,0 +1,46 @@
+"""servicio.py atendiendo cajas remotas: autorización por token y lecturas iguales que comparten una consulta."""
+import threading
+import time
+
+import pytest
+
+import bazar
+import servicio as modulo_servicio
+
+
+@pytest.fixture
+def servicio(repositorio):
+    servicio, url = modulo_servicio.servicio_en_hilo("secreto")
+    servicio.url = url
+    yield servicio
+    modulo_servicio.detener_servicio_en_hilo(servicio)
+
+def test_rechaza_token_invalido(servicio):
+    remoto = bazar.RepositorioRemoto(servicio.url, "otro")
+    with pytest.raises(bazar.ErrorServicio, match="Token"): remoto.revisar_cambios(None)
+    remoto.cerrar()
+    remoto = bazar.RepositorioRemoto(servicio.url, "secreto")
+    assert remoto.revisar_cambios(None)[2] is True
+    remoto.cerrar()
+
+def test_no_expone_administracion_de_usuarios(servicio):
+    remoto = bazar.RepositorioRemoto(servicio.url, "secreto")
+    with pytest.raises(AttributeError): remoto.listar_usuarios
+    with pytest.raises(bazar.ErrorServicio, match="desconocida"): remoto.llamar("repositorio.guardar_usuario", "intruso", "admin", "hash")
+    remoto.cerrar()
+
+def test_lecturas_iguales_comparten_una_consulta(servicio, monkeypatch):
+    liberar, ejecuciones = threading.Event(), []
+    def lenta(): ejecuciones.append(1); liberar.wait(5); return "listo"
+    monkeypatch.setitem(bazar.OPERACIONES_SERVICIO, "pruebas.lenta", (lenta, True))
+    resultados = []
+    def caja():
+        remoto = bazar.RepositorioRemoto(servicio.url, "secreto"); resultados.append(remoto.llamar("pruebas.lenta")); remoto.cerrar()
+    hilos = [threading.Thread(target=caja) for _ in range(2)]
+    for hilo in hilos: hilo.start()
+    limite = time.monotonic() + 5
+    while servicio.contadores["pruebas.lenta"] < 2 and time.monotonic() < limite: time.sleep(0.01) # Las dos peticiones llegaron
+    liberar.set()
+    for hilo in hilos: hilo.join(5)
+    assert resultados == ["listo", "listo"]
+    assert len(ejecuciones) == 1 and servicio.contadores["lecturas_compartidas"] == 1
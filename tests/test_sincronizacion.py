@@ -0,0 +1,54 @@
+"""Ventas anotadas en el diario de una caja al llegar al servidor."""
+import threading
+from datetime import datetime
+
+import pytest
+
+import bazar
+
+
+def venta(clave, producto_id, cantidad=1, precio=1000):
+    return (clave, datetime.now().replace(microsecond=0), "caja", "Boleta", None, None, [(producto_id, cantidad, precio, cantidad * precio)], [])
+
+def test_ultima_unidad_vendida_sin_conexion_en_dos_cajas(repositorio_bd):
+    producto_id = repositorio_bd.crear_producto("ULT-1", "Última unidad", 1000, 1)
+    barrera, resultados = threading.Barrier(2), []
+    def sincronizar(clave): barrera.wait(); resultados.extend(repositorio_bd.registrar_ventas([venta(clave, producto_id)]))
+    hilos = [threading.Thread(target=sincronizar, args=(clave,)) for clave in ("caja-1", "caja-2")]
+    for hilo in hilos: hilo.start()
+    for hilo in hilos: hilo.join()
+    aceptadas = [r for r in resultados if r[1] is not None]; rechazadas = [r for r in resultados if r[1] is None]
+    assert len(aceptadas) == 1 and len(rechazadas) == 1
+    assert "Stock insuficiente" in rechazadas[0][2]
+    assert repositorio_bd.consultar("SELECT stock FROM productos WHERE id = %s", (producto_id,), uno=True)[0] == 0
+    assert repositorio_bd.consultar("SELECT COUNT(*) FROM boletas", uno=True)[0] == 1
+
+def test_venta_rechazada_queda_apartada_hasta_reintentarla(repositorio, tmp_path, monkeypatch):
+    producto_id = repositorio.crear_producto("ULT-2", "Última unidad", 1000, 1)
+    diario = bazar.DiarioVentas(str(tmp_path / "diario.db")); sincronizador = bazar.SincronizadorVentas(diario)
+    for _ in range(2): diario.anotar("caja", [(producto_id, 1, 1000, 1000)])
+    assert sincronizador.sincronizar() == 2
+    assert diario.contar_pendientes() == 0 and diario.contar_rechazadas() == 1
+    (clave, _, _, _, lineas, _, motivo), = diario.rechazadas()
+    assert lineas == [[producto_id, 1, 1000, 1000]] and "Stock insuficiente" in motivo
+    assert sincronizador.sincronizar() == 0 # Una rechazada no se reenvía sola
+
+    # Se repone el stock y se reintenta con el servidor caído: la venta espera en la cola, no vuelve a las rechazadas
+    repositorio.actualizar_producto(producto_id, "Última unidad", 1000, 1); diario.reintentar(clave)
+    monkeypatch.setattr(bazar, "_repositorio", bazar.RepositorioSQLite(str(tmp_path / "sin-servidor" / "bazar.db")))
+    with pytest.raises(bazar.sqlite3.Error): sincronizador.sincronizar()
+    assert diario.contar_pendientes() == 1 and diario.contar_rechazadas() == 0
+
+    monkeypatch.setattr(bazar, "_repositorio", repositorio) # Vuelve la conexión
+    assert sincronizador.sincronizar() == 1
+    assert diario.contar_pendientes() == 0 and diario.contar_rechazadas() == 0
+    assert repositorio.consultar("SELECT COUNT(*) FROM boletas", uno=True)[0] == 2
+    diario.cerrar()
+
+def test_descartar_venta_rechazada(repositorio, tmp_path):
+    producto_id = repositorio.crear_producto("ULT-3", "Sin stock", 1000, 0)
+    diario = bazar.DiarioVentas(str(tmp_path / "diario.db")); clave = diario.anotar("caja", [(producto_id, 1, 1000, 1000)])
+    bazar.SincronizadorVentas(diario).sincronizar()
+    diario.descartar(clave)
+    assert diario.rechazadas() == [] and diario.contar_pendientes() == 0
+    diario.cerrar()
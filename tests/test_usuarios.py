@@ -0,0 +1,11 @@
+"""Ingreso de usuarios: verificación de la clave y actualización del hash bcrypt."""
+import bazar
+
+
+def test_ingreso_actualiza_hash_de_otro_costo(repositorio):
+    repositorio.guardar_usuario("cajera", "vendedor", bazar.hashear_clave("secreta", costo=5))
+    assert bazar.verificar_credenciales("cajera", "otra") is None
+    assert bazar.costo_hash(repositorio.buscar_usuario("cajera")[0]) == 5
+    assert bazar.verificar_credenciales("cajera", "secreta") == "vendedor"
+    assert bazar.costo_hash(repositorio.buscar_usuario("cajera")[0]) == bazar.BCRYPT_COSTO
+    assert bazar.verificar_credenciales("cajera", "secreta") == "vendedor"